@@ -0,0 +1,101 @@
+"""
+Animated sprites for the poke clock
+Plays the short animations made by imageresizer.ConvertAnimation from GIFs
+or sprite sheets. The file holds a keyframe and then, for each frame, just
+the runs of pixels that differ from the frame before, so playing one is a
+small read from flash and a few pixel writes into a single RAM Bitmap per
+frame, whatever the frame count.
+
+Written by Trevor Craig
+
+"""
+import struct
+
+try:
+    from bitmaptools import arrayblit
+except ImportError:
+    arrayblit = None
+
+# File layout (little-endian): header, palette (colors x R, G, B), keyframe
+# (width * height palette indices, row by row), then a record per frame:
+# RECORD followed by runs of (offset H, length B, length indices), offset
+# counting pixels from the top left. Record i turns frame i into frame i+1
+# and the last one turns the last frame back into the first.
+MAGIC = b'PKA1'
+HEADER = '<4sBBHHHH' # magic, width, height, frames, colors, biggest record,
+                     # keyframe delay (ms)
+RECORD = '<HH'       # delay (ms) of the frame it makes, bytes of runs
+HEADER_SIZE = struct.calcsize(HEADER)
+RECORD_SIZE = struct.calcsize(RECORD)
+
+class Animation():
+    """ One animation, opened and on its keyframe. grid is its TileGrid;
+        step() moves it on a frame. The file stays open (frames are read
+        as they're needed) until close().
+    """
+    def __init__(self, path):
+        # Board module, imported here so imageresizer.py can share this
+        # file's format on a desktop without it
+        import displayio
+        self._file = open(path, 'rb')
+        try:
+            (magic, self.width, self.height, self.frames, colors, biggest,
+             delay) = struct.unpack(HEADER, self._file.read(HEADER_SIZE))
+            if magic != MAGIC:
+                raise ValueError('Not an animation: ' + path)
+            table = self._file.read(colors * 3)
+            self.palette = displayio.Palette(colors)
+            for index in range(colors):
+                self.palette[index] = (table[index * 3] << 16 |
+                                       table[index * 3 + 1] << 8 |
+                                       table[index * 3 + 2])
+            self.bitmap = displayio.Bitmap(self.width, self.height, colors)
+            keyframe = self._file.read(self.width * self.height)
+            if arrayblit:
+                arrayblit(self.bitmap, keyframe)
+            else:
+                for index in range(len(keyframe)):
+                    self.bitmap[index] = keyframe[index]
+        except Exception:
+            self._file.close()
+            raise
+        self.grid = displayio.TileGrid(self.bitmap, pixel_shader=self.palette)
+        self.frame = 0
+        self.delay = delay / 1000 # Seconds the current frame shows for
+        self.changed = 0          # Pixels the last step() wrote
+        self._first = self._file.tell() # First record
+        self._record = bytearray(RECORD_SIZE)
+        self._runs = bytearray(biggest) # Every frame's runs are read into
+                                        # this one buffer
+
+    def step(self):
+        """ Draw the next frame into the bitmap. Returns the seconds it
+            should show for.
+        """
+        if self.frames < 2:
+            return self.delay
+        if self.frame == 0: # Round again from the first record
+            self._file.seek(self._first)
+        self._file.readinto(self._record)
+        delay, length = struct.unpack(RECORD, self._record)
+        runs = self._runs
+        if length:
+            self._file.readinto(memoryview(runs)[:length])
+        bitmap = self.bitmap
+        changed = 0
+        index = 0
+        while index < length:
+            offset = runs[index] | runs[index + 1] << 8
+            count = runs[index + 2]
+            index += 3
+            for pixel in range(count):
+                bitmap[offset + pixel] = runs[index + pixel]
+            index += count
+            changed += count
+        self.frame = (self.frame + 1) % self.frames
+        self.delay = delay / 1000
+        self.changed = changed
+        return self.delay
+
+    def close(self):
+        self._file.close()
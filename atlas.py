@@ -0,0 +1,69 @@
+"""
+Sprite atlas for the poke clock
+All the sprites packed into a few big indexed BMP sheets (see PackAtlas in
+imageresizer.py) and shown through a single TileGrid, so changing the
+sprite is just changing the tile index.
+
+Written by Trevor Craig
+
+"""
+import json
+import displayio
+
+class SpriteAtlas():
+    """ Reads the layout written by imageresizer.PackAtlas:
+        sheets    : sheet BMP paths, sprite i is in sheets[i // per_sheet]
+        per_sheet : number of tiles in every sheet (the last may be short)
+        tile      : tile width and height in pixels
+        count     : total number of sprites
+        catalog   : catalog index (catalog.py) of the sprite names, in
+                    tile order
+        Sheets are indexed BMPs so the OnDiskBitmap's own Palette is the
+        pixel_shader, which needs CircuitPython 7 or later.
+    """
+    def __init__(self, path='atlas.json'):
+        with open(path) as layout:
+            layout = json.load(layout)
+        self.sheets = layout['sheets']
+        self.per_sheet = layout['per_sheet']
+        self.tile = layout['tile']
+        self.count = layout['count']
+        self.catalog = layout.get('catalog')
+        self.grid = None
+        self._sheet = None
+        self._file = None
+        self._stale = None
+
+    def __len__(self):
+        return self.count
+
+    def tile_grid(self, index):
+        """ Point the atlas TileGrid at sprite number index and return it.
+            The same TileGrid comes back every time unless the sprite is on
+            a different sheet than the last one, then a TileGrid over the
+            new sheet is made. The old sheet may still be on screen until
+            the caller swaps the new grid in, so its file is only closed on
+            the following call.
+        """
+        if self._stale is not None:
+            self._stale.close()
+            self._stale = None
+        sheet = index // self.per_sheet
+        if sheet != self._sheet:
+            self._stale = self._file
+            self._file = open(self.sheets[sheet], 'rb')
+            bitmap = displayio.OnDiskBitmap(self._file)
+            self.grid = displayio.TileGrid(bitmap,
+                                           pixel_shader=bitmap.pixel_shader,
+                                           tile_width=self.tile,
+                                           tile_height=self.tile)
+            self._sheet = sheet
+        self.grid[0] = index % self.per_sheet
+        return self.grid
+
+    def close(self):
+        """ Close the sheet files. Only call once the grid is off screen. """
+        for sheet_file in (self._stale, self._file):
+            if sheet_file is not None:
+                sheet_file.close()
+        self.grid = self._file = self._stale = self._sheet = None
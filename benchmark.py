@@ -0,0 +1,698 @@
+# Benchmarks for the poke clock, run on the host (python benchmark.py)
+# Times the pieces of the device code we're trying to make faster
+# Written By Trevor Craig
+
+# Libraries
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+from catalog import SpriteCatalog, build_catalog
+import ephemeris
+
+def timeit(func, repeat=2000, runs=3):
+    # Average seconds per call, best of runs runs
+    best=None
+    for _ in range(runs):
+        start=time.perf_counter()
+        for _ in range(repeat):
+            func()
+        elapsed=(time.perf_counter()-start)/repeat
+        if best is None or elapsed<best:
+            best=elapsed
+    return(best)
+
+def report(name, seconds):
+    print(f"  {name:<40} {seconds*1e6:10.2f} us/call")
+
+def bench_catalog():
+    # Sprite selection: directory listing (old getrandom) vs catalog index
+    print("Sprite selection")
+    with tempfile.TemporaryDirectory() as tmp:
+        for inputdir in ("edited","pokemon/edited2"):
+            if not os.path.isdir(inputdir):
+                print(f"  {inputdir} missing, skipped")
+                continue
+            def listdir_pick():
+                dir_list=os.listdir(inputdir)
+                return(inputdir+"/"+str(dir_list[random.randint(0, len(dir_list)-1)]))
+            index=os.path.join(tmp,os.path.basename(inputdir)+".idx")
+            count=build_catalog(inputdir,index)
+            catalog=SpriteCatalog(index)
+            def catalog_pick():
+                return(catalog.name(random.randint(0, len(catalog)-1)))
+            report(f"{inputdir} ({count}) os.listdir",timeit(listdir_pick,200))
+            report(f"{inputdir} ({count}) catalog",timeit(catalog_pick))
+            catalog.close()
+
+def bench_ephemeris():
+    # Offline moon data: cost of one position, and of a whole day
+    print("Moon ephemeris")
+    epoch=int(time.time())
+    for (name,func,repeat) in (
+            ("moon_position",lambda: ephemeris.moon_position(epoch),2000),
+            ("phase",lambda: ephemeris.phase(epoch),2000),
+            ("rise_set (one day)",lambda: ephemeris.rise_set(epoch,40.7,-74.0),50)):
+        seconds=timeit(func,repeat)
+        print(f"  {name:<40} {seconds*1e6:10.2f} us/call {1/seconds:10.0f} calls/sec")
+
+def bench_fonts():
+    # Boot-time font loading, BDF parse vs compiled glyph files
+    print("Font loading")
+    import fontcompiler
+    fontcompiler.Benchmark()
+
+def allocated(func, repeat=1000):
+    # Average bytes per call of whatever func keeps hold of (tracemalloc).
+    # CPython frees temporaries at once, so funcs keep their results.
+    import tracemalloc
+    tracemalloc.start()
+    func()
+    start=tracemalloc.get_traced_memory()[0]
+    for _ in range(repeat):
+        func()
+    kept=tracemalloc.get_traced_memory()[0]-start
+    tracemalloc.stop()
+    return(kept/repeat)
+
+def bench_format():
+    # Label text each tick: old string building vs lookup tables + Cached
+    print("Label formatting (one tick: clock, date, countdown; bytes are new")
+    print("strings, as the board's heap would have to collect them)")
+    import utils
+    now=time.struct_time((2024,3,1,21,7,0,4,61,0))
+    strings=[]
+    def old():
+        hour_string=str(now.tm_hour-12)
+        strings.append(hour_string+':'+'{0:0>2}'.format(now.tm_min))
+        strings.append(str(now.tm_mon)+'/'+str(now.tm_mday))
+        minutes=263
+        strings.append(str(minutes//60)+':'+'{0:0>2}'.format(minutes%60))
+    clock=utils.Cached(utils.clock_text)
+    date=utils.Cached(utils.date_text)
+    countdown=utils.Cached(utils.countdown_text)
+    def new():
+        strings.append(clock.text(now.tm_hour*60+now.tm_min))
+        strings.append(date.text(now.tm_mon*32+now.tm_mday))
+        strings.append(countdown.text(263))
+    for (name,func) in (("format/concatenate",old),("tables + Cached, unchanged",new)):
+        seconds=timeit(func)
+        strings.clear()
+        kept=allocated(func)-24 # Less the list's own 3 pointers per call
+        strings.clear()
+        print(f"  {name:<40} {seconds*1e6:10.2f} us/call {kept:8.1f} bytes/call")
+
+def bench_outline():
+    # Moon percentage: four black Labels plus the text Label vs OutlineLabel
+    print("Outlined percentage (new text each call; bytes held by the labels)")
+    import tracemalloc
+    import busdisplay # Blinka's displayio needs this imported first
+    import displayio
+    from adafruit_display_text.label import Label
+    from glyphfont import load_font
+    from outline import OutlineLabel
+    import simulator
+    font=load_font("fonts/helvR10","0123456789:/.%")
+    texts=[f"{tenths//10}.{tenths%10}%" for tenths in range(100,1000,7)]
+    def labels():
+        group=displayio.Group()
+        for _ in range(4):
+            group.append(Label(font,color=0,text="99.9%"))
+        group.append(Label(font,color=0xFFFF00,text="99.9%"))
+        return(group)
+    def outline():
+        group=displayio.Group()
+        group.append(OutlineLabel(font,color=0xFFFF00,text="99.9%"))
+        return(group)
+    for (name,make) in (("5 Labels",labels),("OutlineLabel",outline)):
+        tracemalloc.start()
+        group=make()
+        held=tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        count=iter(range(1<<30))
+        def update():
+            text=texts[next(count)%len(texts)]
+            for label in group:
+                label.text=text
+        seconds=timeit(update,500)
+        print(f"  {name:<40} {seconds*1e6:10.2f} us/call {held:8d} bytes"
+              f" {len(group):3d} elements")
+        # And drawn: layout plus the refresh that repaints it
+        display=simulator.SimDisplay(simulator.VirtualClock(0,0))
+        display.show(group)
+        display.refresh()
+        display.pixels=0
+        def draw():
+            update()
+            display.refresh()
+        seconds=timeit(draw,100)
+        pixels=display.pixels/300
+        print(f"  {name+' + refresh':<40} {seconds*1e6:10.2f} us/call {pixels:8.0f} pixels")
+    print("  (Blinka's bitmaptools.arrayblit is Python pixel by pixel; on the")
+    print("  board it's C, so OutlineLabel's layout is mostly the glyph pass)")
+
+def bench_sampler():
+    # Sprite rotation: randint each tick (old getrandom) vs the shuffle bag
+    print("Sprite rotation over edited.idx (10 rounds of picks)")
+    from sampler import Sampler
+    catalog=SpriteCatalog("edited.idx")
+    count=len(catalog)
+    bag=Sampler(catalog,window=20)
+    for (name,pick) in (("random.randint",lambda: random.randint(0,count-1)),
+                        ("Sampler, window 20",bag.draw)):
+        picks=[pick() for _ in range(10*count)]
+        last={}
+        repeats=0
+        gap=0
+        for (n,index) in enumerate(picks):
+            if n-last.get(index,-99)<=20:
+                repeats+=1
+            gap=max(gap,n-last.get(index,-1))
+            last[index]=n
+        never=count-len(last)
+        seconds=timeit(pick)
+        print(f"  {name:<40} {seconds*1e6:10.2f} us/call {repeats:5d} repeats within 20,"
+              f" longest gap {gap}, {never} never shown")
+    catalog.close()
+
+def bench_preload():
+    # Sprite swap: load on the spot (old update_sprite) vs SpriteLoader,
+    # timing what's left on the critical path (swap + refresh) and the
+    # prepare() done beforehand
+    print("Sprite swap (256-colour sprites; critical path, then prepare)")
+    import busdisplay # Blinka's displayio needs this imported first
+    import displayio
+    from PIL import Image
+    import imageresizer
+    from preload import SpriteLoader
+    from render import Renderer
+    import simulator
+    with tempfile.TemporaryDirectory() as tmp:
+        names=[]
+        for file in sorted(os.listdir("edited"))[:20]:
+            img=imageresizer.Palettize(Image.open("edited/"+file),256)
+            names.append(imageresizer.WriteIndexedBMP(img,tmp+"/"+file) and tmp+"/"+file)
+        display=simulator.SimDisplay(simulator.VirtualClock(0,0))
+        group=displayio.Group()
+        group.append(displayio.TileGrid(displayio.Bitmap(32,32,1),
+                                        pixel_shader=displayio.Palette(1)))
+        display.show(group)
+        render=Renderer(group)
+        count=iter(range(1<<30))
+        def old():
+            name=names[next(count)%len(names)]
+            bitmap=displayio.OnDiskBitmap(open(name,"rb"))
+            render.sprite(0,displayio.TileGrid(bitmap,pixel_shader=bitmap.pixel_shader),name)
+            display.refresh()
+        report("open + OnDiskBitmap + swap + refresh",timeit(old,100))
+        for (name,in_ram) in (("SpriteLoader, flash",False),("SpriteLoader, in RAM",True)):
+            loader=SpriteLoader(render,0,in_ram)
+            def prepare():
+                loader.prepare(names[next(count)%len(names)])
+            def swap():
+                loader.show()
+                display.refresh()
+            best=None
+            for _ in range(3): # Best of 3, as timeit() does
+                total=0
+                for _ in range(100):
+                    prepare()
+                    start=time.perf_counter()
+                    swap()
+                    total+=time.perf_counter()-start
+                if best is None or total<best:
+                    best=total
+            report(name+" swap + refresh",best/100)
+            report(name+" prepare",timeit(prepare,100)) # Each drops the last
+            loader.cancel()
+            loader.close()
+    print("  (host files sit in the page cache, so flash latency doesn't show")
+    print("  here; prepare is the part moved off the swap's critical path)")
+
+def bench_animation():
+    # Animated sprite: a whole new frame each step vs Animation's deltas
+    print("Animation frame (a sprite bobbing 2 pixels, 16 colours)")
+    import busdisplay # Blinka's displayio needs this imported first
+    import displayio
+    from PIL import Image
+    import imageresizer
+    from animation import Animation
+    with tempfile.TemporaryDirectory() as tmp:
+        sprite=Image.open("edited/"+sorted(os.listdir("edited"))[0]).convert("RGBA")
+        frames=[]
+        for dy in (0,-1,-2,-1):
+            frame=Image.new("RGBA",sprite.size)
+            frame.paste(sprite,(0,dy))
+            frames.append(frame)
+        frames[0].save(tmp+"/bob.gif",save_all=True,append_images=frames[1:],
+                       duration=100,loop=0,disposal=2)
+        size=imageresizer.ConvertAnimation(tmp+"/bob.gif",tmp+"/bob.anm")
+        animation=Animation(tmp+"/bob.anm")
+        bitmap=displayio.Bitmap(32,32,16)
+        whole=bytes(32*32)
+        def frame():
+            for index in range(len(whole)):
+                bitmap[index]=whole[index]
+        changed=[]
+        def step():
+            animation.step()
+            changed.append(animation.changed)
+        report(f"whole frame ({32*32} pixels)",timeit(frame,100))
+        report(f"Animation.step ({(size-animation._first)//animation.frames} bytes/frame)",
+               timeit(step,100))
+        print(f"  {sum(changed)/len(changed):.0f} pixels written per step, "
+              f"{size} bytes for {animation.frames} frames")
+        animation.close()
+
+def bench_resize():
+    # Sprite conversion, 16 colours: per-file PIL (BatchConvert's
+    # ResizeImage, one process) vs the batched NumPy path
+    print("Sprite conversion of pokemon/orginal2 (16 colours; PSNR is of the")
+    print("quantized sprite against the same crop before quantizing)")
+    import numpy
+    import imageresizer
+    inputdir="pokemon/orginal2"
+    if not os.path.isdir(inputdir):
+        print(f"  {inputdir} missing, skipped")
+        return
+    files=[file for file in sorted(os.listdir(inputdir)) if os.path.isfile(inputdir+"/"+file)]
+    with tempfile.TemporaryDirectory() as tmp:
+        start=time.perf_counter()
+        images=[imageresizer.ResizeImage(inputdir+"/"+file,tmp+"/"+imageresizer.GetNewFileName(file),16)
+                for file in files]
+        elapsed=time.perf_counter()-start
+        psnr=[imageresizer.Quality(inputdir+"/"+file,img) for (file,img) in zip(files,images)]
+        psnr=[value for value in psnr if value!=float("inf")]
+        print(f"  {'PIL, file by file':<40} {elapsed:8.2f} s {len(files)/elapsed:8.1f} files/sec"
+              f"  PSNR {sum(psnr)/len(psnr):.1f} dB")
+        (converted,failures,times)=imageresizer.VectorConvert(inputdir,tmp+"/vector",16)
+        elapsed=sum(times.values())
+        print(f"  {'NumPy, batched':<40} {elapsed:8.2f} s {converted/elapsed:8.1f} files/sec")
+        for (stage,seconds) in times.items():
+            print(f"    {stage:<38} {seconds:8.2f} s")
+    # Quality of the batched quantizer, and what the fixed crop cut off
+    (batch,loaded,_)=imageresizer.LoadBatch([inputdir+"/"+file for file in files])
+    boxes=imageresizer.BoundingBoxes(batch)
+    rgb=imageresizer.FlattenBatch(imageresizer.ResizeBatch(batch,imageresizer.SquareBoxes(boxes)))
+    (indices,palettes)=imageresizer.QuantizeBatch(rgb,16)
+    count=len(rgb)
+    quantized=palettes[numpy.arange(count)[:,None,None],indices].astype(numpy.float32)
+    mse=((quantized-rgb)**2).mean(axis=(1,2,3))
+    psnr=10*numpy.log10(255*255/mse[mse>0])
+    # PIL's median cut on the same crops, for a like-for-like quantizer
+    from PIL import Image
+    pil=[]
+    for image in rgb:
+        img=Image.fromarray(image.round().astype(numpy.uint8))
+        quantized=numpy.asarray(imageresizer.Palettize(img,16).convert("RGB"),numpy.float32)
+        pil.append(((quantized-image)**2).mean())
+    pil=numpy.array(pil)
+    pil=10*numpy.log10(255*255/pil[pil>0])
+    (height,width)=batch.shape[1:3]
+    clipped=((boxes[:,0]<imageresizer.WADJ)|(boxes[:,1]<imageresizer.HADJ)|
+             (boxes[:,2]>width-imageresizer.WADJ)).sum()
+    print(f"  On the bounding box crops: k-means PSNR {psnr.mean():.1f} dB, "
+          f"PIL median cut {pil.mean():.1f} dB")
+    print(f"  The fixed {imageresizer.WADJ}/{imageresizer.HADJ} px crop cut into {clipped} of {count} sprites")
+    print("  (BatchConvert spreads the PIL path over every core, this is one)")
+
+def bench_rgb565():
+    # Sprites as 32-bit BMPs converted on the board vs RGB565 files written
+    # by imageresizer: size, read_bitmap time, and how close what the
+    # panel shows is to the source (PSNR, and after a 1 px blur, roughly
+    # what the eye sees of a dithered LED panel from across the room)
+    print("RGB565 sprites (40 sprites from pokemon/orginal2)")
+    import busdisplay # Blinka's displayio needs this imported first
+    from PIL import Image, ImageChops, ImageFilter, ImageStat
+    import imageresizer
+    from preload import read_bitmap
+    inputdir="pokemon/orginal2"
+    files=[file for file in sorted(os.listdir(inputdir)) if file.endswith(".png")][:40]
+    sources=[imageresizer.Flatten(imageresizer.CropResize(inputdir+"/"+file)) for file in files]
+    def psnr(a,b):
+        mse=sum(rms*rms for rms in ImageStat.Stat(ImageChops.difference(a,b)).rms)/3
+        return(10*math.log10(255*255/max(mse,1e-9)))
+    def panel(img,bitplanes):
+        # What the matrix lights for an RGB565 image expanded to 8 bits (as
+        # PIL reads the files, or ColorConverter cuts 24-bit colour): the
+        # top bits of each field, full scale at all ones
+        keep=imageresizer.ChannelBits(bitplanes)
+        bands=[band.point(lambda v,k=k,f=f: round((v>>(8-f)>>(f-k))*255/((1<<k)-1)))
+               for (band,k,f) in zip(img.split(),keep,(5,6,5))]
+        return(Image.merge("RGB",bands))
+    with tempfile.TemporaryDirectory() as tmp:
+        sizes={"32-bit":0,"RGB565":0}
+        for (file,img) in zip(files,sources):
+            img.convert("RGBA").save(tmp+"/"+file+".32.bmp")
+            sizes["32-bit"]+=os.path.getsize(tmp+"/"+file+".32.bmp")
+            sizes["RGB565"]+=imageresizer.WriteRGB565BMP(img,tmp+"/"+file+".16.bmp")
+        for (name,suffix) in (("32-bit",".32.bmp"),("RGB565",".16.bmp")):
+            count=iter(range(1<<30))
+            def load():
+                read_bitmap(tmp+"/"+files[next(count)%len(files)]+suffix)
+            print(f"  {name+' read_bitmap':<40} {timeit(load,20)*1e3:10.2f} ms/sprite"
+                  f" {sizes[name]//len(files):6d} bytes/sprite")
+    print("  (32-bit files are converted a pixel at a time in Python on the board")
+    print("  too; RGB565 is one bitmaptools.readinto, which is C there but Python")
+    print("  in Blinka, so the host times don't show the difference)")
+    for bitplanes in (6,4):
+        print(f"  {bitplanes} bitplanes{'':<22} PSNR     blurred")
+        for (name,convert) in (
+                ("board ColorConverter (truncates)",lambda img: panel(img,bitplanes)),
+                ("RGB565 rounded",lambda img: panel(Rendered(img,bitplanes,False),bitplanes)),
+                ("RGB565 Bayer dithered",lambda img: panel(Rendered(img,bitplanes,True),bitplanes))):
+            plain=blurred=0
+            for img in sources:
+                shown=convert(img)
+                plain+=psnr(img,shown)
+                blurred+=psnr(img.filter(ImageFilter.GaussianBlur(1)),
+                              shown.filter(ImageFilter.GaussianBlur(1)))
+            print(f"    {name:<38} {plain/len(sources):5.1f} dB {blurred/len(sources):5.1f} dB")
+
+def Rendered(img,bitplanes,dither):
+    # An RGB565Rows sprite back as an RGB image, top row first
+    import imageresizer
+    from PIL import Image
+    (w, h) = img.size
+    rows=list(imageresizer.RGB565Rows(img,bitplanes,dither))[::-1]
+    pixels=bytearray()
+    for row in rows:
+        for x in range(w):
+            value=row[x*2]|row[x*2+1]<<8
+            pixels+=bytes((value>>11,(value>>5)&63,value&31))
+    # Fields to 8 bits by repeating their top bits, as PIL does reading them
+    bands=[band.point(lambda v,f=f: v<<(8-f)|v>>(2*f-8))
+           for (band,f) in zip(Image.frombytes("RGB",(w,h),bytes(pixels)).split(),(5,6,5))]
+    return(Image.merge("RGB",bands))
+
+# The regression suite: small pieces of the device code timed on fixed
+# data, compared with checked-in baselines. Times are kept in units of a
+# fixed calibration loop, timed alongside each case, so a faster or slower
+# machine (or a busy one) doesn't read as a change in the code. Each case
+# counts its fastest of RUNS timings, and baselines are the median of
+# SAVE_RUNS whole suites, so neither a slow nor a lucky run sets them.
+FIXTURES="benchmark.fixtures.json"
+BASELINES="benchmark.baselines.json"
+TOLERANCE=0.30 # Slower than the baseline by more than this fails --check
+RUNS=7         # Timings per case (and of the calibration loop beside it)
+SAVE_RUNS=5    # Suites --save-baselines takes the median of
+
+def write_fixtures(path=FIXTURES):
+    # Synthetic MET Norway responses from stubserver.MoonDay (30 days at
+    # two offsets, days without a rise or set included) -- not recorded
+    # ones, just the same shape -- plus worldtimeapi datetimes, so the
+    # suite's inputs never change between runs
+    import stubserver
+    met=[stubserver.MetResponse({"date":["2024-03-01"],"offset":[offset],"days":["30"],
+                                 "lat":["40.7"],"lon":["-74.0"]})["location"]
+         for offset in ("-05:00","+01:00")]
+    datetimes=["2024-03-01T21:07:33.123456-05:00","2024-07-14T06:30:00.000001+01:00",
+               "2024-12-31T23:59:59+00:00"]
+    with open(path,"w") as fixtures:
+        json.dump({"met":met,"datetimes":datetimes},fixtures,indent=1)
+    print(f"Fixtures written to {path}")
+
+def calibration():
+    # A fixed bit of plain Python (splits, ints, sums): seconds per call is
+    # the suite's unit of time
+    text="2024-03-01T21:07:33-05:00"
+    def work():
+        total=0
+        for part in text.split("T")[0].split("-"):
+            total+=int(part)
+        return(total*3.5)
+    return(work)
+
+def suite_cases(fixtures):
+    # (name, function, calls per timing) for each piece of the suite
+    import utils
+    met=fixtures["met"][0]
+    times=[entry["moonphase"]["time"] for entry in met["time"]]
+    times+=[entry[name]["time"] for entry in met["time"]
+            for name in ("moonrise","moonset") if name in entry]
+    datetimes=fixtures["datetimes"]
+    structs=[time.localtime(86400*day+3600*hour) for day in range(30) for hour in range(24)]
+    # Two PokeData filled from the fixtures, today and tomorrow, and every
+    # minute of today to look things up at
+    days=[]
+    for day in range(len(met["time"])):
+        data=utils.PokeData(time.localtime(),0,"-05:00",40.7,-74.0,None)
+        data.load(met,day)
+        days.append(data)
+    periods=[(days[day],days[day+1]) for day in range(len(days)-1)]
+    moments=[(period,period[0].midnight+minute*60) for period in periods
+             for minute in range(0,24*60,7)]
+    count=iter(range(1<<30))
+    def pick(items):
+        return(items[next(count)%len(items)])
+    when=time.localtime()
+    return([
+        ("parse_time (MET)",lambda: utils.parse_time(pick(times)),5000),
+        ("parse_time (worldtimeapi)",lambda: utils.parse_time(pick(datetimes)),5000),
+        ("hh_mm",lambda: utils.hh_mm(pick(structs)),20000),
+        ("PokeData() (url)",lambda: utils.PokeData(when,0,"-05:00",40.7,-74.0,None),2000),
+        ("PokeData() + 24 hours",lambda: utils.PokeData(when,24,"-05:00",40.7,-74.0,None),2000),
+        ("PokeData.load",lambda: days[0].load(met,next(count)%len(met["time"])),2000),
+        ("moon_age + percent_lit",
+         lambda: utils.percent_lit(utils.moon_age(*pick(moments))),10000),
+        ("next_event",lambda: utils.next_event(*pick(moments),False),10000),
+    ])
+
+def time_case(func, repeat, unit):
+    # Units per call of func: its fastest of RUNS timings over the fastest
+    # of the calibration loop's, taken in turn so both see the same machine
+    best=calls=None
+    for _ in range(RUNS):
+        seconds=timeit(func,repeat,1)
+        calibrated=timeit(unit,20000,1)
+        best=seconds if best is None else min(best,seconds)
+        calls=calibrated if calls is None else min(calls,calibrated)
+    return(best,best/calls)
+
+def run_suite(check=False, save=False):
+    # Time the suite; with check, compare with BASELINES and return False
+    # if anything got slower than TOLERANCE allows; with save, make the
+    # median of SAVE_RUNS suites the new baselines
+    with open(FIXTURES) as fixtures:
+        fixtures=json.load(fixtures)
+    unit=calibration()
+    cases=suite_cases(fixtures)
+    print(f"Suite (units of a calibration loop, best of {RUNS} timings)")
+    baselines={}
+    if check:
+        with open(BASELINES) as baseline_file:
+            baselines=json.load(baseline_file)["units"]
+    passed=True
+    runs={name:[] for (name,func,repeat) in cases}
+    for _ in range(SAVE_RUNS if save else 1):
+        for (name,func,repeat) in cases:
+            (seconds,units)=time_case(func,repeat,unit)
+            for _ in range(2): # Looks slower: time it again, it may be noise
+                if name not in baselines or units<=baselines[name]*(1+TOLERANCE):
+                    break
+                (seconds,units)=min((seconds,units),time_case(func,repeat,unit),
+                                    key=lambda timing: timing[1])
+            runs[name].append(units)
+            line=f"  {name:<40} {seconds*1e6:10.2f} us/call {units:8.2f} units"
+            if name in baselines:
+                change=units/baselines[name]-1
+                slower=change>TOLERANCE
+                passed=passed and not slower
+                line+=f" {change*100:+6.1f}% {'REGRESSION' if slower else 'ok'}"
+            print(line)
+    if save:
+        results={name:round(sorted(units)[len(units)//2],3)
+                 for (name,units) in runs.items()}
+        with open(BASELINES,"w") as baseline_file:
+            json.dump({"tolerance":TOLERANCE,"units":results},baseline_file,indent=1)
+        print(f"Baselines (median of {SAVE_RUNS} runs) written to {BASELINES}")
+    return(passed)
+
+def bench_suite():
+    run_suite()
+
+def bench_loop():
+    # The real code.py main loop on the simulator, a virtual day of it
+    print("Main loop (simulator.py)")
+    import contextlib
+    import io
+    import simulator
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        simulator.Benchmark("code.py",24)
+    print("\n".join(line for line in output.getvalue().splitlines()
+                    if line.startswith(("code.py:","  "))))
+
+def bench_http():
+    # Fetches against stubserver.py: a new connection and whole-document
+    # parse each time (Network.fetch_data, as before) vs httpclient.py.
+    # An hour's traffic, overdone so it shows: every 5 minutes a time
+    # sync, an IP geolocation (same URL each time, so 304s once it's
+    # repeated) and a moon query (a new date each time, as on the board,
+    # so never a 304 and nothing kept for it).
+    print("HTTP fetches (stubserver.py, 12 each of time sync, geolocation, moon query)")
+    import tracemalloc
+    import stubserver
+    from httpclient import HttpClient
+    moon="https://api.met.no/weatherapi/sunrise/2.0/.json?lat=40.7&lon=-74.0&date=2024-03-{:02d}&offset=-05:00&days=7"
+    clock="http://worldtimeapi.org/api/ip"
+    where="http://www.geoplugin.net/json.gp"
+    for (name,make) in (("new connection each",stubserver.HostNetwork),
+                        ("httpclient",lambda url: HttpClient(stubserver.HostSession(url)))):
+        with stubserver.StubServer(utc_offset="-05:00") as server:
+            network=make(server.url)
+            start=time.perf_counter()
+            for day in range(1,13):
+                network.fetch_data(clock,json_path=[["datetime"],["dst"],["utc_offset"]])
+                network.fetch_data(where,json_path=[["geoplugin_latitude"],["geoplugin_longitude"]])
+                network.fetch_data(moon.format(day),json_path=[["location"]])
+            elapsed=time.perf_counter()-start
+            (handshakes,sent)=(server.connections,server.sent)
+            tracemalloc.start()
+            network.fetch_data(moon.format(13),json_path=[["location"]])
+            peak=tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"  {name:<20} {handshakes:3d} handshakes {sent:7d} bytes "
+                  f"{elapsed/36*1000:6.2f} ms/fetch, moon fetch peak {peak/1024:5.1f} KiB")
+            if hasattr(network,"_validators"):
+                print(f"  {'':<20} values kept for {len(network._validators)} URL(s)")
+
+def bench_met():
+    # A 30-day MET Norway response (benchmark.fixtures.json, synthetic
+    # from stubserver.py) to moon data: whole body read and parsed, then
+    # PokeData.load() per day (as before) vs streamed through PathScanner
+    # keeping MOON_PATHS only
+    print("MET Norway response to moon data (30 days, stubserver.py)")
+    import tracemalloc
+    import utils
+    from httpclient import PathScanner
+    with open(FIXTURES) as fixtures:
+        met=json.load(fixtures)["met"][0]
+    body=json.dumps({"location":met,"meta":{"licenseurl":"https://api.met.no/license_data.html"}}).encode()
+    def whole():
+        location=json.loads(bytes(body))["location"] # Body arrives whole
+        day=utils.PokeData(time.localtime(),0,"",0,0,None)
+        days=[]
+        for index in range(len(location["time"])):
+            day.load(location,index)
+            days.append((day.age,day.midnight,day.rise,day.set))
+        return(days)
+    def streamed():
+        scanner=PathScanner(utils.MOON_PATHS)
+        for start in range(0,len(body),256): # Socket reads
+            scanner.feed(body[start:start+256])
+        return([utils.moon_day(*row) for row in zip(*scanner.finish()) if row[0] is not None])
+    assert whole()==streamed()
+    for (name,func) in (("whole document",whole),("PathScanner",streamed)):
+        tracemalloc.start()
+        func()
+        peak=tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"  {name:<20} {timeit(func,20)*1000:8.2f} ms {peak/1024:7.1f} KiB peak "
+              f"({len(body)} byte response)")
+
+BOOT='''
+import json,os,sys,tracemalloc,config,simulator
+config.SPRITE_SOURCE=sys.argv[1]
+base=set(sys.modules)
+if sys.argv[2:]==["trace"]:
+    tracemalloc.start()
+clock=simulator.Simulate("code.py",0.001)[0] # Boot and the first frame
+held=tracemalloc.get_traced_memory()[0]
+ours={name[:-3] for name in os.listdir(".") if name.endswith(".py")}
+print(json.dumps([clock.boot,held,sorted(ours&(set(sys.modules)-base))]))
+'''
+
+def bench_boot():
+    # Boot to first frame of each sprite source (engine.py) on the
+    # simulator, each in a fresh interpreter so nothing's imported already
+    print("Boot to first frame (simulator.py, fresh interpreter each)")
+    import statistics
+    import subprocess
+    def boot(source,*trace):
+        result=subprocess.run([sys.executable,"-c",BOOT,source,*trace],
+                              capture_output=True,text=True,check=True)
+        return(json.loads(result.stdout.splitlines()[-1]))
+    sources=["pokemon","splash"]+(["moon"] if os.path.isdir("moon") else [])
+    for source in sources:
+        times=[boot(source)[0] for _ in range(3)]
+        (_,held,modules)=boot(source,"trace")
+        print(f"  {source:<8} {statistics.median(times)*1000:8.1f} ms {held/1024:7.0f} KiB held, "
+              f"{len(modules)} clock modules: {' '.join(modules)}")
+    if "moon" not in sources:
+        print("  (moon needs its moon/moonNN.bmp frames on disk)")
+
+BOOTCACHE='''
+import json,sys,config,simulator
+(config.BOOT_CACHE,start,delta,latency)=(sys.argv[1],*map(float,sys.argv[2:]))
+clock=simulator.Simulate("code.py",0.01,start=start,delta=delta,latency=latency,geolocate=True)[0]
+print(json.dumps([clock.boot,clock.boot_waits,clock.utc,clock.delta]))
+'''
+LATENCY=1.0 # Seconds per query on the board (WiFi co-processor), assumed
+
+def bench_bootcache():
+    # Time to first frame with IP geolocation (no latitude/longitude in
+    # secrets), each query taking LATENCY: a cold boot with no boot cache,
+    # a reset with it (RTC still set) and a power cut (RTC back in 2000)
+    print(f"Time to first frame, boot cache (simulator.py, {LATENCY:.1f} s per query)")
+    import calendar
+    import subprocess
+    import tempfile
+    def boot(path,start,delta):
+        result=subprocess.run([sys.executable,"-c",BOOTCACHE,path,str(start),str(delta),str(LATENCY)],
+                              capture_output=True,text=True,check=True)
+        return(json.loads(result.stdout.splitlines()[-1]))
+    start=calendar.timegm((2024,3,1,12,0,0))
+    with tempfile.TemporaryDirectory(dir=".") as folder: # Board paths are relative
+        path=os.path.join(os.path.basename(folder),"boot.dat")
+        cold=boot(path,start,calendar.timegm((2000,1,1,0,0,0))-start)
+        (utc,delta)=cold[2:]
+        runs=(("cold",cold),
+              ("reset",boot(path,utc+600,delta)),
+              ("power cut",boot(path,utc+600,calendar.timegm((2000,1,1,0,0,0))-utc-600)))
+    for (name,(cpu,waits,_,_)) in runs:
+        print(f"  {name:<10} {(cpu+(waits or 0))*1000:8.0f} ms ({cpu*1000:6.1f} ms CPU, "
+              f"{round((waits or 0)/LATENCY)} queries)")
+
+BENCHMARKS={
+    "catalog": bench_catalog,
+    "ephemeris": bench_ephemeris,
+    "fonts": bench_fonts,
+    "format": bench_format,
+    "outline": bench_outline,
+    "sampler": bench_sampler,
+    "preload": bench_preload,
+    "animation": bench_animation,
+    "resize": bench_resize,
+    "rgb565": bench_rgb565,
+    "http": bench_http,
+    "met": bench_met,
+    "suite": bench_suite,
+    "boot": bench_boot,
+    "bootcache": bench_bootcache,
+    "loop": bench_loop,
+}
+
+if __name__ == "__main__":
+    parser=argparse.ArgumentParser(description="Benchmarks for the poke clock")
+    parser.add_argument("names",nargs="*",
+                        help=f"benchmarks to run: {', '.join(BENCHMARKS)} (default all)")
+    parser.add_argument("--check",action="store_true",
+                        help=f"run the suite against {BASELINES}, exit 1 on a regression")
+    parser.add_argument("--save-baselines",action="store_true",
+                        help=f"run the suite and keep its times in {BASELINES}")
+    parser.add_argument("--write-fixtures",action="store_true",
+                        help=f"rewrite {FIXTURES} from stubserver.py")
+    args=parser.parse_args()
+    for name in args.names:
+        if name not in BENCHMARKS:
+            parser.error(f"no benchmark {name}")
+    if args.write_fixtures:
+        write_fixtures()
+    if args.check or args.save_baselines:
+        sys.exit(0 if run_suite(args.check,args.save_baselines) else 1)
+    for name in args.names or list(BENCHMARKS):
+        BENCHMARKS[name]()
@@ -0,0 +1,21 @@
+"""
+Boot setup for the poke clock
+Makes the CIRCUITPY drive writable from code so the clock can keep its
+caches (MOON_CACHE, SPRITE_STATE, BOOT_CACHE in config.py) on flash. Only
+one side can write at a time: while code can, the drive is read-only over
+USB. Hold the UP button while the board resets to leave USB writable
+(to copy on new files); the caches just aren't saved on that boot.
+
+Written by Trevor Craig
+
+"""
+# pylint: disable=import-error
+import board
+import digitalio
+import storage
+
+button = digitalio.DigitalInOut(board.BUTTON_UP)
+button.switch_to_input(pull=digitalio.Pull.UP)
+# Pulled up, so False only while it's held: code gets the drive unless so
+storage.remount('/', readonly=not button.value)
+button.deinit()
@@ -0,0 +1,135 @@
+"""
+Boot state cache for the poke clock
+Remembers what the last boot had to ask the network for -- where the
+clock is (IP geolocation), its UTC offset and when the RTC was last set
+from the time server -- in a small file on the board. While that's still
+good, the next boot can put the right time up straight away and check it
+in the background instead of waiting on two queries first.
+
+Written by Trevor Craig
+
+"""
+import struct
+
+# File layout (little-endian), one fixed-size record. Latitude and
+# longitude are kept as the text geoplugin sent, so a cached boot queries
+# MET Norway (and matches MOON_CACHE) exactly as the boot that fetched them
+# did. Times are RTC (local) epoch seconds, 0 for never.
+MAGIC = b'PKB1'
+RECORD = '<4s12s12sI6sI40s' # magic, latitude, longitude, geolocated at,
+                            # UTC offset '+HH:MM', synced at, time zone
+RECORD_SIZE = struct.calcsize(RECORD)
+
+def _text(field):
+    return field.rstrip(b'\0').decode('ascii')
+
+def _offset(text):
+    """ True for a UTC offset like '-05:00'. """
+    return (len(text) == 6 and text[0] in '+-' and text[3] == ':' and
+            text[1:3].isdigit() and text[4:].isdigit() and
+            int(text[1:3]) <= 14 and int(text[4:]) < 60)
+
+class BootCache():
+    """ Last IP geolocation and time sync, each good for its own time to
+        live. timezone is secrets.py's (None for IP geolocation); a sync
+        made for another time zone isn't used. Anything missing, stale or
+        out of range reads as not cached. Saving needs the filesystem
+        writable from code (boot.py storage.remount); if it isn't, every
+        boot is a cold one, as before.
+    """
+    def __init__(self, path, timezone, location_ttl, time_ttl):
+        self.path = path
+        self.timezone = timezone or ''
+        self.location_ttl = location_ttl
+        self.time_ttl = time_ttl
+        self.latitude = self.longitude = None
+        self.located = 0
+        self.utc_offset = None
+        self.synced = 0
+        self.changed = False # Anything new to save
+        if not path:
+            return
+        try:
+            with open(path, 'rb') as cache:
+                data = cache.read(RECORD_SIZE + 1)
+        except OSError:
+            return # No cache yet
+        if len(data) != RECORD_SIZE:
+            return
+        (magic, latitude, longitude, located, utc_offset, synced,
+         timezone) = struct.unpack(RECORD, data)
+        if magic != MAGIC:
+            return
+        try:
+            latitude, longitude = _text(latitude), _text(longitude)
+            if (located and -90 <= float(latitude) <= 90 and
+                    -180 <= float(longitude) <= 180):
+                self.latitude, self.longitude = latitude, longitude
+                self.located = located
+            utc_offset = _text(utc_offset)
+            if synced and _offset(utc_offset) and \
+                    _text(timezone) == self.timezone:
+                self.utc_offset = utc_offset
+                self.synced = synced
+        except (UnicodeError, ValueError):
+            pass # Garbled, leave whatever's not set uncached
+
+    def location(self, now):
+        """ (latitude, longitude) text from the last IP geolocation if
+            that was less than location_ttl ago, else None. An RTC that's
+            lost its time reads as before the geolocation; the place is
+            still the likeliest one, so that's returned too (see stale()).
+        """
+        if self.latitude is not None and \
+                now - self.located < self.location_ttl:
+            return self.latitude, self.longitude
+        return None
+
+    def stale(self, now):
+        """ True once the geolocation is half way through location_ttl, or
+            its age can't be told: time to look again in the background.
+        """
+        return not 0 <= now - self.located < self.location_ttl // 2
+
+    def time(self, now):
+        """ UTC offset from the last time sync if the RTC was set less than
+            time_ttl ago, else None. An RTC reading from before that sync
+            has lost its time (it starts over without power), so that's
+            None too.
+        """
+        if self.utc_offset is not None and \
+                0 <= now - self.synced < self.time_ttl:
+            return self.utc_offset
+        return None
+
+    def locate(self, latitude, longitude, now):
+        """ Note an IP geolocation (geoplugin's text) made at now. """
+        self.latitude, self.longitude = str(latitude), str(longitude)
+        self.located = int(now)
+        self.changed = True
+
+    def sync(self, utc_offset, now):
+        """ Note a time sync that set the RTC to now. """
+        self.utc_offset = utc_offset
+        self.synced = int(now)
+        self.changed = True
+
+    def save(self):
+        """ Write the file if anything's new; kept going without it on a
+            read-only board.
+        """
+        if not (self.path and self.changed):
+            return
+        self.changed = False
+        try:
+            record = struct.pack(RECORD, MAGIC,
+                                 (self.latitude or '').encode('ascii'),
+                                 (self.longitude or '').encode('ascii'),
+                                 self.located,
+                                 (self.utc_offset or '').encode('ascii'),
+                                 self.synced,
+                                 self.timezone.encode('ascii'))
+            with open(self.path, 'wb') as cache:
+                cache.write(record)
+        except OSError as error: # Read-only filesystem, most likely
+            print('Boot cache not saved:', error)
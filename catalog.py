@@ -0,0 +1,104 @@
+"""
+Sprite catalog for the poke clock
+One small index file, made at build time, that lists every sprite so the
+clock never has to walk the sprite directory on the device.
+
+Written by Trevor Craig
+
+"""
+import os
+import struct
+
+# File layout (all little-endian):
+#   header : magic, record count, offset of the names blob
+#   records: one fixed-size record per sprite -- name offset, name length
+#            and file size in bytes
+#   names  : sprite paths as ASCII, back to back, no separators
+MAGIC = b'PKC1'
+HEADER = '<4sII'
+RECORD = '<III'
+HEADER_SIZE = struct.calcsize(HEADER)
+RECORD_SIZE = struct.calcsize(RECORD)
+
+def list_sprites(inputdir, extension='.bmp'):
+    """ Sprite file names in inputdir, in catalog order. """
+    return sorted(f for f in os.listdir(inputdir) if f.endswith(extension))
+
+def build_catalog(inputdir, output, extension='.bmp'):
+    """ Scan inputdir (on the host, at build time) and write a catalog
+        index to output. Names are stored as full paths relative to the
+        board root (e.g. 'edited/abra.bmp') so picking a sprite on the
+        device needs no string joins. Returns the number of sprites.
+    """
+    files = list_sprites(inputdir, extension)
+    records = bytearray()
+    names = bytearray()
+    for file in files:
+        name = (inputdir + '/' + file).encode('ascii')
+        size = os.stat(inputdir + '/' + file)[6]
+        records += struct.pack(RECORD, len(names), len(name), size)
+        names += name
+    with open(output, 'wb') as index:
+        index.write(struct.pack(HEADER, MAGIC, len(files),
+                                HEADER_SIZE + len(records)))
+        index.write(records)
+        index.write(names)
+    return len(files)
+
+class SpriteCatalog():
+    """ Read side of the catalog, used on the device. The index file is
+        opened on first use and kept open; each lookup is two seeks and
+        two small reads into preallocated buffers, so cost doesn't depend
+        on the number of sprites and no directory listing is built.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._count = 0
+        self._names = 0
+        self._record = bytearray(RECORD_SIZE)
+        self._name = bytearray(64)
+
+    def _open(self):
+        """ Open the index and read its header. Raises OSError if the
+            file is missing and ValueError if it isn't a catalog.
+        """
+        index = open(self.path, 'rb')
+        magic, count, names = struct.unpack(HEADER, index.read(HEADER_SIZE))
+        if magic != MAGIC:
+            index.close()
+            raise ValueError('Not a sprite catalog: ' + self.path)
+        self._file, self._count, self._names = index, count, names
+
+    def __len__(self):
+        if self._file is None:
+            self._open()
+        return self._count
+
+    def _read_record(self, index):
+        if self._file is None:
+            self._open()
+        if not 0 <= index < self._count:
+            raise IndexError('sprite index out of range')
+        self._file.seek(HEADER_SIZE + index * RECORD_SIZE)
+        self._file.readinto(self._record)
+        return struct.unpack(RECORD, self._record)
+
+    def name(self, index):
+        """ Path of sprite number index, e.g. 'edited/abra.bmp'. """
+        offset, length, _ = self._read_record(index)
+        if length > len(self._name):
+            self._name = bytearray(length)
+        self._file.seek(self._names + offset)
+        view = memoryview(self._name)[:length]
+        self._file.readinto(view)
+        return str(view, 'ascii')
+
+    def size(self, index):
+        """ File size in bytes of sprite number index. """
+        return self._read_record(index)[2]
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
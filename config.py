@@ -3,4 +3,26 @@ TWELVE_HOUR = True # If set, use 12-hour time vs 24-hour (e.g. 3:00 vs 15:00)
 COUNTDOWN = False  # If set, show time to (vs time of) next rise/set event
 MONTH_DAY = True   # If set, use MM/DD vs DD/MM (e.g. 31/12 vs 12/31)
 BITPLANES = 6      # Ideally 6, but can set lower if RAM is tight
-
+ROTATION = None    # 0, 90, 180 or 270, or None to read it off the accelerometer
+SPRITE_SOURCE = 'pokemon' # Beside the clock in code.py: 'pokemon', 'moon'
+                          # (phase frames in moon/) or 'splash' (engine.py)
+SPRITE_ATLAS = 'atlas.json' # Sheets from imageresizer.PackAtlas, or None
+MOON_CACHE = 'moon.dat' # Lunar data cache (needs boot.py to make it writable)
+PREFETCH_DAYS = 7  # Days of lunar data per query, kept in MOON_CACHE
+OFFLINE_MOON = False # If set, calculate moon data on the board (ephemeris.py,
+                     # check it first with ephemerischeck.py)
+SPRITE_SECONDS = 60 # How often a new sprite is shown
+SPRITE_WINDOW = 20 # Sprites shown lately that won't come up again yet
+SPRITE_WEIGHTS = {} # Name part: weight, e.g. {'pikachu': 3, 'gmax': 0}
+SPRITE_ONLY = ()   # Only names with one of these parts, e.g. ('galar',)
+SPRITE_STATE = 'sprites.dat' # Sprite shuffle kept across reboots, or None
+SPRITE_IN_RAM = True # Read sprite files into RAM (when there's room) vs
+                     # reading them off flash at every refresh
+ANIMATIONS = 'animated' # Animations (imageresizer.ConvertAnimation), or None
+ANIMATION_MIN_DELAY = 0.1 # Shortest time a frame shows, in seconds
+MOON_SECONDS = 600  # How often moon phase/data is recalculated
+SYNC_SECONDS = 12 * 60 * 60 # How often the clock syncs with the time server
+BOOT_CACHE = 'boot.dat' # Geolocation and last time sync kept across reboots
+                        # (bootcache.py), or None to query both every boot
+LOCATION_SECONDS = 7 * 24 * 60 * 60 # How long a cached IP geolocation is used
+MEMTRACE_SIZE = 64 # Phases kept by memtrace.py, printed hourly (0 = off)
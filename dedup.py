@@ -0,0 +1,168 @@
+# Finds duplicate sprites across the sprite folders by their pixels
+# Exact copies (same pixels, whatever the file) and near copies (forms of
+# one Pokemon that only differ in a few pixels) are dropped, the rest are
+# copied into one folder with a catalog and an alias table saying which
+# kept sprite stands in for each dropped one
+# Written By Trevor Craig
+
+# Libraries
+from PIL import Image, ImageChops
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+from catalog import build_catalog
+from imageresizer import SIZE, CropResize, Flatten
+
+# Folders in order of preference, the first copy found is the one kept
+INPUTDIRS=("edited","pokemon/keepers","pokemon/edited2")
+TOLERANCE=24 # A pixel only counts as different if a channel is off by more
+NEAR=64      # Forms with this many different pixels (of 1024) are merged
+
+def SpritePixels(path):
+    # The sprite as it ends up on the matrix: SIZE x SIZE RGB on black.
+    # Sources that aren't converted yet (pokemon/orginal2) are cropped and
+    # resized the same way imageresizer does it.
+    img=Image.open(path)
+    if img.size!=(SIZE,SIZE):
+        img=CropResize(path)
+    return(Flatten(img))
+
+def HashPixels(img):
+    return(hashlib.sha1(img.tobytes()).hexdigest())
+
+def Species(file):
+    # "alcremie-caramel-swirl-berry.bmp" -> "alcremie"
+    return(os.path.splitext(file)[0].split("-")[0])
+
+def PixelDistance(a,b,tolerance=TOLERANCE):
+    # Number of pixels where any channel differs by more than tolerance
+    diff=ImageChops.difference(a,b)
+    mask=None
+    for channel in diff.split():
+        channel=channel.point(lambda v: 255 if v>tolerance else 0)
+        mask=channel if mask is None else ImageChops.lighter(mask,channel)
+    return(mask.histogram()[255])
+
+def Preference(sprite):
+    # Within a species, keep the plainest form: shortest name, then a-z
+    return(len(sprite["file"]),sprite["file"])
+
+def FindDuplicates(inputdirs=INPUTDIRS,near=NEAR,tolerance=TOLERANCE):
+    # Returns (kept, aliases, unreadable). kept is a list of sprites
+    # (dicts of path, file, hash, bytes); aliases maps each dropped path to
+    # {"kept": path, "reason": "exact"/"name"/"near", "pixels": n}.
+    # Near copies are only looked for within a species, so a sprite never
+    # stands in for a different Pokemon.
+    sprites=[]
+    unreadable=[]
+    for inputdir in inputdirs:
+        for file in sorted(os.listdir(inputdir)):
+            path=inputdir+"/"+file
+            if not os.path.isfile(path):
+                continue
+            try:
+                img=SpritePixels(path)
+            except Exception as error:
+                unreadable.append((path,f"{type(error).__name__}: {error}"))
+                continue
+            sprites.append({"path":path,"file":os.path.splitext(file)[0]+".bmp",
+                            "hash":HashPixels(img),"bytes":os.path.getsize(path),
+                            "img":img})
+    aliases={}
+    by_hash={}
+    by_file={}
+    unique=[]
+    # Exact copies first, then a second file of the same name (the same
+    # Pokemon cropped differently in another folder): first folder wins
+    for sprite in sprites:
+        kept=by_hash.get(sprite["hash"])
+        reason="exact"
+        if kept is None:
+            kept=by_file.get(sprite["file"])
+            reason="name"
+        if kept is not None:
+            aliases[sprite["path"]]={"kept":kept["path"],"reason":reason,
+                "pixels":PixelDistance(sprite["img"],kept["img"],tolerance)}
+            continue
+        by_hash[sprite["hash"]]=sprite
+        by_file[sprite["file"]]=sprite
+        unique.append(sprite)
+    # Then near copies: each sprite is checked against the ones already
+    # kept for its species, plainest form first
+    kept=[]
+    species={}
+    for sprite in sorted(unique,key=Preference):
+        group=species.setdefault(Species(sprite["file"]),[])
+        for other in group:
+            pixels=PixelDistance(sprite["img"],other["img"],tolerance)
+            if pixels<=near:
+                aliases[sprite["path"]]={"kept":other["path"],"reason":"near",
+                                         "pixels":pixels}
+                break
+        else:
+            group.append(sprite)
+            kept.append(sprite)
+    # Aliases point at a kept sprite, never at another alias
+    for alias in aliases.values():
+        while alias["kept"] in aliases:
+            alias["kept"]=aliases[alias["kept"]]["kept"]
+    kept.sort(key=lambda sprite: sprite["file"])
+    return(kept,aliases,unreadable)
+
+def Dedup(inputdirs=INPUTDIRS,outputdir="unique",near=NEAR,tolerance=TOLERANCE):
+    # Write the kept sprites to outputdir (named by file, board path
+    # outputdir/file), its catalog outputdir.idx and the alias table
+    # outputdir.aliases.json
+    if any(os.path.abspath(outputdir)==os.path.abspath(inputdir) for inputdir in inputdirs):
+        raise ValueError(f"{outputdir} is one of the input folders")
+    start=time.perf_counter()
+    (kept,aliases,unreadable)=FindDuplicates(inputdirs,near,tolerance)
+    os.makedirs(outputdir,exist_ok=True)
+    for file in os.listdir(outputdir): # Sprites from the last run
+        if file.endswith(".bmp"):
+            os.remove(outputdir+"/"+file)
+    deployed={}
+    for sprite in kept:
+        shutil.copyfile(sprite["path"],outputdir+"/"+sprite["file"])
+        deployed[sprite["path"]]=outputdir+"/"+sprite["file"]
+    table={"settings":{"inputdirs":list(inputdirs),"near":near,
+                       "tolerance":tolerance},
+           "sprites":{deployed[sprite["path"]]:sprite["hash"] for sprite in kept},
+           "aliases":{path:dict(alias,kept=deployed[alias["kept"]])
+                      for (path,alias) in sorted(aliases.items())},
+           "unreadable":dict(unreadable)}
+    with open(outputdir+".aliases.json","w") as table_out:
+        json.dump(table,table_out,indent=1)
+    count=build_catalog(outputdir,outputdir+".idx")
+    elapsed=time.perf_counter()-start
+    # Flash space, against copying every folder over as it is
+    total=sum(sprite["bytes"] for sprite in kept)
+    every=total+sum(os.path.getsize(path) for path in aliases)
+    reasons={}
+    for alias in aliases.values():
+        reasons[alias["reason"]]=reasons.get(alias["reason"],0)+1
+    print(f"{len(kept)+len(aliases)} sprites in {', '.join(inputdirs)}: kept {len(kept)}, "
+          f"aliased {len(aliases)} ({', '.join(f'{n} {r}' for (r,n) in sorted(reasons.items()))}), "
+          f"unreadable {len(unreadable)} in {elapsed:.2f} s")
+    print(f"{every} -> {total} bytes, saved {every-total} ({100*(every-total)/max(every,1):.1f}%)")
+    print(f"Catalog of {count} sprites written to {outputdir}.idx, aliases to {outputdir}.aliases.json")
+    for (path,error) in unreadable:
+        print(f"  Couldn't read {path}: {error}")
+    return(kept,aliases)
+
+def main():
+    parser=argparse.ArgumentParser(description="Deduplicate sprites by their pixels")
+    parser.add_argument("inputdirs",nargs="*",default=list(INPUTDIRS),
+                        help="folders, most preferred first")
+    parser.add_argument("--output",default="unique")
+    parser.add_argument("--near",type=int,default=NEAR,
+                        help="merge forms with this many different pixels (0: exact only)")
+    parser.add_argument("--tolerance",type=int,default=TOLERANCE)
+    args=parser.parse_args()
+    Dedup(args.inputdirs,args.output,args.near,args.tolerance)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,638 @@
+"""
+Clock engine for the poke clock
+The one main loop behind code.py and poke.py: matrix, fonts, labels, time
+and moon data, and the jobs that keep them current. What goes in the
+sprite spot comes from a sprite source (random Pokemon, the moon's phase,
+or just the splash screen), and the board libraries only a source needs
+are imported when that source starts, so each mode boots with just what
+it uses.
+
+Written by Trevor Craig
+
+"""
+# pylint: disable=import-error
+import gc
+import time
+import displayio
+import adafruit_display_text.label
+from config import *
+from utils import update_time, sync_time, locate, PokeData, Cached
+from utils import clock_text, countdown_text, date_text, percent_text
+from utils import moon_age, percent_lit, next_event
+from tasks import Scheduler, Jitter, periodic, run_blocking, backoff
+from render import Renderer
+from outline import OutlineLabel
+from glyphfont import load_font
+from httpclient import client
+from bootcache import BootCache
+import memtrace
+
+def read_rotation():
+    """ Display rotation in degrees: ROTATION if it's set, else from which
+        way up the accelerometer says the board is (its driver is only
+        imported then).
+    """
+    if ROTATION is not None:
+        return ROTATION
+    import math
+    import board
+    import busio
+    import adafruit_lis3dh
+    accel = adafruit_lis3dh.LIS3DH_I2C(busio.I2C(board.SCL, board.SDA),
+                                       address=0x19)
+    _ = accel.acceleration # Dummy reading to blow out any startup residue
+    time.sleep(0.1)
+    return (int(((math.atan2(-accel.acceleration.y,
+                             -accel.acceleration.x) + math.pi) /
+                 (math.pi * 2) + 0.875) * 4) % 4) * 90
+
+# SPRITE SOURCES -----------------------------------------------------------
+# Each one says which splash screen to show while booting and keeps
+# GROUP[0] up to date: start() once the display's up, tasks() for jobs of
+# its own, update() as part of the clock's minute and drawn() after that
+# minute's refresh. percent is whether the moon percentage is shown.
+
+class PokemonSource():
+    """ Random Pokemon: from the atlas (one TileGrid, sprite picked by tile
+        index) if it's on the board, else one BMP file at a time, a new
+        one every SPRITE_SECONDS, playing its animation if it has one.
+    """
+    percent = False
+
+    def splash(self, rotation):
+        return 'Splash.bmp'
+
+    def start(self, clock):
+        # Only this source needs these
+        from atlas import SpriteAtlas
+        from catalog import SpriteCatalog
+        from sampler import Sampler
+        from preload import SpriteLoader
+        from utils import CATALOG
+        self.clock = clock
+        self.catalog = CATALOG
+        self.atlas = None
+        if SPRITE_ATLAS:
+            try:
+                self.atlas = SpriteAtlas(SPRITE_ATLAS)
+            except (OSError, ValueError):
+                print('No sprite atlas, loading sprites one file at a time')
+        # Which sprite comes next: a shuffle bag over the catalog, with
+        # weights, name filters and no repeats within SPRITE_WINDOW picks
+        # (sampler.py)
+        self.sampler = None
+        self.atlas_names = None # Names of the atlas tiles, for animations
+        try:
+            if self.atlas is None:
+                self.sampler = Sampler(CATALOG, SPRITE_WEIGHTS, SPRITE_ONLY,
+                                       SPRITE_WINDOW, SPRITE_STATE)
+            elif self.atlas.catalog:
+                self.atlas_names = SpriteCatalog(self.atlas.catalog)
+                self.sampler = Sampler(self.atlas_names, SPRITE_WEIGHTS,
+                                       SPRITE_ONLY, SPRITE_WINDOW,
+                                       SPRITE_STATE)
+        except (OSError, ValueError):
+            pass
+        if self.sampler is None:
+            print('No sprite catalog, picking sprites at random')
+        # Sprite files, when there's no atlas: the next one is got ready
+        # ahead of time and swapped in whole (preload.py). Sprites with an
+        # animation in ANIMATIONS play that instead, atlas or not.
+        self.sprites = SpriteLoader(clock.render, 0, SPRITE_IN_RAM,
+                                    clock.splash_file, ANIMATIONS)
+
+    def tasks(self):
+        return (self.sprite_task(),)
+
+    def update(self):
+        pass # Sprites change on their own time, not the clock's
+
+    def drawn(self):
+        pass
+
+    def next_sprite(self):
+        """ File name of the sprite to show next. """
+        if self.sampler:
+            return self.catalog.name(self.sampler.draw())
+        from utils import getrandom
+        return getrandom()
+
+    def update_sprite(self):
+        """ Show a new sprite. """
+        clock = self.clock
+        sprites = self.sprites
+        clock.memtrace.begin(memtrace.SPRITE)
+        if self.atlas:
+            # Same TileGrid as last time unless the sprite is on another
+            # sheet
+            if self.sampler:
+                sprite = self.sampler.draw()
+            else:
+                import random
+                sprite = random.randint(0, len(self.atlas) - 1)
+            name = self.atlas_names.name(sprite) if self.atlas_names else None
+            if name and sprites.animated(name):
+                sprites.prepare(name)
+                sprites.show()
+            else:
+                clock.render.sprite(0, self.atlas.tile_grid(sprite), sprite)
+                sprites.close() # Splash screen's file, or the last animation
+        else:
+            # Normally got ready after the last swap (sprite_task), so this
+            # is just the TileGrid swap; the first time round it's loaded
+            # here
+            if not sprites.ready():
+                sprites.prepare(self.next_sprite())
+            sprites.show()
+        clock.memtrace.end()
+
+        clock.render.move(0, 0, clock.moon_y)
+        clock.draw()
+        if sprites.animation:
+            clock.scheduler.add(self.animate(sprites.animation))
+
+    def animate(self, animation):
+        """ Play animation, a frame at a time, until another sprite
+            replaces it. Each frame only writes (and repaints) the pixels
+            it changes.
+        """
+        clock = self.clock
+        yield max(animation.delay, ANIMATION_MIN_DELAY) # Keyframe's showing
+        while self.sprites.animation is animation:
+            animation.step()
+            clock.render.touch(0, animation.changed)
+            clock.draw()
+            yield max(animation.delay, ANIMATION_MIN_DELAY)
+
+    def sprite_task(self):
+        """ A new sprite every SPRITE_SECONDS, and in between (after the
+            refresh, once anything else due has run) the one after it is
+            opened or read into RAM, off the swap's critical path.
+        """
+        while True:
+            self.update_sprite()
+            if not self.atlas:
+                yield 0
+                self.clock.memtrace.begin(memtrace.SPRITE)
+                self.sprites.prepare(self.next_sprite())
+                self.clock.memtrace.end()
+            yield SPRITE_SECONDS
+
+class MoonSource():
+    """ The moon as it is now: one of 100 pre-rendered phase frames
+        (moon/moon00.bmp to moon99.bmp), changed as the clock's minute
+        finds the phase has moved on.
+    """
+    percent = True
+
+    def splash(self, rotation):
+        return 'moon/splash-' + str(rotation) + '.bmp'
+
+    def start(self, clock):
+        from preload import SpriteLoader
+        self.clock = clock
+        # Frame file names, 0 to 99, made once rather than every minute
+        self.frames = tuple('moon/moon{0:0>2}.bmp'.format(n)
+                            for n in range(100))
+        # The next frame is opened ahead of time and swapped in whole, each
+        # file closed once its frame is off the screen (preload.py)
+        self.moon = SpriteLoader(clock.render, 0, False, clock.splash_file)
+
+    def tasks(self):
+        return ()
+
+    def update(self):
+        clock = self.clock
+        filename = self.frames[clock.frame]
+        if not clock.render.showing(0, filename): # New frame every ~7 hours
+            clock.memtrace.end()
+            clock.memtrace.begin(memtrace.SPRITE)
+            self.moon.prepare(filename) # Already open unless the frame jumped
+            self.moon.show()
+            clock.memtrace.end()
+            clock.memtrace.begin(memtrace.LAYOUT)
+
+    def drawn(self):
+        # Refresh's done, open the next frame now rather than when it's due
+        self.moon.prepare(self.frames[(self.clock.frame + 1) % 100])
+
+class SplashSource():
+    """ Just the splash screen, left up: the lightest mode, with none of
+        the sprite code loaded.
+    """
+    percent = False
+
+    def splash(self, rotation):
+        return 'Splash.bmp'
+
+    def start(self, clock):
+        pass
+
+    def tasks(self):
+        return ()
+
+    def update(self):
+        pass
+
+    def drawn(self):
+        pass
+
+SOURCES = {'pokemon': PokemonSource, 'moon': MoonSource,
+           'splash': SplashSource}
+
+# THE CLOCK ----------------------------------------------------------------
+
+class Clock():
+    """ Everything the clock does, with source (one of SOURCES) filling
+        the sprite spot. Construction does the one-time setup (display,
+        network, time and moon data); run() is the main loop.
+    """
+    def __init__(self, source):
+        # pylint: disable=bare-except
+        from adafruit_matrixportal.matrix import Matrix
+        from adafruit_matrixportal.network import Network
+        try:
+            from secrets import secrets
+        except ImportError:
+            print('WiFi secrets are kept in secrets.py, please add them there!')
+            raise
+        self.source = source
+        self.memtrace = memtrace.MemTrace(MEMTRACE_SIZE)
+        self.memtrace.begin(memtrace.BOOT) # Framebuffer, sized by BITPLANES
+        matrix = Matrix(bit_depth=BITPLANES)
+        self.memtrace.end()
+        self.display = matrix.display
+        self.display.rotation = read_rotation()
+
+        # Compiled glyph files (fontcompiler.py) if present, else parse the
+        # BDFs
+        large_font = load_font('/fonts/helvB12', '0123456789:')
+        small_font = load_font('/fonts/helvR10', '0123456789:/.%')
+        symbol_font = load_font('/fonts/6x10', '\u21A5\u21A7')
+
+        # Display group is set up once, then we just shuffle items around
+        # later. Order of creation here determines their stacking order.
+        group = displayio.Group()
+
+        # Element 0 is a stand-in item, later replaced by the source's
+        # sprite
+        self.splash_file = None # Its file, closed when that replaces it
+        try:
+            # CircuitPython 6 & 7 compatible
+            self.splash_file = open(source.splash(self.display.rotation), 'rb')
+            bitmap = displayio.OnDiskBitmap(self.splash_file)
+            group.append(displayio.TileGrid(
+                bitmap,
+                pixel_shader=getattr(bitmap, 'pixel_shader',
+                                     displayio.ColorConverter())))
+        except:
+            group.append(adafruit_display_text.label.Label(
+                small_font, color=0xFF0000, text='AWOO'))
+            group[0].x = (self.display.width - group[0].bounding_box[2] + 1) // 2
+            group[0].y = self.display.height // 2 - 1
+
+        # Element 1 is the moon percentage with a 1-pixel black outline,
+        # drawn in one bitmap (outline.py). Initial position is off the
+        # matrix, updated on first refresh. Initial text value must be long
+        # enough for longest anticipated string later.
+        group.append(OutlineLabel(small_font, color=0xFFFF00, outline_color=0,
+                                  text='99.9%', y=-99))
+        # Element 2 is the current time
+        group.append(adafruit_display_text.label.Label(
+            large_font, color=0x808080, text='12:00', y=-99))
+        # Element 3 is the current date
+        group.append(adafruit_display_text.label.Label(
+            small_font, color=0x808080, text='12/31', y=-99))
+        # Element 4 is a symbol indicating next rise or set
+        group.append(adafruit_display_text.label.Label(
+            symbol_font, color=0x00FF00, text='x', y=-99))
+        # Element 5 is the time of (or time to) next rise/set event
+        group.append(adafruit_display_text.label.Label(
+            small_font, color=0x00FF00, text='12:00', y=-99))
+        self.display.show(group)
+        self.display.refresh() # Splash screen up now, the rest is refreshed
+        self.display.auto_refresh = False # by hand: each frame's changes
+                                          # show all at once
+        self.render = Renderer(group) # Labels and sprite change through this
+        source.start(self)
+
+        import board
+        network = Network(status_neopixel=board.NEOPIXEL, debug=False)
+        network.connect()
+        # Fetches go through one session that keeps each host's connection
+        # open and asks again with ETag/If-Modified-Since (httpclient.py)
+        self.network = client(network)
+
+        # Load time zone string from secrets.py, else IP geolocation for
+        # this too (http://worldtimeapi.org/api/timezone for list).
+        try:
+            self.timezone = secrets['timezone'] # e.g. 'America/New_York'
+        except:
+            self.timezone = None # IP geolocation
+
+        # What the last boot had to look up: IP geolocation, UTC offset and
+        # when the RTC was set (bootcache.py). Whatever's still good there
+        # saves a query before the first frame.
+        now = time.time()
+        self.boot = BootCache(BOOT_CACHE, self.timezone, LOCATION_SECONDS,
+                              SYNC_SECONDS)
+        self.scheduler = Scheduler() # Background jobs can queue from here
+
+        # Latitude and longitude are set up once, constant over app
+        # lifetime. Fetch latitude/longitude from secrets.py. If not
+        # present, use IP geolocation, or the last boot's if it's recent
+        # (looked up again in the background once it's getting on; a move
+        # shows from the next boot).
+        located = None # New IP geolocation for the cache
+        try:
+            self.latitude = secrets['latitude']
+            self.longitude = secrets['longitude']
+            print('Using stored geolocation: ', self.latitude, self.longitude)
+        except KeyError:
+            location = self.boot.location(now)
+            if location:
+                self.latitude, self.longitude = location
+                print('Using cached IP geolocation: ', self.latitude,
+                      self.longitude)
+                if self.boot.stale(now):
+                    self.scheduler.add(self.relocate())
+            else:
+                self.latitude, self.longitude = located = locate(self.network)
+                print('Using IP geolocation: ', self.latitude, self.longitude)
+
+        # Set initial clock time, also fetch initial UTC offset while here
+        # (NOT stored in secrets.py as it may change with DST). If the RTC
+        # was set by a sync that's not yet due again and still has the
+        # time (a reload or reset, not a power cut), keep it: the usual
+        # sync in check_sync() comes round when it would have anyway.
+        self.utc_offset = self.boot.time(now)
+        if self.utc_offset:
+            datetime = time.localtime()
+            self.last_sync = self.boot.synced
+            print('Using RTC time, synced', int(now - self.last_sync),
+                  'seconds ago, UTC', self.utc_offset)
+        else:
+            try:
+                datetime, self.utc_offset = update_time(self.network,
+                                                        self.timezone)
+                self.boot.sync(self.utc_offset, time.mktime(datetime))
+            except:
+                datetime, self.utc_offset = time.localtime(), '+00:00'
+            self.last_sync = time.mktime(datetime)
+        if located: # Stamped with the RTC set, not what it read at power-up
+            self.boot.locate(self.latitude, self.longitude, time.time())
+        self.boot.save()
+
+        # Moon data for the current 24-hour period and +24 ahead:
+        # calculated right here, or from the cache if it has them, else one
+        # query that also caches the next PREFETCH_DAYS. period[0] is the
+        # current 24-hour time period we're in, period[1] the following 24
+        # hours. Data is shifted down and new data fetched as days expire.
+        self.cache = self.new_cache()
+        self.period = [PokeData(datetime, day * 24, self.utc_offset,
+                                self.latitude, self.longitude, None)
+                       for day in range(2)]
+        if OFFLINE_MOON: # Calculated right here, no query at all
+            import ephemeris
+            for day in self.period:
+                ephemeris.fill(day, self.latitude, self.longitude,
+                               self.utc_offset)
+        elif not (self.cache.fill(self.period[0]) and
+                  self.cache.fill(self.period[1])):
+            run_blocking(self.cache.fetch(self.network, self.period[0],
+                                          retries=5))
+            self.cache.fill(self.period[1])
+            if None in (self.period[0].age, self.period[1].age):
+                # No data and no network: calculated stand-ins until a
+                # background fetch gets through (the cache takes over at
+                # the next rollover), so no moon field is ever left empty
+                import ephemeris
+                for day in self.period:
+                    if day.age is None:
+                        ephemeris.fill(day, self.latitude, self.longitude,
+                                       self.utc_offset)
+                self.scheduler.add(self.memtrace.task(
+                    memtrace.ROLLOVER,
+                    self.cache.fetch(self.network, self.period[0])))
+
+        # Network jobs that can wait (time sync, next day's moon data) and
+        # the clock's own jobs run from self.scheduler, made above
+        self.jitter = Jitter()
+        self.redraws = self.redrawn = 0 # Refreshes and pixels, this hour
+        self.age = self.percent = 0
+        self.frame = 0
+        self.moon_y = 0
+        self.risen = False # Moon up? next_event() keeps this if no rise/set
+                           # is due
+        # Label text, only rebuilt when the value behind it changes
+        self.clock_text = Cached(clock_text)
+        self.date_text = Cached(date_text)
+        self.event_text = Cached(countdown_text if COUNTDOWN else clock_text)
+        self.percent_text = Cached(percent_text)
+
+    def new_cache(self):
+        """ MOON_CACHE for the current location and UTC offset, or None
+            when moon data is calculated on the board.
+        """
+        if OFFLINE_MOON:
+            return None
+        from mooncache import MoonCache
+        return MoonCache(MOON_CACHE, self.latitude, self.longitude,
+                         self.utc_offset, PREFETCH_DAYS)
+
+    def synced(self, time_struct, utc_offset):
+        """ Called by the background sync_time() task on success. """
+        if utc_offset != self.utc_offset: # DST change, cached times are off
+            self.utc_offset = utc_offset
+            self.cache = self.new_cache()
+        self.last_sync = time.mktime(time_struct)
+        self.boot.sync(utc_offset, self.last_sync)
+        self.boot.save()
+
+    def relocate(self, retries=3, base=4):
+        """ Scheduler task: IP geolocation again for the boot cache, with
+            backoff. The clock stays where it booted.
+        """
+        yield 30 # Clock's up first
+        for attempt in range(retries):
+            try:
+                self.boot.locate(*locate(self.network), time.time())
+                self.boot.save()
+                return
+            except Exception as error: # pylint: disable=broad-except
+                print('Geolocation failed:', error)
+                yield backoff(attempt, base)
+
+    # Everything the clock does is a job run by the scheduler on its own
+    # cadence: the time on the minute, moon age and data every
+    # MOON_SECONDS, time server checks every half hour, and whatever the
+    # source runs. Each one redraws only what it changed.
+
+    def draw(self):
+        """ Push this job's changes to the matrix, if there were any. """
+        # Only repaint when something moved or changed; displayio redraws
+        # just the areas those elements covered
+        render = self.render
+        if render.end():
+            self.redraws += 1 # Printed hourly, not per frame
+            self.redrawn += render.pixels
+            self.memtrace.begin(memtrace.REFRESH)
+            self.display.refresh()
+            self.memtrace.end()
+        render.begin()
+
+    def check_sync(self):
+        """ Sync with time server every SYNC_SECONDS (~12 hours). """
+        now = time.time()
+        if now - self.last_sync > SYNC_SECONDS:
+            # Runs in the background; sync_time() retries with backoff if
+            # the time server doesn't respond. Meanwhile keep running with
+            # our current time, and push the next sync ahead 30 minutes in
+            # case this one gives up (don't overwhelm the server with
+            # repeated queries). Success moves last_sync to the fetched time.
+            self.last_sync = now - SYNC_SECONDS + 30 * 60
+            self.scheduler.add(self.memtrace.task(
+                memtrace.SYNC, sync_time(self.network, self.timezone,
+                                         self.synced)))
+
+    def update_moon(self):
+        """ Moon data and phase for right now. """
+        now = time.time() # Current epoch time in seconds
+        period = self.period
+
+        # If period has expired, move data down and calculate the new
+        # +24-hour data, or take it from the cache. If it's not cached,
+        # estimated data stands in until a background fetch fills it, so
+        # the clock doesn't stall at midnight. The fetch also tops the
+        # cache up once it's half used.
+        if now >= period[1].midnight:
+            self.memtrace.begin(memtrace.ROLLOVER)
+            period[0] = period[1]
+            period[1] = PokeData(time.localtime(), 24, self.utc_offset,
+                                 self.latitude, self.longitude, None)
+            if OFFLINE_MOON:
+                import ephemeris
+                ephemeris.fill(period[1], self.latitude, self.longitude,
+                               self.utc_offset)
+            else:
+                if not self.cache.fill(period[1]):
+                    period[1].estimate(period[0])
+                if (self.cache.days_ahead(period[1].day_start()) <
+                        PREFETCH_DAYS // 2):
+                    self.scheduler.add(self.memtrace.task(
+                        memtrace.ROLLOVER,
+                        self.cache.fetch(self.network, period[1])))
+            self.memtrace.end()
+
+        self.memtrace.begin(memtrace.MOON)
+        # Moon phase 'age' right now, between today's and tomorrow's
+        self.age = moon_age(period, now)
+        # Age can be used for direct lookup to moon bitmap (0 to 99) --
+        # these images are pre-rendered for a linear timescale (solar
+        # terminator moves nonlinearly across sphere).
+        self.frame = int(self.age * 100) % 100 # Bitmap 0 to 99
+        self.percent = percent_lit(self.age)
+        self.memtrace.end()
+
+    def update_clock(self):
+        """ Time, date, sprite and next moon event, on the minute. """
+        gc.collect()
+        self.memtrace.begin(memtrace.LAYOUT)
+        render = self.render
+        now = time.time() # Current epoch time in seconds
+
+        # Find next rise/set event (and so whether the moon's up now)
+        event, self.risen = next_event(self.period, now, self.risen)
+
+        if self.display.rotation in (0, 180): # Horizontal 'landscape'
+            center_x = 48      # Text along right
+            self.moon_y = 0    # Moon at left
+            time_y = 6         # Time at top right
+            event_y = 26       # Rise/set at bottom right
+        else:                  # Vertical 'portrait' orientation
+            center_x = 16      # Text down center
+            if self.risen:
+                self.moon_y = 0  # Moon at top
+                event_y = 38     # Rise/set in middle
+                time_y = 49      # Time/date at bottom
+            else:
+                time_y = 6       # Time/date at top
+                event_y = 26     # Rise/set in middle
+                self.moon_y = 32 # Moon at bottom
+
+        # Sprite (GROUP[0])
+        self.source.update()
+        render.move(0, 0, self.moon_y)
+
+        # Update percent value (GROUP[1], text and outline in one)
+        # Render skips whatever's the same as last time.
+        string = '' # Percent isn't shown beside a Pokemon
+        if self.source.percent: # Rounds like the old '{:.1f}' of +0.05
+            string = self.percent_text.text(int(self.percent * 10 + 1))
+        xpos = 16 - render.text(1, string).bounding_box[2] // 2
+        render.move(1, xpos, self.moon_y + 16)
+
+        # Update next-event time (GROUP[4] and [5])
+        # Do this before time because we need uncorrupted now value
+        event_minute = event % 86400 // 60 # Of the day, RTC is local time
+        if COUNTDOWN: # Show event as countdown to event
+            string = self.event_text.text(int((event - now) // 60))
+        else: # Show event in clock time
+            string = self.event_text.text(event_minute)
+        xpos = center_x - (render.text(5, string).bounding_box[2] + 6) // 2
+        if self.risen:               # Next event is SET
+            render.text(4, '\u21A7') # Downwards arrow from bar
+            render.move(4, xpos, event_y - 2)
+            print('Sets:', string)
+        else:                        # Next event is RISE
+            render.text(4, '\u21A5') # Upwards arrow from bar
+            render.move(4, xpos, event_y - 1)
+            print('Rises:', string)
+        render.move(5, xpos + 6, event_y)
+        # Show event time in green if a.m., amber if p.m.
+        color = 0x00FF00 if event_minute < 12 * 60 else 0xC04000
+        render.color(4, color)
+        render.color(5, color)
+
+        # Update time (GROUP[2]) and date (GROUP[3])
+        now = time.localtime()
+        string = self.clock_text.text(now.tm_hour * 60 + now.tm_min)
+        render.move(2, center_x - render.text(2, string).bounding_box[2] // 2,
+                    time_y)
+        if MONTH_DAY:
+            string = self.date_text.text(now.tm_mon * 32 + now.tm_mday)
+        else:
+            string = self.date_text.text(now.tm_mday * 32 + now.tm_mon)
+        render.move(3, center_x - render.text(3, string).bounding_box[2] // 2,
+                    time_y + 10)
+        self.memtrace.end()
+
+        self.draw()
+        self.source.drawn()
+
+    def run(self):
+        """ The main loop, forever. """
+        scheduler = self.scheduler
+        # Moon first, the clock needs its numbers
+        scheduler.add(periodic(self.update_moon, MOON_SECONDS))
+        scheduler.add(periodic(self.update_clock, 60, align=True,
+                               jitter=self.jitter))
+        for task in self.source.tasks():
+            scheduler.add(task)
+        scheduler.add(periodic(self.check_sync, 30 * 60))
+        while True:
+            scheduler.run_for(60 * 60)
+            print('Clock ticks:', self.jitter.summary())
+            print('Redraws:', self.redraws, 'frames,', self.redrawn, 'pixels')
+            if hasattr(self.network, 'summary'):
+                print('Network:', self.network.summary())
+                self.network.reset()
+            self.memtrace.dump()
+            self.jitter.reset()
+            self.redraws = self.redrawn = 0
+
+def run(mode):
+    """ Run the clock with sprite source mode ('pokemon', 'moon' or
+        'splash').
+    """
+    Clock(SOURCES[mode]()).run()
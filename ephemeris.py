@@ -0,0 +1,245 @@
+"""
+Offline moon ephemeris for the poke clock
+Works out the same lunar data the MET Norway API gives us (phase age,
+moonrise, moonset) plus the illuminated fraction, from latitude, longitude
+and the date, with no network at all. Positions come from the main terms
+of the lunar theory in Meeus, "Astronomical Algorithms" ch. 47 (the Sun
+from ch. 25), good to a few hundredths of a degree, so rise and set times
+land within a minute or two of the real thing.
+
+CircuitPython floats are single precision, so angles that grow by
+hundreds of thousands of degrees a century are never formed directly:
+see _angle(). Time is kept as whole days plus a fraction of a day.
+
+Written by Trevor Craig
+
+"""
+import math
+
+J2000 = 946728000 # 2000-01-01 12:00:00 UTC in epoch seconds (1970)
+RAD = math.pi / 180
+
+# Periodic terms for the Moon's longitude (l, 1e-6 degrees) and distance
+# (r, 1e-3 km): multiples of D, M, M', F
+LR_TERMS = (
+    (0, 0, 1, 0, 6288774, -20905355),
+    (2, 0, -1, 0, 1274027, -3699111),
+    (2, 0, 0, 0, 658314, -2955968),
+    (0, 0, 2, 0, 213618, -569925),
+    (0, 1, 0, 0, -185116, 48888),
+    (0, 0, 0, 2, -114332, -3149),
+    (2, 0, -2, 0, 58793, 246158),
+    (2, -1, -1, 0, 57066, -152138),
+    (2, 0, 1, 0, 53322, -170733),
+    (2, -1, 0, 0, 45758, -204586),
+    (0, 1, -1, 0, -40923, -129620),
+    (1, 0, 0, 0, -34720, 108743),
+    (0, 1, 1, 0, -30383, 104755),
+    (2, 0, 0, -2, 15327, 10321),
+    (0, 0, 1, 2, -12528, 0),
+    (0, 0, 1, -2, 10980, 79661),
+    (4, 0, -1, 0, 10675, -34782),
+    (0, 0, 3, 0, 10034, -23210),
+    (4, 0, -2, 0, 8548, -21636),
+    (2, 1, -1, 0, -7888, 24208),
+    (2, 1, 0, 0, -6766, 30824),
+    (1, 0, -1, 0, -5163, -8379),
+    (1, 1, 0, 0, 4987, -16675),
+    (2, -1, 1, 0, 4036, -12831),
+    (2, 0, 2, 0, 3994, -10445),
+    (4, 0, 0, 0, 3861, -11650),
+    (2, 0, -3, 0, 3665, 14403),
+    (0, 1, -2, 0, -2689, -7003),
+    (2, 0, -1, 2, -2602, 0),
+    (2, -1, -2, 0, 2390, 10056),
+    (1, 0, 1, 0, -2348, 6322),
+    (2, -2, 0, 0, 2236, -9884),
+    (0, 1, 2, 0, -2120, 5751),
+    (0, 2, 0, 0, -2069, 0),
+)
+
+# Periodic terms for the Moon's latitude (b, 1e-6 degrees)
+B_TERMS = (
+    (0, 0, 0, 1, 5128122),
+    (0, 0, 1, 1, 280602),
+    (0, 0, 1, -1, 277693),
+    (2, 0, 0, -1, 173237),
+    (2, 0, -1, 1, 55413),
+    (2, 0, -1, -1, 46271),
+    (2, 0, 0, 1, 32573),
+    (0, 0, 2, 1, 17198),
+    (2, 0, 1, -1, 9266),
+    (0, 0, 2, -1, 8822),
+    (2, -1, 0, -1, 8216),
+    (2, 0, -2, -1, 4324),
+    (2, 0, 1, 1, 4200),
+    (2, 1, 0, -1, -3359),
+    (2, -1, -1, 1, 2463),
+    (2, -1, 0, 1, 2211),
+    (2, -1, -1, -1, 2065),
+    (0, 1, -1, -1, -1870),
+    (4, 0, -1, -1, 1828),
+    (0, 1, 0, 1, -1794),
+    (0, 0, 0, 3, -1749),
+    (0, 1, -1, 1, -1565),
+    (1, 0, 0, 1, -1491),
+    (0, 1, 1, 1, -1475),
+    (0, 1, 1, -1, -1410),
+    (0, 1, 0, -1, -1344),
+    (1, 0, 0, -1, -1335),
+    (0, 0, 3, 1, 1107),
+)
+
+def _angle(base, whole, rate, day, fraction):
+    """ base + (whole + rate) * (day + fraction) degrees, reduced to 0-360
+        without ever holding the unreduced value in a float: the rate comes
+        as its whole degrees a day (an int, times the whole days in
+        integers) and the fraction of a degree left over, its own literal
+        so the board's 22-bit floats round that and not the whole rate.
+    """
+    return (base + (whole * day) % 360 + rate * day +
+            (whole + rate) * fraction) % 360
+
+def _days(epoch):
+    """ UTC epoch seconds -> (whole days, fraction of a day) since J2000. """
+    seconds = epoch - J2000
+    return seconds // 86400, (seconds % 86400) / 86400
+
+def moon_position(epoch):
+    """ Geocentric apparent position of the Moon at UTC epoch seconds:
+        (right ascension, declination, horizontal parallax) in degrees,
+        and the Moon's and Sun's ecliptic longitudes in degrees.
+    """
+    day, fraction = _days(epoch)
+    t = (day + fraction) / 36525 # Julian centuries, for the slow terms
+    moon = _angle(218.3164477, 13, 0.176396476, day, fraction) # L'
+    elong = _angle(297.8501921, 12, 0.190749118, day, fraction) # D
+    anomaly = _angle(357.5291092, 0, 0.985600281, day, fraction) # M
+    manomaly = _angle(134.9633964, 13, 0.064992950, day, fraction) # M'
+    node = _angle(93.2720950, 13, 0.229350241, day, fraction)  # F
+    a1 = (119.75 + 131.849 * t) * RAD
+    a2 = (53.09 + 479264.290 * t) % 360 * RAD
+    a3 = (313.45 + 481266.484 * t) % 360 * RAD
+    ecc = 1 - 0.002516 * t
+    d, m, mp, f = elong * RAD, anomaly * RAD, manomaly * RAD, node * RAD
+    sum_l = 3958 * math.sin(a1) + 1962 * math.sin((moon - node) * RAD) + \
+            318 * math.sin(a2)
+    sum_r = 0
+    for cd, cm, cmp, cf, coef_l, coef_r in LR_TERMS:
+        arg = cd * d + cm * m + cmp * mp + cf * f
+        scale = ecc ** abs(cm)
+        sum_l += coef_l * scale * math.sin(arg)
+        sum_r += coef_r * scale * math.cos(arg)
+    sum_b = -2235 * math.sin(moon * RAD) + 382 * math.sin(a3) + \
+            175 * math.sin(a1 - f) + 175 * math.sin(a1 + f) + \
+            127 * math.sin((moon - manomaly) * RAD) - \
+            115 * math.sin((moon + manomaly) * RAD)
+    for cd, cm, cmp, cf, coef_b in B_TERMS:
+        sum_b += coef_b * ecc ** abs(cm) * math.sin(
+            cd * d + cm * m + cmp * mp + cf * f)
+    longitude = (moon + sum_l / 1000000) % 360
+    latitude = sum_b / 1000000
+    distance = 385000.56 + sum_r / 1000
+    parallax = math.asin(6378.14 / distance) / RAD
+    # Sun, for the phase (Meeus ch. 25, low precision)
+    center = (1.914602 - 0.004817 * t) * math.sin(m) + \
+             0.019993 * math.sin(2 * m) + 0.000289 * math.sin(3 * m)
+    sun = (_angle(280.46646, 0, 0.985647358, day, fraction) + center) % 360
+    # Ecliptic -> equatorial
+    obliquity = (23.4392911 - 0.0130042 * t) * RAD
+    lon, lat = longitude * RAD, latitude * RAD
+    ra = math.atan2(math.sin(lon) * math.cos(obliquity) -
+                    math.tan(lat) * math.sin(obliquity), math.cos(lon))
+    dec = math.asin(math.sin(lat) * math.cos(obliquity) +
+                    math.cos(lat) * math.sin(obliquity) * math.sin(lon))
+    return ra / RAD % 360, dec / RAD, parallax, longitude, sun
+
+def phase(epoch):
+    """ (age, illuminated fraction) of the Moon at UTC epoch seconds. Age
+        goes 0.0 (new) through 0.5 (full) to 1.0 like PokeData.age; it's
+        the Moon-Sun elongation in longitude as a fraction of a turn.
+    """
+    _, _, _, moon, sun = moon_position(epoch)
+    elongation = (moon - sun) % 360
+    return elongation / 360, (1 - math.cos(elongation * RAD)) / 2
+
+def altitude(epoch, latitude, longitude):
+    """ Degrees of the Moon's centre above the point on the horizon where
+        its upper limb is just rising or setting (with refraction and
+        parallax, like the published times), at UTC epoch seconds.
+    """
+    ra, dec, parallax, _, _ = moon_position(epoch)
+    day, fraction = _days(epoch)
+    sidereal = _angle(280.46061837, 360, 0.98564736629, day,
+                      fraction)
+    hour = (sidereal + longitude - ra) * RAD
+    lat, dec = latitude * RAD, dec * RAD
+    alt = math.asin(math.sin(lat) * math.sin(dec) +
+                    math.cos(lat) * math.cos(dec) * math.cos(hour)) / RAD
+    return alt - (0.7275 * parallax - 0.5667)
+
+def _crossing(start, end, before, after, latitude, longitude):
+    """ Refine a horizon crossing bracketed by start/end (epoch seconds,
+        altitudes before/after) to about a second. Regula falsi with the
+        Illinois tweak, so a handful of evaluations is plenty.
+    """
+    side = 0
+    for _ in range(12):
+        # Whole seconds, kept an int: a board float only holds an epoch to
+        # the nearest 128 s
+        when = end - int(after * (end - start) / (after - before) + 0.5)
+        value = altitude(when, latitude, longitude)
+        if (value > 0) == (after > 0):
+            end, after = when, value
+            if side == -1:
+                before /= 2
+            side = -1
+        else:
+            start, before = when, value
+            if side == 1:
+                after /= 2
+            side = 1
+        if end - start < 2 or abs(value) < 0.0005:
+            break
+    return when
+
+def rise_set(midnight, latitude, longitude, step=3600):
+    """ (rise, set) UTC epoch seconds of the Moon during the 24 hours
+        starting at UTC epoch midnight, None for an event that doesn't
+        happen that day. Altitude is sampled every step seconds and
+        crossings refined in between.
+    """
+    rise = moonset = None
+    start, before = midnight, altitude(midnight, latitude, longitude)
+    while start < midnight + 86400:
+        end = min(start + step, midnight + 86400)
+        after = altitude(end, latitude, longitude)
+        if (before > 0) != (after > 0):
+            when = _crossing(start, end, before, after, latitude, longitude)
+            if after > 0 and rise is None:
+                rise = when
+            elif after <= 0 and moonset is None:
+                moonset = when
+        start, before = end, after
+    return rise, moonset
+
+def offset_seconds(utc_offset):
+    """ '+HH:MM' / '-HH:MM' -> seconds east of UTC. """
+    sign = -1 if utc_offset[0] == '-' else 1
+    return sign * (int(utc_offset[1:3]) * 3600 + int(utc_offset[4:6]) * 60)
+
+def fill(period, latitude, longitude, utc_offset):
+    """ Set a PokeData's elements (age, midnight, rise, set) for its date
+        by calculation instead of a MET Norway query. Times are local
+        epoch seconds like the rest of the clock (RTC runs on local time).
+        Also sets period.lit, the illuminated fraction at midnight.
+    """
+    offset = offset_seconds(utc_offset)
+    local = period.day_start()
+    midnight = int(local) - offset # Same instant in UTC
+    period.midnight = local
+    period.age, period.lit = phase(midnight)
+    rise, moonset = rise_set(midnight, float(latitude), float(longitude))
+    period.rise = rise and rise + offset
+    period.set = moonset and moonset + offset
+    return period
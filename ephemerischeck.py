@@ -0,0 +1,176 @@
+# Validation of ephemeris.py against recorded MET Norway responses
+# python ephemerischeck.py              check every fixture in fixtures/met
+#                                       (fails if there are none: record a
+#                                       few latitudes, dates and offsets)
+# python ephemerischeck.py --record LAT LON YYYY-MM-DD OFFSET [DAYS]
+#                                       save a live response as a fixture
+# python ephemerischeck.py --ephem      also check against PyEphem, if it's
+#                                       installed (no network needed)
+# python ephemerischeck.py --board      run ephemeris.py with every float
+#                                       rounded as the board's are (22-bit
+#                                       mantissa), not the host's doubles
+# Written By Trevor Craig
+
+# Libraries
+import ast
+import calendar
+import json
+import math
+import os
+import sys
+import time
+from urllib.request import Request, urlopen
+import ephemeris
+
+FIXTURES="fixtures/met"
+URL="https://api.met.no/weatherapi/sunrise/2.0/.json?lat={}&lon={}&date={}&offset={}&days={}"
+RISE_SET_MINUTES=2  # Allowed error in rise/set times
+AGE_PERCENT=1       # Allowed error in moonphase value (0-100 scale)
+BOARD_BITS=22       # Mantissa bits of a CircuitPython float (30-bit floats)
+
+def LocalEpoch(isotime):
+    # '2022-11-28T11:27:00-05:00' -> local time as epoch seconds, the way
+    # the clock keeps it (utils.parse_time then time.mktime on the board)
+    return(calendar.timegm(time.strptime(isotime[:19],"%Y-%m-%dT%H:%M:%S")))
+
+def Record(lat,lon,date,offset,days=15):
+    url=URL.format(lat,lon,date,offset,days)
+    request=Request(url,headers={"User-Agent":"PokeClock ephemeris check"})
+    with urlopen(request,timeout=30) as response:
+        data=json.load(response)
+    os.makedirs(FIXTURES,exist_ok=True)
+    name=f"{FIXTURES}/{lat}_{lon}_{date}_{offset.replace(':','')}.json"
+    with open(name,"w") as fixture:
+        json.dump({"latitude":lat,"longitude":lon,"offset":offset,
+                   "response":data},fixture,indent=1)
+    print(f"Saved {name}")
+
+def BoardFloat(value,bits=BOARD_BITS):
+    # value rounded to bits of mantissa if it's a float (ints are exact
+    # on the board too, it has long ints)
+    if type(value) is not float or value==0 or math.isinf(value) or math.isnan(value):
+        return(value)
+    (mantissa,exponent)=math.frexp(value)
+    return(math.ldexp(round(mantissa*(1<<bits))/(1<<bits),exponent))
+
+class RoundFloats(ast.NodeTransformer):
+    # Wraps every float literal, arithmetic result and call result in
+    # _board(), and turns 'x op= y' into 'x = _board(x op y)'
+    def wrap(self,node):
+        return(ast.copy_location(ast.Call(ast.Name("_board",ast.Load()),[node],[]),node))
+    def visit_Constant(self,node):
+        return(self.wrap(node) if type(node.value) is float else node)
+    def visit_BinOp(self,node):
+        return(self.wrap(self.generic_visit(node)))
+    def visit_UnaryOp(self,node):
+        return(self.wrap(self.generic_visit(node)))
+    def visit_Call(self,node):
+        return(self.wrap(self.generic_visit(node)))
+    def visit_AugAssign(self,node):
+        node=self.generic_visit(node)
+        value=ast.BinOp(ast.Name(node.target.id,ast.Load()),node.op,node.value)
+        return(ast.copy_location(ast.Assign([node.target],self.wrap(value)),node))
+
+def BoardEphemeris(bits=BOARD_BITS):
+    # ephemeris.py as a new module that keeps every float to bits of
+    # mantissa, the way it runs on the Matrix Portal
+    with open(ephemeris.__file__) as source:
+        tree=RoundFloats().visit(ast.parse(source.read()))
+    module=type(ephemeris)("ephemeris_board")
+    module._board=lambda value: BoardFloat(value,bits)
+    exec(compile(ast.fix_missing_locations(tree),ephemeris.__file__,"exec"),module.__dict__)
+    return(module)
+
+class Day():
+    # Just enough of utils.PokeData for ephemeris.fill()
+    def __init__(self,midnight):
+        self.midnight=midnight
+    def day_start(self):
+        return(self.midnight)
+
+def Compare(label,expected,got,errors):
+    # Minutes between two local epochs (either may be None)
+    if expected is None or got is None:
+        if expected!=got:
+            print(f"  {label}: expected {expected}, got {got}")
+            errors.append(float("inf"))
+        return
+    errors.append(abs(expected-got)/60)
+
+def CheckFixtures():
+    errors=[]
+    phases=[]
+    files=sorted(f for f in os.listdir(FIXTURES) if f.endswith(".json")) if os.path.isdir(FIXTURES) else []
+    for file in files:
+        with open(f"{FIXTURES}/{file}") as fixture:
+            fixture=json.load(fixture)
+        for entry in fixture["response"]["location"]["time"]:
+            if "moonphase" not in entry:
+                continue
+            day=ephemeris.fill(Day(LocalEpoch(entry["moonphase"]["time"])),
+                               fixture["latitude"],fixture["longitude"],
+                               fixture["offset"])
+            age=float(entry["moonphase"]["value"])
+            phases.append(abs((day.age*100-age+50)%100-50))
+            for (name,mine) in (("moonrise",day.rise),("moonset",day.set)):
+                expected=LocalEpoch(entry[name]["time"]) if name in entry else None
+                Compare(f"{file} {entry['date']} {name}",expected,mine,errors)
+    return(files,errors,phases)
+
+def CheckEphem():
+    # Reference check against PyEphem's full lunar theory for a spread of
+    # places and dates, with the same horizon definition as MET Norway
+    import ephem
+    errors=[]
+    phases=[]
+    places=((40.7,-74.0),(51.5,0.0),(-33.9,151.2),(60.0,10.7),(35.7,139.7),(0.0,0.0))
+    for (lat,lon) in places:
+        for k in range(61):
+            midnight=calendar.timegm((2024,1,1,0,0,0))+k*6*86400
+            day=ephemeris.fill(Day(midnight),lat,lon,"+00:00")
+            moon=ephem.Moon(ephem.Date(time.strftime("%Y/%m/%d %H:%M:%S",time.gmtime(midnight))))
+            phases.append(abs(moon.moon_phase-day.lit)*100)
+            observer=ephem.Observer()
+            observer.lat,observer.lon=str(lat),str(lon)
+            observer.date=ephem.Date(time.strftime("%Y/%m/%d %H:%M:%S",time.gmtime(midnight)))
+            for (finder,mine) in ((observer.next_rising,day.rise),(observer.next_setting,day.set)):
+                try:
+                    when=finder(ephem.Moon()).datetime()
+                    when=calendar.timegm(when.timetuple())+when.microsecond/1e6
+                    if when>=midnight+86400:
+                        when=None
+                except ephem.CircumpolarError:
+                    when=None
+                # Events within a minute of midnight can fall either side
+                if when is not None and mine is None and (when-midnight<60 or midnight+86400-when<60):
+                    continue
+                Compare(f"{lat},{lon} {time.strftime('%Y-%m-%d',time.gmtime(midnight))}",when,mine,errors)
+    return(errors,phases)
+
+def Summary(name,errors,phases,phase_limit):
+    if not errors:
+        print(f"{name}: nothing to compare")
+        return(False)
+    worst=max(errors)
+    print(f"{name}: {len(errors)} rise/set times, mean error "
+          f"{sum(e for e in errors if e!=float('inf'))/len(errors):.2f} min, worst {worst:.2f} min; "
+          f"phase worst {max(phases):.2f}%")
+    return(worst<=RISE_SET_MINUTES and max(phases)<=phase_limit)
+
+def main(args):
+    global ephemeris
+    if args[:1]==["--record"]:
+        Record(*args[1:])
+        return(True)
+    if "--board" in args:
+        ephemeris=BoardEphemeris()
+        print(f"Floats rounded to {BOARD_BITS} mantissa bits, as on the board")
+    (files,errors,phases)=CheckFixtures()
+    ok=Summary(f"MET Norway fixtures ({len(files)} files)",errors,phases,AGE_PERCENT)
+    if "--ephem" in args:
+        (errors,phases)=CheckEphem()
+        ok=Summary("PyEphem",errors,phases,AGE_PERCENT) and ok
+    return(ok)
+
+if __name__ == "__main__":
+    sys.exit(0 if main(sys.argv[1:]) else 1)
@@ -0,0 +1,94 @@
+# Compiles the glyphs the clock actually draws out of the BDF fonts into
+# small binary files for glyphfont.py, so the board doesn't parse BDF text
+# at every boot
+# Written By Trevor Craig
+
+# Libraries
+import struct
+import time
+from glyphfont import MAGIC, HEADER, GLYPH
+
+# Fonts used by code.py/poke.py and the characters drawn with each. Extra
+# letters in the small font are for the 'AWOO' splash fallback label.
+FONTS={
+    "fonts/helvB12": "0123456789:",
+    "fonts/helvR10": "0123456789:/.%AWO",
+    "fonts/6x10": "\u21A5\u21A7x",
+}
+
+def ParseBDF(path,characters):
+    # Returns (bounding box, ascent, descent, {code point: glyph}) where a
+    # glyph is (width, height, dx, dy, shift_x, shift_y, rows of 0/1)
+    wanted=set(ord(c) for c in characters)
+    glyphs={}
+    box=(0,0,0,0)
+    ascent=descent=0
+    with open(path) as bdf:
+        lines=iter(bdf.read().splitlines())
+    for line in lines:
+        words=line.split()
+        if not words:
+            continue
+        if words[0]=="FONTBOUNDINGBOX":
+            box=tuple(int(w) for w in words[1:5])
+        elif words[0]=="FONT_ASCENT":
+            ascent=int(words[1])
+        elif words[0]=="FONT_DESCENT":
+            descent=int(words[1])
+        elif words[0]=="ENCODING":
+            code=int(words[1])
+        elif words[0]=="DWIDTH":
+            shift=(int(words[1]),int(words[2]))
+        elif words[0]=="BBX":
+            bounds=tuple(int(w) for w in words[1:5])
+        elif words[0]=="BITMAP":
+            rows=[]
+            for row in lines:
+                if row.startswith("ENDCHAR"):
+                    break
+                bits=int(row,16)
+                length=len(row.strip())*4
+                rows.append([(bits>>(length-1-x))&1 for x in range(bounds[0])])
+            if code in wanted:
+                glyphs[code]=bounds+shift+(rows,)
+    return(box,ascent,descent,glyphs)
+
+def CompileFont(path,characters,output=None):
+    (box,ascent,descent,glyphs)=ParseBDF(path+".bdf",characters)
+    missing=set(ord(c) for c in characters)-set(glyphs)
+    if missing:
+        print(f"{path}: not in font: {''.join(chr(c) for c in sorted(missing))}")
+    data=bytearray(struct.pack(HEADER,MAGIC,len(glyphs),*box,ascent,descent))
+    for code in sorted(glyphs):
+        (width,height,dx,dy,shift_x,shift_y,rows)=glyphs[code]
+        data+=struct.pack(GLYPH,code,width,height,dx,dy,shift_x,shift_y)
+        for row in rows[:height]:
+            data+=bytes(row)
+    output=output or path+".glf"
+    with open(output,"wb") as glf:
+        glf.write(data)
+    print(f"{output}: {len(glyphs)} glyphs, {len(data)} bytes")
+    return(output)
+
+def Benchmark(repeat=20):
+    # Boot-time font loading, BDF (adafruit_bitmap_font, as the board did
+    # it) vs compiled. Needs displayio/fontio, e.g. from Adafruit Blinka.
+    from adafruit_bitmap_font import bitmap_font
+    import glyphfont
+    for (path,characters) in FONTS.items():
+        start=time.perf_counter()
+        for _ in range(repeat):
+            bitmap_font.load_font(path+".bdf").load_glyphs(characters)
+        bdf=(time.perf_counter()-start)/repeat
+        start=time.perf_counter()
+        for _ in range(repeat):
+            glyphfont.load_font(path,characters)
+        glf=(time.perf_counter()-start)/repeat
+        print(f"  {path:<16} BDF {bdf*1000:8.2f} ms  compiled {glf*1000:8.2f} ms  ({bdf/glf:.0f}x)")
+
+def main():
+    for (path,characters) in FONTS.items():
+        CompileFont(path,characters)
+
+if __name__ == "__main__":
+    main()
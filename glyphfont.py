@@ -0,0 +1,79 @@
+"""
+Precompiled fonts for the poke clock
+Loads the small glyph files made by fontcompiler.py in one read, instead
+of scanning a BDF text file for each glyph at every boot. The font object
+works wherever an adafruit_bitmap_font font does (Label etc).
+
+Written by Trevor Craig
+
+"""
+import struct
+
+# File layout (little-endian): header, then per glyph a record followed by
+# width * height bytes of pixels (0 or 1), row by row. One byte per pixel
+# so each glyph can go straight into its Bitmap with bitmaptools.
+MAGIC = b'PKF1'
+HEADER = '<4sHbbbbbb'  # magic, glyph count, bounding box w/h/x/y, ascent,
+                       # descent
+GLYPH = '<HBBbbbb'     # code point, width, height, dx, dy, shift_x, shift_y
+HEADER_SIZE = struct.calcsize(HEADER)
+GLYPH_SIZE = struct.calcsize(GLYPH)
+
+try:
+    from bitmaptools import arrayblit
+except ImportError:
+    arrayblit = None
+
+class GlyphFont():
+    """ Font with a fixed set of glyphs, all loaded up front. """
+    def __init__(self, path):
+        # Board modules, imported here so fontcompiler.py can share this
+        # file's format on a desktop without them
+        import displayio
+        from fontio import Glyph
+        with open(path, 'rb') as font_file:
+            data = font_file.read()
+        (magic, count, width, height, x_offset, y_offset, self.ascent,
+         self.descent) = struct.unpack_from(HEADER, data)
+        if magic != MAGIC:
+            raise ValueError('Not a compiled font: ' + path)
+        self._boundingbox = (width, height, x_offset, y_offset)
+        self._glyphs = {}
+        offset = HEADER_SIZE
+        for _ in range(count):
+            code_point, width, height, dx, dy, shift_x, shift_y = \
+                struct.unpack_from(GLYPH, data, offset)
+            offset += GLYPH_SIZE
+            bitmap = displayio.Bitmap(max(width, 1), max(height, 1), 2)
+            pixels = memoryview(data)[offset:offset + width * height]
+            if arrayblit and width and height:
+                arrayblit(bitmap, pixels, 0, 0, width, height)
+            else:
+                for index in range(width * height):
+                    if pixels[index]:
+                        bitmap[index] = 1
+            offset += width * height
+            self._glyphs[code_point] = Glyph(bitmap, 0, width, height, dx, dy,
+                                             shift_x, shift_y)
+
+    def get_bounding_box(self):
+        return self._boundingbox
+
+    def get_glyph(self, code_point):
+        return self._glyphs.get(code_point)
+
+    def load_glyphs(self, code_points):
+        """ Everything is loaded already; here so Label can call it. """
+
+def load_font(path, glyphs):
+    """ Font for path (no extension): the compiled .glf if it's there,
+        else the .bdf through adafruit_bitmap_font with glyphs loaded. The
+        BDF library is only imported when it's needed.
+    """
+    try:
+        return GlyphFont(path + '.glf')
+    except (OSError, ValueError):
+        from adafruit_bitmap_font import bitmap_font
+        font = bitmap_font.load_font(path + '.bdf')
+        font.load_glyphs(glyphs)
+        return font
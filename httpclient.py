@@ -0,0 +1,457 @@
+"""
+HTTP client for the poke clock
+Every fetch (WorldTimeAPI, geoplugin, MET Norway) goes through one
+requests session that keeps its socket to each host open between calls,
+so the ESP32 only does a connection and TLS handshake when the server has
+dropped it. Answers carrying an ETag or Last-Modified are asked for again
+with If-None-Match / If-Modified-Since, and a 304 reuses the values from
+last time -- only for URLs that have come up before, so one-off queries
+(MET Norway's change date every time) don't hold values in RAM. The
+body is read a chunk at a time and only the json_path values are kept,
+instead of the whole document being parsed into RAM.
+
+Written by Trevor Craig
+
+"""
+import json
+import time
+
+# Byte values the scanner looks for
+QUOTE = 34         # "
+COLON = 58         # :
+COMMA = 44         # ,
+OPEN_OBJECT = 123  # {
+CLOSE_OBJECT = 125 # }
+OPEN_ARRAY = 91    # [
+CLOSE_ARRAY = 93   # ]
+WHITESPACE = b' \t\r\n'
+ENDS_SCALAR = b' \t\r\n,}]'
+
+# Path entry standing for every index of an array: the value at such a
+# path is a list, one entry (None if it's missing) per element
+EACH = -1
+
+# What the scanner expects next
+VALUE = 0  # A value (or ']' straight after '[')
+KEY = 1    # A key string (or '}' straight after '{')
+COLON_ = 2 # The ':' after a key
+AFTER = 3  # ',' or the end of the container
+STRING = 4 # More of a string
+SCALAR = 5 # More of a number, true, false or null
+DONE = 6   # End of the document
+
+def _matches(path, stack):
+    """ True if the keys and indices down to a value (the scanner's stack)
+        fit the start of path, EACH fitting any index.
+    """
+    for index in range(len(stack)):
+        key = stack[index][0]
+        if path[index] != key and not (path[index] == EACH and
+                                       isinstance(key, int)):
+            return False
+    return True
+
+class PathScanner():
+    """ Pulls the values at paths (lists of object keys and array indices,
+        like fetch_data()'s json_path, or EACH) out of a JSON document fed
+        to it a chunk at a time. Only the text of the values asked for is
+        kept and parsed; everything else is stepped over keeping no more
+        than the keys on the way down to it. A path with EACH in it gets
+        a list, filled in an array element at a time, so a long array of
+        records costs only the fields asked for (with more than one EACH,
+        the innermost array's elements, end to end). Paths inside a value
+        that's asked for too come out of it at the end; EACH ones can't.
+    """
+    def __init__(self, paths):
+        self.paths = [tuple(path) for path in paths]
+        self.repeats = [EACH in path for path in self.paths]
+        self.values = [[] if repeat else None for repeat in self.repeats]
+        self.found = [False] * len(self.paths) # For EACH paths, this element
+        self.left = self.repeats.count(False) # Other paths still to find
+        self.mode = VALUE
+        self._stack = []     # [key or index, is_array, wanted, each] per
+                             # container, each the EACH paths it's the
+                             # array of
+        self._key = None     # Bytes of the key being read, if it's wanted
+        self._is_key = False # String being read is a key
+        self._escape = False # Last string byte was a backslash
+        self._capture = None # Text of the value being kept...
+        self._target = -1    # ...which is paths[self._target]
+        self._depth = 0      # Containers open when it started
+
+    def done(self):
+        """ True once every path is found (the rest of the document can
+            be skipped) or the document has ended.
+        """
+        return self.mode == DONE or (self.left == 0 and
+                                     True not in self.repeats)
+
+    def _wanted(self):
+        """ True if a path still to find goes through the value starting
+            now.
+        """
+        depth = len(self._stack)
+        for index in range(len(self.paths)):
+            if (not self.found[index] and len(self.paths[index]) > depth and
+                    _matches(self.paths[index], self._stack)):
+                return True
+        return False
+
+    def _begin(self):
+        """ A value starts: keep it if it's one of the paths (paths inside
+            a value already being kept come out of that at the end).
+        """
+        if self._capture is not None or (self._stack and
+                                         not self._stack[-1][2]):
+            return
+        depth = len(self._stack)
+        for index in range(len(self.paths)):
+            if (not self.found[index] and len(self.paths[index]) == depth and
+                    _matches(self.paths[index], self._stack)):
+                self._capture = bytearray()
+                self._target = index
+                self._depth = len(self._stack)
+                return
+
+    def _end(self):
+        """ The value being kept is complete. """
+        value = json.loads(str(self._capture, 'utf-8'))
+        target = self._target
+        self._capture = None
+        self._target = -1
+        if self.repeats[target]:
+            self.values[target].append(value)
+            self.found[target] = True
+            return
+        outer = self.paths[target]
+        for index in range(len(self.paths)):
+            path = self.paths[index]
+            if (self.found[index] or self.repeats[index] or
+                    path[:len(outer)] != outer):
+                continue
+            inner = value
+            try:
+                for key in path[len(outer):]:
+                    inner = inner[key]
+            except (KeyError, IndexError, TypeError):
+                continue # Not there, finish() says so
+            self.values[index] = inner
+            self.found[index] = True
+            self.left -= 1
+
+    def _element(self, each):
+        """ An element of an EACH array is over: its paths (indices each)
+            not found in it get None, and are looked for again in the next.
+        """
+        for index in each:
+            if not self.found[index]:
+                self.values[index].append(None)
+            self.found[index] = False
+
+    def _open(self, is_array):
+        """ A container starts: its keys (or indices) are only worth
+            reading if a path still to find goes through it.
+        """
+        wanted = ((not self._stack or self._stack[-1][2]) and
+                  self._wanted())
+        each = None
+        if is_array and wanted:
+            depth = len(self._stack)
+            each = [index for index in range(len(self.paths))
+                    if self.repeats[index] and len(self.paths[index]) > depth
+                    and self.paths[index][depth] == EACH and
+                    EACH not in self.paths[index][depth + 1:] and
+                    _matches(self.paths[index], self._stack)]
+        self._stack.append([0 if is_array else None, is_array, wanted, each])
+
+    def _close(self, empty=False):
+        each = self._stack.pop()[3]
+        if each and not empty:
+            self._element(each) # Last one
+        if self._capture is not None and len(self._stack) == self._depth:
+            self._end()
+        self.mode = AFTER if self._stack else DONE
+
+    def _string(self, chunk, start):
+        """ Step through string bytes from chunk[start]; returns where
+            the string ended, or len(chunk) if it goes on.
+        """
+        index = start
+        end = len(chunk)
+        while index < end:
+            if self._escape:
+                self._escape = False
+                index += 1
+                continue
+            quote = chunk.find(b'"', index)
+            slash = chunk.find(b'\\', index)
+            if slash != -1 and (quote == -1 or slash < quote):
+                self._escape = True
+                index = slash + 1
+                continue
+            if quote == -1:
+                break
+            self._keep(chunk, start, quote + 1)
+            if self._is_key:
+                if self._key is not None:
+                    self._key = self._key[:-1] # Closing quote
+                self.mode = COLON_
+            else:
+                self.mode = AFTER
+                if (self._capture is not None and
+                        len(self._stack) == self._depth):
+                    self._end()
+            return quote + 1
+        self._keep(chunk, start, end)
+        return end
+
+    def _keep(self, chunk, start, end):
+        """ Hold on to chunk[start:end] if it's part of something kept. """
+        if self._capture is not None:
+            self._capture += chunk[start:end]
+        if self._is_key and self._key is not None:
+            self._key += chunk[start:end]
+
+    def _got_key(self):
+        """ A key's been read, it names the next value. """
+        entry = self._stack[-1]
+        key = self._key
+        self._key = None
+        if key is None:
+            return
+        key = str(key, 'utf-8')
+        entry[0] = json.loads('"' + key + '"') if '\\' in key else key
+
+    def feed(self, chunk):
+        """ Scan the next chunk (bytes) of the document. """
+        index = 0
+        end = len(chunk)
+        repeats = True in self.repeats
+        while index < end and (self.left or repeats) and self.mode != DONE:
+            mode = self.mode
+            if mode == STRING:
+                index = self._string(chunk, index)
+                continue
+            byte = chunk[index]
+            if mode == SCALAR:
+                if byte in ENDS_SCALAR:
+                    self.mode = AFTER
+                    if (self._capture is not None and
+                            len(self._stack) == self._depth):
+                        self._end()
+                    continue # Same byte again, as a delimiter
+                if self._capture is not None:
+                    self._capture.append(byte)
+                index += 1
+                continue
+            if byte in WHITESPACE:
+                if self._capture is not None:
+                    self._capture.append(byte)
+                index += 1
+                continue
+            if mode == VALUE:
+                if byte == CLOSE_ARRAY and self._stack and self._stack[-1][1]:
+                    if self._capture is not None:
+                        self._capture.append(byte)
+                    self._close(True)
+                    index += 1
+                    continue
+                self._begin()
+                if self._capture is not None:
+                    self._capture.append(byte)
+                if byte == OPEN_OBJECT:
+                    self._open(False)
+                    self.mode = KEY
+                elif byte == OPEN_ARRAY:
+                    self._open(True)
+                    self.mode = VALUE
+                elif byte == QUOTE:
+                    self._is_key = False
+                    self.mode = STRING
+                else:
+                    self.mode = SCALAR
+                index += 1
+            elif mode == KEY:
+                if self._capture is not None:
+                    self._capture.append(byte)
+                if byte == QUOTE:
+                    self._is_key = True
+                    self._key = bytearray() if self._stack[-1][2] else None
+                    self.mode = STRING
+                elif byte == CLOSE_OBJECT:
+                    self._close()
+                else:
+                    raise ValueError('Bad JSON: expected a key')
+                index += 1
+            elif mode == COLON_:
+                if self._is_key:
+                    self._got_key()
+                    self._is_key = False
+                if byte != COLON:
+                    raise ValueError('Bad JSON: expected :')
+                if self._capture is not None:
+                    self._capture.append(byte)
+                self.mode = VALUE
+                index += 1
+            else: # AFTER
+                if self._capture is not None:
+                    self._capture.append(byte)
+                if byte == COMMA:
+                    entry = self._stack[-1] if self._stack else None
+                    if entry is None:
+                        raise ValueError('Bad JSON: , at top level')
+                    if entry[1]:
+                        if entry[3]:
+                            self._element(entry[3])
+                        entry[0] += 1
+                        self.mode = VALUE
+                    else:
+                        self.mode = KEY
+                elif byte in (CLOSE_OBJECT, CLOSE_ARRAY):
+                    self._close()
+                else:
+                    raise ValueError('Bad JSON: expected , or end')
+                index += 1
+
+    def finish(self):
+        """ Values in the same form as fetch_data(): the one value for one
+            path, else a list. Raises KeyError for a path not found.
+        """
+        if self.mode == SCALAR and self._capture is not None:
+            self._end() # Document was a bare number etc.
+        for index in range(len(self.paths)):
+            if not (self.found[index] or self.repeats[index]):
+                raise KeyError(self.paths[index])
+        if len(self.values) == 1:
+            return self.values[0]
+        return self.values
+
+def _header(headers, name):
+    """ Header name (lower case) from a response's headers, whichever
+        case the library keeps them in.
+    """
+    for key in headers:
+        if key.lower() == name:
+            return headers[key]
+    return None
+
+def _host(url):
+    """ 'https://api.met.no/weatherapi/...' -> 'api.met.no' """
+    host = url.split('://', 1)[-1].split('/', 1)[0]
+    return host.split(':', 1)[0]
+
+class HttpClient():
+    """ fetch_data() like adafruit_matrixportal's Network, over session
+        (an adafruit_requests Session, or anything with the same get()
+        and responses). Keeps the validators and values of up to
+        `remember` URLs for conditional requests, only once a URL has been
+        fetched a second time (the last `remember` URLs seen are kept as
+        hashes to tell), and counts requests, bytes read, 304s and new
+        connections for summary().
+    """
+    def __init__(self, session, chunk_size=256, remember=4):
+        self.session = session
+        self.chunk_size = chunk_size
+        self.remember = remember
+        self._validators = {} # url: (json_path, ETag, Last-Modified, values)
+        self._seen = [] # hash() of the last `remember` URLs fetched
+        self.reset()
+
+    def reset(self):
+        """ Start counting again. """
+        self.requests = 0
+        self.bytes = 0
+        self.not_modified = 0
+        self.handshakes = 0
+        self.started = time.monotonic()
+
+    def _connected(self, host):
+        """ True if the session has a socket open to host already. """
+        session = getattr(self.session, '_default_session', self.session)
+        sockets = getattr(session, '_open_sockets', None)
+        if not sockets:
+            return False # Or can't tell: counted as a new connection
+        for key in sockets:
+            if key[0] == host:
+                return True
+        return False
+
+    def fetch_data(self, url, json_path=None):
+        """ GET url and return the values at json_path (a list of paths,
+            see PathScanner), or the whole document without one. Raises
+            OSError for an HTTP error status and KeyError for a missing
+            path, like the Network version.
+        """
+        paths = json_path or [[]]
+        cached = self._validators.get(url)
+        if cached and cached[0] != paths:
+            cached = None # Same URL, other fields
+        headers = {}
+        if cached:
+            if cached[1]:
+                headers['If-None-Match'] = cached[1]
+            if cached[2]:
+                headers['If-Modified-Since'] = cached[2]
+        if not self._connected(_host(url)):
+            self.handshakes += 1
+        response = self.session.get(url, headers=headers, stream=True)
+        self.requests += 1
+        try:
+            status = response.status_code
+            scanner = PathScanner(paths) if status == 200 else None
+            # The body is read to the end even once the values are found
+            # (just counted then), so the socket goes back to the session
+            # ready for the next request
+            for chunk in response.iter_content(chunk_size=self.chunk_size):
+                self.bytes += len(chunk)
+                if scanner and not scanner.done():
+                    scanner.feed(chunk)
+            if status == 304 and cached:
+                self.not_modified += 1
+                return cached[3]
+            if status != 200:
+                raise OSError('HTTP ' + str(status) + ' from ' + url)
+            values = scanner.finish()
+            etag = _header(response.headers, 'etag')
+            modified = _header(response.headers, 'last-modified')
+            if (etag or modified) and self._repeated(url):
+                if (url not in self._validators and
+                        len(self._validators) >= self.remember):
+                    del self._validators[next(iter(self._validators))]
+                self._validators[url] = (paths, etag, modified, values)
+            return values
+        finally:
+            response.close()
+
+    def _repeated(self, url):
+        """ True if url was fetched before (and is worth remembering), else
+            notes it as seen.
+        """
+        if url in self._validators:
+            return True
+        key = hash(url)
+        if key in self._seen:
+            self._seen.remove(key)
+            return True
+        self._seen.append(key)
+        if len(self._seen) > self.remember:
+            self._seen.pop(0)
+        return False
+
+    def summary(self):
+        """ One line for the serial console. """
+        hours = max(time.monotonic() - self.started, 1) / 3600
+        return ('{} requests, {} bytes, {} not modified, '
+                '{:.1f} handshakes/hour').format(
+                    self.requests, self.bytes, self.not_modified,
+                    self.handshakes / hours)
+
+def client(network):
+    """ HttpClient over network's (adafruit_matrixportal Network's)
+        requests session, or network itself if it doesn't have one (a
+        desktop stand-in, say).
+    """
+    session = getattr(getattr(network, '_wifi', None), 'requests', None)
+    if session is None:
+        return network
+    return HttpClient(session)
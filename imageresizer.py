@@ -4,18 +4,165 @@
 # Started on November 22, 2022
 
 # Libraries
-from PIL import Image
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageChops, ImageStat
+import hashlib
+import json
+import math
 import os
+import struct
+import time
+from catalog import build_catalog, list_sprites
+from animation import HEADER as ANIMATION_HEADER, MAGIC as ANIMATION_MAGIC
+from animation import RECORD as ANIMATION_RECORD
+
+try:
+    import numpy
+except ImportError:
+    numpy=None # Only the batched path (LoadBatch...VectorConvert) needs it
+
+# Sprite settings, part of the batch manifest so changing them reconverts.
+# Bump MANIFEST_VERSION whenever a conversion's output changes for the
+# same settings.
+SIZE=32
+WADJ=16
+HADJ=16#20
+MANIFEST_VERSION=2
+RGB565="rgb565" # colors setting for sprites in the matrix's own 16-bit format
+BITPLANES=6     # Colour depth the matrix shows (code.py's BITPLANES)
+
+# 4x4 Bayer matrix: an ordered dither stays put from one refresh (and one
+# sprite) to the next, where error diffusion crawls on an LED panel
+BAYER=((0,8,2,10),(12,4,14,6),(3,11,1,9),(15,7,13,5))
+
+# Size of the 32-bit BMP that Pillow writes for a 32x32 sprite
+TRUECOLOR_BYTES=54+SIZE*SIZE*4
 
  # We need to end with a 32*32 BMP File
-def ResizeImage(Input,Output):
-    img=Image.open(Input)
+def CropResize(Input):
+    return(CropResizeImage(Image.open(Input)))
+
+def CropResizeImage(img):
     (w, h) = img.size
-    wadj=16
-    hadj=16#20
-    img = img.crop((wadj, hadj, w-wadj, h))#(left, upper, right, lower)
-    res_img = img.resize((32,32))
-    res_img.save(Output)
+    img = img.crop((WADJ, HADJ, w-WADJ, h))#(left, upper, right, lower)
+    res_img = img.resize((SIZE,SIZE))
+    return(res_img)
+
+def ResizeImage(Input,Output,colors=None):
+    # colors=16 or 256 writes a 4- or 8-bit indexed BMP instead, RGB565 a
+    # 16-bit one dithered to BITPLANES (returned as the panel shows it)
+    res_img=CropResize(Input)
+    if colors==RGB565:
+        WriteRGB565BMP(res_img,Output)
+        res_img=Image.open(Output).convert("RGB")
+    elif colors:
+        res_img=Palettize(res_img,colors)
+        WriteIndexedBMP(res_img,Output)
+    else:
+        res_img.save(Output)
+    return(res_img)
+
+def Flatten(img):
+    # The matrix has no alpha, transparent pixels are just black (LEDs off)
+    img=img.convert("RGBA")
+    background=Image.new("RGBA",img.size,(0,0,0,255))
+    return(Image.alpha_composite(background,img).convert("RGB"))
+
+def Palettize(img,colors=16):
+    return(Flatten(img).quantize(colors=colors,dither=Image.Dither.NONE))
+
+def WriteIndexedBMP(img,Output):
+    # Pillow can only write 8-bit palette BMPs, so do it by hand. Uses 4 bits
+    # per pixel when the palette fits in 16 entries, and only stores the
+    # palette entries actually used. OnDiskBitmap reads both.
+    (w, h) = img.size
+    used=img.getextrema()[1]+1
+    bits=4 if used<=16 else 8
+    stride=((w*bits+31)//32)*4
+    data=img.tobytes() # One index per pixel, top row first
+    pixels=bytearray()
+    for y in range(h-1,-1,-1): # BMP rows go bottom to top
+        row=data[y*w:(y+1)*w]
+        if bits==4:
+            row+=bytes(w%2)
+            row=bytes(row[x]<<4|row[x+1] for x in range(0,len(row),2))
+        pixels+=row+bytes(stride-len(row))
+    return(WriteBMP(Output,w,h,bits,img.getpalette()[:used*3],pixels))
+
+def WriteBMP(Output,w,h,bits,palette,pixels):
+    # An indexed BMP of pixels (rows bottom to top, already padded) with
+    # palette as R, G, B values
+    used=len(palette)//3
+    offset=14+40+used*4
+    with open(Output,"wb") as bmp:
+        bmp.write(struct.pack("<2sIHHI",b"BM",offset+len(pixels),0,0,offset))
+        bmp.write(struct.pack("<IiiHHIIiiII",40,w,h,1,bits,0,len(pixels),
+                              3780,3780,used,used))
+        for i in range(used):
+            r,g,b=palette[i*3:i*3+3]
+            bmp.write(bytes((b,g,r,0)))
+        bmp.write(pixels)
+    return(offset+len(pixels))
+
+def ChannelBits(bitplanes=BITPLANES):
+    # Bits of red, green and blue the matrix shows: RGB565's 5, 6 and 5,
+    # or fewer with fewer bitplanes (it keeps the top bits)
+    return((min(5,bitplanes),min(6,bitplanes),min(5,bitplanes)))
+
+def RGB565Rows(img,bitplanes=BITPLANES,dither=True):
+    # img as RGB565 BMP rows, bottom to top, one row at a time. Each
+    # channel is cut to the bits the matrix shows, with a Bayer dither
+    # (or rounded, without) and then filled out to its RGB565 field so
+    # those top bits are exact. Black stays black: the dither never
+    # lights a pixel that's off.
+    img=Flatten(img)
+    (w, h) = img.size
+    data=img.tobytes()
+    fields=((5,11),(6,5),(5,0)) # Bits and shift of R, G, B in RGB565
+    channels=[]
+    for (keep,(field,shift)) in zip(ChannelBits(bitplanes),fields):
+        levels=(1<<keep)-1
+        # Level -> RGB565 field value, e.g. 4 bits 0b1011 -> 5 bits 0b10111
+        expand=[(level*((1<<field)-1)+levels//2)//levels<<shift for level in range(levels+1)]
+        channels.append((levels,expand))
+    padding=bytes((-w*2)%4)
+    for y in range(h-1,-1,-1):
+        row=bytearray()
+        thresholds=BAYER[y%4]
+        for x in range(w):
+            offset=(y*w+x)*3
+            threshold=(thresholds[x%4]+0.5)/16 if dither else 0.5
+            value=0
+            for (c,(levels,expand)) in enumerate(channels):
+                value|=expand[min(levels,int(data[offset+c]*levels/255+threshold))]
+            row+=struct.pack("<H",value)
+        yield(bytes(row)+padding)
+
+def WriteRGB565BMP(img,Output,bitplanes=BITPLANES,dither=True):
+    # A 16-bit BI_BITFIELDS BMP (R 0xF800, G 0x07E0, B 0x001F), the format
+    # the matrix shows, so the board doesn't convert its pixels. Written a
+    # row at a time as RGB565Rows makes them.
+    (w, h) = img.size
+    stride=((w*16+31)//32)*4
+    offset=14+40+12
+    with open(Output,"wb") as bmp:
+        bmp.write(struct.pack("<2sIHHI",b"BM",offset+stride*h,0,0,offset))
+        bmp.write(struct.pack("<IiiHHIIiiII",40,w,h,1,16,3,stride*h,
+                              3780,3780,0,0))
+        bmp.write(struct.pack("<III",0xF800,0x07E0,0x001F))
+        for row in RGB565Rows(img,bitplanes,dither):
+            bmp.write(row)
+    return(offset+stride*h)
+
+def Quality(Input,img):
+    # PSNR in dB of a converted sprite against its RGBA source, both flattened
+    # onto black at 32x32. Higher is better, identical images give inf.
+    reference=Flatten(CropResize(Input))
+    diff=ImageChops.difference(reference,img.convert("RGB"))
+    mse=sum(rms*rms for rms in ImageStat.Stat(diff).rms)/3
+    if mse==0:
+        return(float("inf"))
+    return(10*math.log10(255*255/mse))
 
 def GetNewFileName(file):
     data=file.split('.')
@@ -23,20 +170,431 @@ def GetNewFileName(file):
     return(returndata)
 
 
-def main2():
+def Settings(colors=None,method="resize",margin=0):
+    # Everything that changes the output for a given source file: method is
+    # "resize" for ResizeImage (BatchConvert, main_palette) or "vector" for
+    # VectorConvert (which crops to a margin instead of WADJ/HADJ)
+    settings={"version":MANIFEST_VERSION,"method":method,"size":SIZE,
+              "colors":colors}
+    if method=="vector":
+        settings["margin"]=margin
+    else:
+        settings["wadj"]=WADJ
+        settings["hadj"]=HADJ
+    if colors==RGB565:
+        settings["bitplanes"]=BITPLANES
+    return(settings)
+
+def HashFile(path):
+    with open(path,"rb") as source:
+        return(hashlib.sha1(source.read()).hexdigest())
+
+def LoadManifest(path):
+    try:
+        with open(path) as manifest:
+            return(json.load(manifest))
+    except (OSError, ValueError):
+        return({})
+
+def SaveManifest(path,settings,done):
+    # done is {source file: hash} for the outputs now in place. Whatever
+    # writes into a BatchConvert output directory records itself here, so
+    # the next BatchConvert reconverts anything made another way.
+    with open(path,"w") as manifest_out:
+        json.dump({"settings":settings,"files":done},manifest_out,indent=1,sort_keys=True)
+
+def ConvertJob(job):
+    # Runs in a worker process, returns (file, error or None)
+    (file,inimg,fullname,colors)=job
+    try:
+        ResizeImage(inimg,fullname,colors)
+        return(file,None)
+    except Exception as error:
+        return(file,f"{type(error).__name__}: {error}")
+
+def BatchConvert(inputdir,outputdir,colors=None,workers=None,manifestfile=None):
+    # Convert every image in inputdir across all cores. A manifest of source
+    # hashes and settings lets unchanged files be skipped on the next run.
+    manifestfile=manifestfile or outputdir+".manifest.json"
+    manifest=LoadManifest(manifestfile)
+    settings=Settings(colors)
+    if manifest.get("settings")!=settings:
+        manifest={"settings":settings,"files":{}}
+    done=manifest["files"]
+    start=time.perf_counter()
+    jobs=[]
+    hashes={}
+    skipped=0
+    for file in sorted(os.listdir(inputdir)):
+        inimg=inputdir+"/"+file
+        if not os.path.isfile(inimg):
+            continue
+        fullname=outputdir+"/"+GetNewFileName(file)
+        hashes[file]=HashFile(inimg)
+        if done.get(file)==hashes[file] and os.path.exists(fullname):
+            skipped+=1
+            continue
+        jobs.append((file,inimg,fullname,colors))
+    failures=[]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for (file,error) in pool.map(ConvertJob,jobs,chunksize=16):
+            if error:
+                failures.append((file,error))
+                done.pop(file,None)
+            else:
+                done[file]=hashes[file]
+    # Forget sources that have been deleted since the last run
+    for file in list(done):
+        if file not in hashes:
+            del done[file]
+    SaveManifest(manifestfile,settings,done)
+    elapsed=time.perf_counter()-start
+    converted=len(jobs)-len(failures)
+    print(f"Converted {converted}, skipped {skipped}, failed {len(failures)} "
+          f"in {elapsed:.2f} s ({converted/elapsed:.1f} files/sec)")
+    for (file,error) in failures:
+        print(f"  Couldn't resize {file}: {error}")
+    return(converted,skipped,failures)
+
+def main2(colors=None):
     inputdir="pokemon/orginal2"
     outputdir="pokemon/edited2"
-    dir_list=os.listdir(inputdir)
-    for file in dir_list:
-        newname=GetNewFileName(file)
-        fullname=outputdir+"/"+newname
+    BatchConvert(inputdir,outputdir,colors)
+    count=build_catalog(outputdir,outputdir+".idx")
+    print(f"Catalog of {count} sprites written to {outputdir}.idx")
+
+def main_palette(colors=16):
+    # Indexed sprites with a per-file and total size/quality report
+    inputdir="pokemon/orginal2"
+    outputdir="pokemon/edited2"
+    before=after=count=0
+    psnr=[]
+    done={}
+    for file in sorted(os.listdir(inputdir)):
         inimg=inputdir+"/"+file
-        #ResizeImage(inimg,fullname)
+        fullname=outputdir+"/"+GetNewFileName(file)
+        if not os.path.isfile(inimg):
+            continue
+        try:
+            img=ResizeImage(inimg,fullname,colors)
+        except Exception as error:
+            print(f"Couldn't resize {file}: {error}")
+            continue
+        done[file]=HashFile(inimg)
+        size=os.path.getsize(fullname)
+        quality=Quality(inimg,img)
+        print(f"{file}: {size} bytes, saved {TRUECOLOR_BYTES-size}, PSNR {quality:.1f} dB")
+        before+=TRUECOLOR_BYTES
+        after+=size
+        count+=1
+        if quality!=float("inf"):
+            psnr.append(quality)
+    print(f"{count} sprites: {before} -> {after} bytes, saved {before-after} ({100*(before-after)/max(before,1):.1f}%)")
+    if psnr:
+        print(f"PSNR mean {sum(psnr)/len(psnr):.1f} dB, worst {min(psnr):.1f} dB")
+    SaveManifest(outputdir+".manifest.json",Settings(colors),done)
+    count=build_catalog(outputdir,outputdir+".idx")
+    print(f"Catalog of {count} sprites written to {outputdir}.idx")
+
+def LoadFrames(Input,frames=None):
+    # Frames of an animation and how long each shows (ms): every frame of a
+    # GIF, or a sprite sheet cut into frames equal-width pieces side by side
+    img=Image.open(Input)
+    if frames is None:
+        result=[]
+        for index in range(getattr(img,"n_frames",1)):
+            img.seek(index)
+            result.append((img.convert("RGBA"),img.info.get("duration",100) or 100))
+        return(result)
+    (w, h) = img.size
+    width=w//frames
+    return([(img.crop((i*width,0,(i+1)*width,h)).convert("RGBA"),100)
+            for i in range(frames)])
+
+def FrameDeltas(frames):
+    # Runs of pixels that change from each frame to the next, and from the
+    # last back to the first so the loop carries on. Each frame's runs are
+    # packed as (offset H, length B, that many pixel values).
+    deltas=[]
+    for i in range(len(frames)):
+        (old,new)=(frames[i],frames[(i+1)%len(frames)])
+        runs=bytearray()
+        x=0
+        while x<len(new):
+            if old[x]==new[x]:
+                x+=1
+                continue
+            start=x
+            while x<len(new) and old[x]!=new[x] and x-start<255:
+                x+=1
+            runs+=struct.pack("<HB",start,x-start)+new[start:x]
+        deltas.append(bytes(runs))
+    return(deltas)
+
+def ConvertAnimation(Input,Output,colors=16,frames=None):
+    # GIF or sprite sheet (frames wide) to an animation for animation.py: a
+    # keyframe plus the pixels that change each frame. Frames are cropped
+    # and resized like a still sprite (unless they're SIZE already) and
+    # share one palette.
+    loaded=LoadFrames(Input,frames)
+    mosaic=Image.new("RGB",(SIZE*len(loaded),SIZE))
+    for (i,(img,_)) in enumerate(loaded):
+        if img.size!=(SIZE,SIZE): # Not cropped yet
+            img=CropResizeImage(img)
+        mosaic.paste(Flatten(img),(i*SIZE,0))
+    mosaic=mosaic.quantize(colors=colors,dither=Image.Dither.NONE)
+    used=mosaic.getextrema()[1]+1
+    pixels=[mosaic.crop((i*SIZE,0,(i+1)*SIZE,SIZE)).tobytes() for i in range(len(loaded))]
+    deltas=FrameDeltas(pixels) if len(pixels)>1 else []
+    delays=[min(delay,0xFFFF) for (_,delay) in loaded]
+    with open(Output,"wb") as animation:
+        animation.write(struct.pack(ANIMATION_HEADER,ANIMATION_MAGIC,SIZE,SIZE,
+                                    len(pixels),used,max(map(len,deltas),default=0),
+                                    delays[0]))
+        animation.write(bytes(mosaic.getpalette()[:used*3]))
+        animation.write(pixels[0])
+        for (i,delta) in enumerate(deltas):
+            # Record i turns frame i into frame i+1 (the last into the first)
+            animation.write(struct.pack(ANIMATION_RECORD,delays[(i+1)%len(delays)],len(delta)))
+            animation.write(delta)
+    size=os.path.getsize(Output)
+    print(f"{Input}: {len(pixels)} frames, {size} bytes "
+          f"(vs {len(pixels)*SIZE*SIZE} as whole frames)")
+    return(size)
+
+def main_animations(inputdir="pokemon/animated",outputdir="animated",colors=16):
+    # Every GIF in inputdir to outputdir/name.anm; code.py plays the one
+    # whose name matches the sprite it picks
+    os.makedirs(outputdir,exist_ok=True)
+    for file in sorted(os.listdir(inputdir)):
+        if file.lower().endswith(".gif"):
+            ConvertAnimation(inputdir+"/"+file,outputdir+"/"+file[:-4]+".anm",colors)
+
+def LoadBatch(paths):
+    # Every image in paths as one (count, height, width, 4) RGBA array, the
+    # smaller ones padded with transparent pixels at the right and bottom.
+    # Returns (array, paths loaded, failures)
+    images=[]
+    loaded=[]
+    failures=[]
+    for path in paths:
         try:
-            ResizeImage(inimg,fullname)
-            print(file)
-        except:
-            print(f"Couldn't resize {file}")
+            images.append(Image.open(path).convert("RGBA"))
+            loaded.append(path)
+        except Exception as error:
+            failures.append((path,f"{type(error).__name__}: {error}"))
+    height=max((img.size[1] for img in images),default=0)
+    width=max((img.size[0] for img in images),default=0)
+    batch=numpy.zeros((len(images),height,width,4),numpy.uint8)
+    for (i,img) in enumerate(images):
+        (w, h) = img.size
+        batch[i,:h,:w]=numpy.asarray(img)
+    return(batch,loaded,failures)
+
+def BoundingBoxes(batch,threshold=0):
+    # (count, 4) array of left, top, right, bottom of the pixels with alpha
+    # over threshold in each image, all at once. Empty images get the
+    # whole image.
+    (count,height,width)=batch.shape[:3]
+    ink=batch[...,3]>threshold
+    rows=ink.any(axis=2)
+    columns=ink.any(axis=1)
+    boxes=numpy.empty((count,4),numpy.int32)
+    boxes[:,0]=columns.argmax(axis=1)
+    boxes[:,1]=rows.argmax(axis=1)
+    boxes[:,2]=width-columns[:,::-1].argmax(axis=1)
+    boxes[:,3]=height-rows[:,::-1].argmax(axis=1)
+    empty=~rows.any(axis=1)
+    boxes[empty]=(0,0,width,height)
+    return(boxes)
+
+def SquareBoxes(boxes,margin=0):
+    # Smallest squares centred on boxes, as (left, top, side) in floats, so
+    # sprites keep their shape and sit in the middle of the tile. margin is
+    # in source pixels, on every side.
+    size=(boxes[:,2:]-boxes[:,:2]).max(axis=1)+2*margin
+    centre=(boxes[:,:2]+boxes[:,2:])/2
+    return(numpy.column_stack((centre-size[:,None]/2,size)))
+
+def BoxWeights(starts,sides,length,size=SIZE):
+    # (count, size, length) matrices taking a row (or column) of length
+    # source pixels to size pixels over [start, start+side): each output
+    # pixel averages the source pixels it covers, by how much of each it
+    # covers. Parts off the image count as transparent.
+    edges=starts[:,None]+numpy.arange(size+1)*(sides[:,None]/size)
+    (low,high)=(edges[:,:-1,None],edges[:,1:,None])
+    pixels=numpy.arange(length)
+    covered=(numpy.minimum(high,pixels+1)-numpy.maximum(low,pixels)).clip(0)
+    return((covered/(high-low)).astype(numpy.float32))
+
+def ResizeBatch(batch,squares,size=SIZE):
+    # Each square of batch down to size x size, all images at once, with a
+    # box filter as two batched matrix products (rows, then columns).
+    # Averaged premultiplied, so transparent pixels don't bleed their
+    # colour. Returns (count, size, size, 4) floats 0-255.
+    (count,height,width)=batch.shape[:3]
+    rows=BoxWeights(squares[:,1],squares[:,2],height,size)
+    columns=BoxWeights(squares[:,0],squares[:,2],width,size)
+    premultiplied=batch.astype(numpy.float32)
+    premultiplied[...,:3]*=premultiplied[...,3:]/255
+    tall=rows@premultiplied.reshape(count,height,width*4)
+    tall=tall.reshape(count,size,width,4).transpose(0,2,1,3).reshape(count,width,size*4)
+    resized=(columns@tall).reshape(count,size,size,4).transpose(0,2,1,3)
+    alpha=resized[...,3:]
+    resized[...,:3]=numpy.divide(resized[...,:3]*255,alpha,out=numpy.zeros_like(resized[...,:3]),
+                                 where=alpha>0)
+    return(resized)
+
+def FlattenBatch(rgba):
+    # Onto black, as Flatten() does: (count, size, size, 3) floats
+    return(rgba[...,:3]*rgba[...,3:]/255)
+
+def QuantizeBatch(rgb,colors=16,rounds=4):
+    # Palette of colors per image and the index of each pixel, for all
+    # images at once: k-means started from black (the background) and
+    # evenly spaced brightness quantiles of the rest. Returns (indices
+    # (count, size, size) uint8, palettes (count, colors, 3) uint8).
+    (count,height,width)=rgb.shape[:3]
+    pixels=rgb.reshape(count,-1,3).astype(numpy.float32)
+    brightness=pixels.sum(axis=2)
+    order=numpy.argsort(brightness,axis=1)
+    black=(brightness<1).sum(axis=1)[:,None]
+    steps=(numpy.arange(colors-1)+0.5)/(colors-1)
+    picks=(black+steps*(pixels.shape[1]-black)).astype(int).clip(0,pixels.shape[1]-1)
+    centres=numpy.concatenate((numpy.zeros((count,1,3),numpy.float32),
+        numpy.take_along_axis(pixels,numpy.take_along_axis(order,picks,axis=1)[...,None],
+                              axis=1)),axis=1)
+    squares=(pixels**2).sum(axis=2)
+    def Nearest(centres):
+        # Squared distances as |p|^2 - 2 p.c + |c|^2, one matmul for all
+        # (|p|^2 is the same for every centre, so it's added after).
+        # Returns each pixel's centre and its distance to it.
+        distance=pixels@(-2*centres.transpose(0,2,1))
+        distance+=(centres**2).sum(axis=2)[:,None,:]
+        nearest=distance.argmin(axis=2)
+        return(nearest,numpy.take_along_axis(distance,nearest[...,None],axis=2)[...,0]+squares)
+    # Which palette entry (of every image) each pixel is in, for bincount
+    offsets=(numpy.arange(count)*colors)[:,None]
+    for _ in range(rounds):
+        (nearest,distance)=Nearest(centres)
+        slots=(nearest+offsets).ravel()
+        members=numpy.bincount(slots,minlength=count*colors).reshape(count,colors)
+        sums=numpy.stack([numpy.bincount(slots,pixels[...,c].ravel(),count*colors)
+                          for c in range(3)],axis=1).reshape(count,colors,3)
+        centres=numpy.where(members[...,None]>0,sums/numpy.maximum(members,1)[...,None],
+                            centres).astype(numpy.float32)
+        # An entry nothing's nearest to (a repeated colour) moves to the
+        # pixel worst served, one per image each round
+        empty=members==0
+        images=numpy.flatnonzero(empty.any(axis=1))
+        centres[images,empty[images].argmax(axis=1)]=pixels[images,distance[images].argmax(axis=1)]
+    return(Nearest(centres)[0].reshape(count,height,width).astype(numpy.uint8),
+           centres.round().clip(0,255).astype(numpy.uint8))
+
+def VectorConvert(inputdir,outputdir,colors=16,margin=0):
+    # The batched version of BatchConvert: every image in inputdir cropped
+    # to the bounding box of its opaque pixels (instead of the fixed
+    # WADJ/HADJ border), centred, resized and quantized together with
+    # NumPy, then written as ResizeImage would. Returns (converted,
+    # failures, seconds per stage).
+    if numpy is None:
+        raise ImportError("VectorConvert needs numpy")
+    times={}
+    start=time.perf_counter()
+    files=[file for file in sorted(os.listdir(inputdir))
+           if os.path.isfile(inputdir+"/"+file)]
+    (batch,loaded,failures)=LoadBatch([inputdir+"/"+file for file in files])
+    times["load"]=time.perf_counter()-start
+    start=time.perf_counter()
+    squares=SquareBoxes(BoundingBoxes(batch),margin)
+    rgba=ResizeBatch(batch,squares)
+    times["crop + resize"]=time.perf_counter()-start
+    start=time.perf_counter()
+    if colors:
+        (indices,palettes)=QuantizeBatch(FlattenBatch(rgba),colors)
+    times["quantize"]=time.perf_counter()-start
+    start=time.perf_counter()
+    os.makedirs(outputdir,exist_ok=True)
+    if colors:
+        # Every file's pixel data in one go, as WriteIndexedBMP lays it out
+        bits=4 if colors<=16 else 8
+        rows=indices[:,::-1] # Bottom to top
+        if bits==4:
+            if rows.shape[2]%2:
+                rows=numpy.pad(rows,((0,0),(0,0),(0,1)))
+            rows=rows[...,0::2]<<4|rows[...,1::2]
+        stride=((SIZE*bits+31)//32)*4
+        rows=numpy.pad(rows,((0,0),(0,0),(0,stride-rows.shape[2])))
+        used=indices.max(axis=(1,2)).astype(int)+1
+    for (i,path) in enumerate(loaded):
+        fullname=outputdir+"/"+GetNewFileName(os.path.basename(path))
+        if colors:
+            WriteBMP(fullname,SIZE,SIZE,bits,palettes[i,:used[i]].tobytes(),rows[i].tobytes())
+        else:
+            Image.fromarray(rgba[i].round().astype(numpy.uint8),"RGBA").save(fullname)
+    times["write"]=time.perf_counter()-start
+    return(len(loaded),failures,times)
+
+def main_vector(colors=16):
+    inputdir="pokemon/orginal2"
+    outputdir="pokemon/edited2"
+    (converted,failures,times)=VectorConvert(inputdir,outputdir,colors)
+    failed={os.path.basename(path) for (path,error) in failures}
+    SaveManifest(outputdir+".manifest.json",Settings(colors,"vector"),
+                 {file:HashFile(inputdir+"/"+file) for file in sorted(os.listdir(inputdir))
+                  if os.path.isfile(inputdir+"/"+file) and file not in failed})
+    total=sum(times.values())
+    print(f"Converted {converted}, failed {len(failures)} in {total:.2f} s "
+          f"({converted/total:.1f} files/sec): "+", ".join(f"{stage} {seconds:.2f} s"
+                                                       for (stage,seconds) in times.items()))
+    for (path,error) in failures:
+        print(f"  Couldn't resize {path}: {error}")
+    count=build_catalog(outputdir,outputdir+".idx")
+    print(f"Catalog of {count} sprites written to {outputdir}.idx")
+
+def PackAtlas(inputdir,output="atlas",per_sheet=64,columns=8,colors=256):
+    # Pack every SIZE x SIZE sprite in inputdir into sheets of per_sheet
+    # tiles (columns wide) with one shared palette, written as output0.bmp,
+    # output1.bmp... plus output.json and output.idx (catalog of the sprite
+    # names, same order as the tiles) for atlas.py on the board. Fewer,
+    # bigger sheets means fewer files; smaller sheets are cheaper to hold
+    # in RAM if a sheet is ever loaded into a Bitmap.
+    files=list_sprites(inputdir)
+    columns=max(1,min(columns,per_sheet))
+    per_sheet=-(-per_sheet//columns)*columns # Whole rows per sheet
+    rows=-(-len(files)//columns)
+    mosaic=Image.new("RGB",(columns*SIZE,rows*SIZE))
+    for (i,file) in enumerate(files):
+        img=Flatten(Image.open(inputdir+"/"+file))
+        if img.size!=(SIZE,SIZE):
+            img=img.resize((SIZE,SIZE))
+        mosaic.paste(img,((i%columns)*SIZE,(i//columns)*SIZE))
+    # Quantizing the whole mosaic at once gives every sheet the same palette
+    mosaic=mosaic.quantize(colors=colors,dither=Image.Dither.NONE)
+    sheets=[]
+    total=0
+    rows_per_sheet=per_sheet//columns
+    for top in range(0,rows,rows_per_sheet):
+        sheet=mosaic.crop((0,top*SIZE,columns*SIZE,
+                           min(rows,top+rows_per_sheet)*SIZE))
+        name=f"{output}{len(sheets)}.bmp"
+        total+=WriteIndexedBMP(sheet,name)
+        sheets.append(name)
+    with open(output+".json","w") as layout:
+        json.dump({"sheets":sheets,"per_sheet":per_sheet,"tile":SIZE,
+                   "count":len(files),"catalog":output+".idx"},layout)
+    build_catalog(inputdir,output+".idx")
+    print(f"Packed {len(files)} sprites into {len(sheets)} sheets, {total} bytes")
+    return(sheets)
+
+def main_atlas(per_sheet=64):
+    # Atlas of the sprites copied to the board, used by code.py if present
+    PackAtlas("edited","atlas",per_sheet)
+
+def main_catalog():
+    # Index for the sprites copied to the board (utils.getrandom)
+    count=build_catalog("edited","edited.idx")
+    print(f"Catalog of {count} sprites written to edited.idx")
 
 def main():
     ResizeImage("pokemon/orginal/1.png","pokemon/edited/1.bmp")
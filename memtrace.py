@@ -0,0 +1,97 @@
+"""
+Memory tracing for the poke clock
+Records gc.mem_free() after each phase of the clock's work (boot, time
+sync, period rollover, moon math, sprite load, label layout, refresh) and
+how much that phase allocated, in a fixed-size ring buffer that's
+preallocated so tracing doesn't add to the fragmentation it's measuring.
+dump() prints it over serial.
+
+Written by Trevor Craig
+
+"""
+import array
+import time
+
+try:
+    from gc import mem_free
+except ImportError:
+    def mem_free():
+        """ Desktop stand-in (simulator.py --trace): tracemalloc's count,
+            negated so allocations still make it go down.
+        """
+        import tracemalloc
+        return -tracemalloc.get_traced_memory()[0]
+
+BOOT, SYNC, ROLLOVER, MOON, SPRITE, LAYOUT, REFRESH = range(7)
+PHASES = ('boot', 'sync', 'rollover', 'moon', 'sprite', 'layout', 'refresh')
+
+class MemTrace():
+    """ Ring buffer of the last size phases. begin(phase) ... end() around
+        each one; size 0 turns tracing off.
+    """
+    def __init__(self, size=64):
+        self.size = size
+        self.count = 0 # Phases recorded since boot
+        self.phase = bytearray(size)
+        self.when = array.array('l', [0] * size)  # time.monotonic() seconds
+        self.free = array.array('l', [0] * size)  # mem_free() at the end
+        self.delta = array.array('l', [0] * size) # Bytes allocated, less any
+                                                  # collected during it
+        self._phase = None
+        self._before = 0
+
+    def begin(self, phase):
+        """ Start a phase (BOOT, SYNC...). """
+        if self.size:
+            self._phase = phase
+            self._before = mem_free()
+
+    def end(self):
+        """ Finish the phase begin() started and record it. """
+        if self._phase is None:
+            return
+        after = mem_free()
+        index = self.count % self.size
+        self.phase[index] = self._phase
+        self.when[index] = int(time.monotonic())
+        self.free[index] = after
+        self.delta[index] = self._before - after
+        self.count += 1
+        self._phase = None
+
+    def task(self, phase, task):
+        """ Scheduler task (tasks.py) that runs task, recording each
+            step of it as phase.
+        """
+        while True:
+            self.begin(phase)
+            try:
+                delay = next(task)
+            except StopIteration:
+                self.end()
+                return
+            self.end()
+            yield delay
+
+    def dump(self):
+        """ Print the buffer oldest first, then each phase's lowest free
+            memory and biggest allocation.
+        """
+        if not self.count:
+            return
+        print('memtrace: phase, seconds, mem_free, allocated')
+        lowest = [None] * len(PHASES)
+        biggest = [None] * len(PHASES)
+        for number in range(max(0, self.count - self.size), self.count):
+            index = number % self.size
+            phase = self.phase[index]
+            print('memtrace:', PHASES[phase], self.when[index],
+                  self.free[index], self.delta[index])
+            if lowest[phase] is None or self.free[index] < lowest[phase]:
+                lowest[phase] = self.free[index]
+            if biggest[phase] is None or self.delta[index] > biggest[phase]:
+                biggest[phase] = self.delta[index]
+        for phase, name in enumerate(PHASES):
+            if lowest[phase] is not None:
+                print('memtrace:', name, 'lowest free', lowest[phase],
+                      'biggest allocation', biggest[phase])
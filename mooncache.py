@@ -0,0 +1,110 @@
+"""
+Lunar data cache for the poke clock
+Keeps a rolling window of days of moon data in a small binary file on the
+board, so a reboot doesn't have to refetch and the moon fields keep going
+through a network outage. One MET Norway query fills many days at once.
+
+Written by Trevor Craig
+
+"""
+import struct
+import time
+from tasks import backoff
+from utils import PokeData, moon_days
+
+# File layout (little-endian): a header saying where and in which UTC
+# offset the data is good for, then one fixed-size record per day, sorted
+# by midnight. Rise/set of 0 means that event doesn't happen that day.
+MAGIC = b'PKM1'
+HEADER = '<4sff6s'      # magic, latitude, longitude, UTC offset '+HH:MM'
+RECORD = '<fIII'        # age, midnight, rise, set
+HEADER_SIZE = struct.calcsize(HEADER)
+RECORD_SIZE = struct.calcsize(RECORD)
+
+class MoonCache():
+    """ Days of PokeData elements (age, midnight, rise, set) keyed by
+        midnight. Saving needs the filesystem writable from code (boot.py
+        storage.remount); if it isn't, the cache still works from RAM for
+        the current session.
+    """
+    def __init__(self, path, latitude, longitude, utc_offset, days=7):
+        self.path = path
+        self.days = days # Most days kept, also the prefetch window
+        self.header = struct.pack(HEADER, MAGIC, float(latitude),
+                                  float(longitude),
+                                  utc_offset.encode('ascii'))
+        self.records = [] # (age, midnight, rise, set) tuples
+        try:
+            with open(path, 'rb') as cache:
+                # Data for another place or UTC offset (e.g. DST changed)
+                # is no use, so start empty if the header doesn't match
+                if cache.read(HEADER_SIZE) == self.header:
+                    data = cache.read()
+                    for offset in range(0, len(data) - RECORD_SIZE + 1,
+                                        RECORD_SIZE):
+                        self.records.append(
+                            struct.unpack_from(RECORD, data, offset))
+        except OSError:
+            pass # No cache yet
+
+    def fill(self, period):
+        """ Set a PokeData's elements from the cache if its date is in
+            there. Returns True if it was.
+        """
+        midnight = period.day_start()
+        for age, start, rise, moonset in self.records:
+            if start == midnight:
+                period.age, period.midnight = age, start
+                period.rise = rise or None
+                period.set = moonset or None
+                return True
+        return False
+
+    def days_ahead(self, midnight):
+        """ Number of cached days starting at or after midnight. """
+        return sum(1 for record in self.records if record[1] >= midnight)
+
+    def store(self, period):
+        """ Add (or replace) one day from a loaded PokeData. """
+        record = (period.age, int(period.midnight), int(period.rise or 0),
+                  int(period.set or 0))
+        self.records = [r for r in self.records if r[1] != record[1]]
+        self.records.append(record)
+        self.records.sort(key=lambda r: r[1])
+
+    def save(self):
+        """ Drop days that are over, keep at most self.days, write the file.
+        """
+        now = time.time()
+        self.records = [r for r in self.records if r[1] + 24 * 3600 > now]
+        self.records = self.records[-self.days:]
+        try:
+            with open(self.path, 'wb') as cache:
+                cache.write(self.header)
+                for record in self.records:
+                    cache.write(struct.pack(RECORD, *record))
+        except OSError as error: # Read-only filesystem, most likely
+            print('Moon cache not saved:', error)
+
+    def fetch(self, NETWORK, period, retries=8, base=4):
+        """ Scheduler task (see tasks.py): one MET Norway query for
+            self.days days starting at period's date, all stored and
+            saved, then period filled from them. Retries with backoff.
+        """
+        url = period.url + '&days=' + str(self.days)
+        print('Fetching moon data via', url)
+        for attempt in range(retries):
+            try:
+                days = moon_days(NETWORK, url) # Just the moon fields
+                break
+            except Exception as error: # pylint: disable=broad-except
+                print('Moon data fetch failed:', error)
+                yield backoff(attempt, base)
+        else:
+            return
+        day = PokeData(period.date, 0, '', 0, 0, None) # Just for store()
+        for elements in days:
+            day.age, day.midnight, day.rise, day.set = elements
+            self.store(day)
+        self.save()
+        self.fill(period)
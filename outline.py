@@ -0,0 +1,149 @@
+"""
+Outlined text for the poke clock
+One label that draws its text with a 1-pixel outline into a single
+bitmap, in place of five stacked Labels (four black ones offset up, down,
+left and right plus the text on top). Glyphs go where
+adafruit_display_text's Label puts them, so positions and bounding_box
+work out the same.
+
+Written by Trevor Craig
+
+"""
+import displayio
+
+try:
+    from bitmaptools import arrayblit
+except ImportError:
+    arrayblit = None
+
+# Pixel values in the bitmap, also palette indices
+CLEAR, OUTLINE, TEXT = range(3)
+
+class OutlineLabel(displayio.Group):
+    """ Text plus outline in one TileGrid. Has the parts of Label the
+        clock uses: text, color, x, y and bounding_box (of the text, not
+        counting the outline).
+    """
+    def __init__(self, font, color=0xFFFFFF, outline_color=0x000000,
+                 text='', x=0, y=0):
+        super().__init__(x=x, y=y)
+        self.font = font
+        self.palette = displayio.Palette(3)
+        self.palette.make_transparent(CLEAR)
+        self.palette[OUTLINE] = outline_color
+        self.palette[TEXT] = color
+        self._bitmap = None
+        self._pixels = None
+        self._ink = {} # Character: (column, row) of each pixel its glyph sets
+        self._text = None
+        self._bounding_box = (0, 0, 0, 0)
+        if hasattr(font, 'ascent'):
+            self._y_offset = font.ascent // 2
+        else: # Same guess as Label, from the tallest and lowest glyphs
+            ascent = 0
+            for character in 'M j\'':
+                glyph = font.get_glyph(ord(character))
+                if glyph:
+                    ascent = max(ascent, glyph.height + glyph.dy)
+            self._y_offset = ascent // 2
+        self.text = text
+
+    @property
+    def bounding_box(self):
+        return self._bounding_box
+
+    @property
+    def color(self):
+        return self.palette[TEXT]
+
+    @color.setter
+    def color(self, color):
+        self.palette[TEXT] = color
+
+    @property
+    def outline_color(self):
+        return self.palette[OUTLINE]
+
+    @outline_color.setter
+    def outline_color(self, color):
+        self.palette[OUTLINE] = color
+
+    def _glyph_ink(self, character, glyph):
+        """ Pixels glyph sets, worked out the first time it's used. """
+        ink = self._ink.get(character)
+        if ink is None:
+            source = glyph.bitmap
+            ink = tuple((column, row) for row in range(glyph.height)
+                        for column in range(glyph.width)
+                        if source[column, row])
+            self._ink[character] = ink
+        return ink
+
+    @property
+    def text(self):
+        return self._text
+
+    @text.setter
+    def text(self, text):
+        if text == self._text:
+            return
+        self._text = text
+        # Layout first, as Label does it: glyph positions and text box
+        glyphs = []
+        x = right = top = bottom = 0
+        ink_left = ink_top = ink_right = ink_bottom = 0 # Pixels actually set
+        for character in text:
+            glyph = self.font.get_glyph(ord(character))
+            if not glyph:
+                continue
+            gx = x + glyph.dx
+            gy = self._y_offset - glyph.height - glyph.dy
+            glyphs.append((self._glyph_ink(character, glyph), gx, gy))
+            right = max(right, x + glyph.shift_x, gx + glyph.width)
+            top = min(top, gy)
+            bottom = max(bottom, self._y_offset - glyph.dy)
+            ink_left = min(ink_left, gx)
+            ink_top = min(ink_top, gy)
+            ink_right = max(ink_right, gx + glyph.width)
+            ink_bottom = max(ink_bottom, gy + glyph.height)
+            x += glyph.shift_x
+        self._bounding_box = (0, top, right, bottom - top)
+        # Bitmap is 1 pixel bigger all round for the outline; only made
+        # again if the text got bigger than it
+        width = ink_right - ink_left + 2
+        height = ink_bottom - ink_top + 2
+        if (self._bitmap is None or width > self._bitmap.width or
+                height > self._bitmap.height):
+            if self._bitmap is not None:
+                width = max(width, self._bitmap.width)
+                height = max(height, self._bitmap.height)
+                self.pop()
+            self._bitmap = displayio.Bitmap(width, height, 3)
+            self._pixels = bytearray(width * height)
+            self.append(displayio.TileGrid(self._bitmap,
+                                           pixel_shader=self.palette))
+        self[0].x = ink_left - 1
+        self[0].y = ink_top - 1
+        # One pass over the glyph pixels, in a bytearray (much quicker to
+        # get at than the Bitmap): each sets its own pixel to TEXT and any
+        # still-clear neighbour to OUTLINE
+        width = self._bitmap.width
+        pixels = self._pixels
+        for index in range(len(pixels)):
+            pixels[index] = CLEAR
+        for ink, gx, gy in glyphs:
+            origin = (gy - ink_top + 1) * width + gx - ink_left + 1
+            for column, row in ink:
+                index = origin + row * width + column
+                pixels[index] = TEXT
+                for near in (index - width, index - 1, index + 1,
+                             index + width):
+                    if not pixels[near]:
+                        pixels[near] = OUTLINE
+        # Then into the Bitmap in one go
+        if arrayblit:
+            arrayblit(self._bitmap, pixels)
+        else:
+            bitmap = self._bitmap
+            for index in range(len(pixels)):
+                bitmap[index] = pixels[index]
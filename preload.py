@@ -0,0 +1,221 @@
+"""
+Sprite loading for the poke clock
+Gets the next sprite ready ahead of time -- its file opened and TileGrid
+made, or the whole thing read into a RAM Bitmap if there's room -- so that
+showing it is just swapping one TileGrid for another. Keeps hold of the
+files it opens and closes each one once its sprite is off the screen.
+
+Written by Trevor Craig
+
+"""
+import os
+import struct
+import displayio
+
+try:
+    from gc import mem_free
+except ImportError:
+    mem_free = None # Desktop, assume there's room
+
+try:
+    from bitmaptools import readinto
+except ImportError:
+    readinto = None
+
+HEADROOM = 16 * 1024 # Free RAM to leave after reading a sprite into RAM
+
+# BMP headers (little-endian): file header, then the BITMAPINFOHEADER
+FILE_HEADER = '<2sIHHI' # magic, file size, reserved x2, pixel data offset
+INFO_HEADER = '<IiiHHIIiiII' # header size, width, height, planes, bits,
+                             # compression, image size, x/y pixels per
+                             # metre, colours used, colours important
+FILE_HEADER_SIZE = struct.calcsize(FILE_HEADER)
+INFO_HEADER_SIZE = struct.calcsize(INFO_HEADER)
+BI_BITFIELDS = 3 # Compression of 16-bit files, with colour masks
+RGB565_MASKS = (0xF800, 0x07E0, 0x001F) # Red, green, blue
+
+def read_bitmap(path):
+    """ Read an uncompressed BMP into RAM. Returns (bitmap, pixel_shader):
+        4- and 8-bit indexed files keep their indices and get a Palette of
+        their colour table, 24- and 32-bit ones are stored as RGB565, and
+        16-bit RGB565 ones (imageresizer.py colors=RGB565) are read as
+        they are. Raises ValueError for any other kind.
+    """
+    with open(path, 'rb') as bmp:
+        magic, _, _, _, offset = struct.unpack(FILE_HEADER,
+                                               bmp.read(FILE_HEADER_SIZE))
+        (size, width, height, _, bits, compression, _, _, _,
+         colors, _) = struct.unpack(INFO_HEADER, bmp.read(INFO_HEADER_SIZE))
+        if (magic != b'BM' or bits not in (4, 8, 16, 24, 32) or
+                compression != (BI_BITFIELDS if bits == 16 else 0)):
+            raise ValueError('Unsupported BMP: ' + path)
+        if bits == 16 and struct.unpack('<III', bmp.read(12)) != RGB565_MASKS:
+            raise ValueError('Not RGB565: ' + path)
+        bottom_up = height > 0 # Rows are stored last row first
+        height = abs(height)
+        if bits <= 8:
+            colors = colors or 1 << bits
+            bmp.seek(FILE_HEADER_SIZE + size)
+            table = bmp.read(colors * 4) # Blue, green, red, unused
+            shader = displayio.Palette(colors)
+            for index in range(colors):
+                shader[index] = (table[index * 4 + 2] << 16 |
+                                 table[index * 4 + 1] << 8 |
+                                 table[index * 4])
+            bitmap = displayio.Bitmap(width, height, colors)
+        else:
+            colorspace = getattr(displayio, 'Colorspace', None)
+            if colorspace is None: # CircuitPython 6
+                raise ValueError('No RGB565 ColorConverter')
+            shader = displayio.ColorConverter(
+                input_colorspace=colorspace.RGB565)
+            bitmap = displayio.Bitmap(width, height, 65536)
+        stride = (width * bits + 31) // 32 * 4
+        bmp.seek(offset)
+        if bits <= 16 and readinto and stride * 8 == width * bits:
+            # Rows without padding, bitmaptools can do it all in one go
+            # (BMP has the first pixel in the high bits of a byte, and
+            # 16-bit pixels little-endian)
+            if bits == 16:
+                readinto(bitmap, bmp, 16, 2, reverse_rows=bottom_up)
+            else:
+                readinto(bitmap, bmp, bits, 1, True, reverse_rows=bottom_up)
+            return bitmap, shader
+        line = bytearray(stride)
+        step = bits // 8
+        for row in range(height):
+            bmp.readinto(line)
+            y = height - 1 - row if bottom_up else row
+            if bits == 4:
+                for x in range(width):
+                    value = line[x >> 1]
+                    bitmap[x, y] = value & 15 if x & 1 else value >> 4
+            elif bits == 8:
+                for x in range(width):
+                    bitmap[x, y] = line[x]
+            elif bits == 16: # Already RGB565
+                for x in range(width):
+                    bitmap[x, y] = line[x * 2] | line[x * 2 + 1] << 8
+            else:
+                for x in range(width):
+                    i = x * step
+                    bitmap[x, y] = ((line[i + 2] & 0xF8) << 8 |
+                                    (line[i + 1] & 0xFC) << 3 |
+                                    line[i] >> 3)
+    return bitmap, shader
+
+class SpriteLoader():
+    """ Double buffer for the sprite at element index of a Renderer
+        (render.py): prepare() gets the next sprite ready, show() swaps it
+        in. With in_ram, sprites are read into RAM Bitmaps when that
+        leaves HEADROOM free, so nothing is read from flash at refresh time
+        and no file is held open; otherwise they're OnDiskBitmaps of a file
+        that stays open while they're shown. If animations names a folder
+        with an animation (animation.py) of the same name as a sprite, that
+        is shown instead. file is the open file of whatever's showing now
+        (the splash screen), if any.
+    """
+    def __init__(self, render, index=0, in_ram=False, file=None,
+                 animations=None):
+        self.render = render
+        self.index = index
+        self.in_ram = in_ram
+        self.animations = animations
+        self.name = None      # Sprite showing
+        self.animation = None # Its Animation, if it's animated
+        self._file = file     # Its file (or Animation), to close after
+        self._next = None     # (name, TileGrid, file, Animation or None)
+                              # from prepare()
+
+    def animated(self, name):
+        """ Path of the animation for sprite file name, or None if it
+            isn't animated.
+        """
+        if not self.animations:
+            return None
+        base = name[name.rfind('/') + 1:]
+        if base.endswith('.bmp'):
+            base = base[:-4]
+        path = self.animations + '/' + base + '.anm'
+        try:
+            os.stat(path)
+        except OSError:
+            return None
+        return path
+
+    def ready(self):
+        """ True if prepare() has a sprite waiting. """
+        return self._next is not None
+
+    def _room(self, name):
+        """ True if name fits in RAM with HEADROOM to spare (its file size
+            is a fair upper bound for the Bitmap).
+        """
+        if mem_free is None:
+            return True
+        return mem_free() > os.stat(name)[6] + HEADROOM
+
+    def prepare(self, name):
+        """ Get sprite file name ready to show. Does nothing if it's the
+            one already waiting.
+        """
+        if self._next is not None:
+            if self._next[0] == name:
+                return
+            self.cancel()
+        grid = None
+        sprite_file = None
+        animation = None
+        path = self.animated(name)
+        if path:
+            from animation import Animation # Only if there are any
+            try:
+                animation = Animation(path)
+                grid, sprite_file = animation.grid, animation
+            except (MemoryError, ValueError):
+                animation = None # Still sprite then
+        if grid is None and self.in_ram and self._room(name):
+            try:
+                bitmap, shader = read_bitmap(name)
+                grid = displayio.TileGrid(bitmap, pixel_shader=shader)
+            except (MemoryError, ValueError):
+                pass # Off flash then
+        if grid is None:
+            # CircuitPython 6 & 7 compatible. Indexed sprites (imageresizer.py
+            # colors=16 or 256) carry their own Palette as the pixel_shader,
+            # so no ColorConverter work is done for those.
+            sprite_file = open(name, 'rb')
+            bitmap = displayio.OnDiskBitmap(sprite_file)
+            grid = displayio.TileGrid(
+                bitmap,
+                pixel_shader=getattr(bitmap, 'pixel_shader',
+                                     displayio.ColorConverter()))
+        self._next = (name, grid, sprite_file, animation)
+
+    def cancel(self):
+        """ Drop the sprite prepare() got ready. """
+        if self._next is not None:
+            if self._next[2] is not None:
+                self._next[2].close()
+            self._next = None
+
+    def close(self):
+        """ Close the showing sprite's file, when something other than this
+            loader has replaced it (e.g. the atlas over the splash screen).
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self.animation = None
+
+    def show(self):
+        """ Swap the prepared sprite in. Its old TileGrid is out of the
+            group after this, so the old file is closed here too.
+        """
+        name, grid, sprite_file, animation = self._next
+        self._next = None
+        self.render.sprite(self.index, grid, name)
+        self.close()
+        self._file = sprite_file
+        self.name = name
+        self.animation = animation
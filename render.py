@@ -0,0 +1,111 @@
+"""
+Dirty-region rendering for the poke clock
+Keeps the last text, position and colour given to each element of the
+display group and only passes real changes on to displayio, so a tick where
+just the minute changed re-lays out one label instead of ten. displayio
+then repaints only the areas those elements covered. Counts the elements
+and pixels each frame touches.
+
+Written by Trevor Craig
+
+"""
+
+TEXT, X, Y, COLOR, KEY = range(5) # Slots in each element's state
+
+class Renderer():
+    """ Front end for a displayio Group of labels and sprites. Call
+        begin() at the start of a frame, set things through text(),
+        move(), color() and sprite(), then end() says whether anything
+        changed (and so whether the display needs refreshing).
+    """
+    def __init__(self, group):
+        self.group = group
+        self._state = [[None] * 5 for _ in range(len(group))]
+        self._dirty = [False] * len(group)
+        self.elements = 0 # Elements changed this frame
+        self.pixels = 0   # Pixels they covered, before and after
+
+    def begin(self):
+        """ Start a frame: clear the counters. """
+        for index in range(len(self._dirty)):
+            self._dirty[index] = False
+        self.elements = 0
+        self.pixels = 0
+
+    def _area(self, index):
+        """ Pixels covered by group element index. """
+        item = self.group[index]
+        box = getattr(item, 'bounding_box', None)
+        if box:
+            return box[2] * box[3]
+        return (getattr(item, 'tile_width', 32) *
+                getattr(item, 'tile_height', 32))
+
+    def _mark(self, index, pixels):
+        if not self._dirty[index]:
+            self._dirty[index] = True
+            self.elements += 1
+        self.pixels += pixels
+
+    def text(self, index, text):
+        """ Set the text of label index if it's different. Returns the
+            label, whose bounding_box is then current either way.
+        """
+        state = self._state[index]
+        label = self.group[index]
+        if state[TEXT] != text:
+            before = self._area(index)
+            label.text = text
+            state[TEXT] = text
+            self._mark(index, before + self._area(index))
+        return label
+
+    def move(self, index, x, y):
+        """ Set the position of element index if it's different. """
+        state = self._state[index]
+        if state[X] != x or state[Y] != y:
+            item = self.group[index]
+            item.x = x
+            item.y = y
+            state[X] = x
+            state[Y] = y
+            self._mark(index, 2 * self._area(index)) # Old spot and new
+
+    def color(self, index, color):
+        """ Set the colour of label index if it's different. """
+        state = self._state[index]
+        if state[COLOR] != color:
+            self.group[index].color = color
+            state[COLOR] = color
+            self._mark(index, self._area(index))
+
+    def showing(self, index, key):
+        """ True if element index already shows key, so there's no need
+            to load it again.
+        """
+        return self._state[index][KEY] == key
+
+    def sprite(self, index, item, key):
+        """ Put TileGrid item at index, showing whatever key names (file
+            name, atlas tile); nothing happens if it already is.
+        """
+        state = self._state[index]
+        if state[KEY] != key or self.group[index] is not item:
+            if self.group[index] is not item:
+                if state[X] is not None: # New item goes where the old one was
+                    item.x = state[X]
+                    item.y = state[Y]
+                self.group[index] = item
+            state[KEY] = key
+            self._mark(index, self._area(index))
+
+    def touch(self, index, pixels):
+        """ Note that pixels of element index's bitmap were drawn into
+            directly (an animation frame), so it's repainted.
+        """
+        if pixels:
+            self._mark(index, pixels)
+
+    def end(self):
+        """ Finish a frame. True if anything changed. """
+        return self.elements > 0
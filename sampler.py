@@ -0,0 +1,172 @@
+"""
+Sprite rotation for the poke clock
+Picks sprites from the catalog as a shuffle bag: every sprite comes up once
+(or weight times) per round, in a fresh random order, and nothing shown in
+the last few picks comes up again. The bag is one array of catalog indices
+shuffled a step at a time as it's drawn from, so a pick is a couple of
+array swaps, and it's saved to a small file so a reboot carries on the
+same round.
+
+Written by Trevor Craig
+
+"""
+import array
+import random
+import struct
+
+# File layout (little-endian): header, then the bag (size indices) and the
+# recent picks ring (window indices), both unsigned 16-bit
+MAGIC = b'PKS1'
+HEADER = '<4sHHHHHI'  # magic, catalog count, bag size, position, window,
+                      # ring position, settings checksum
+HEADER_SIZE = struct.calcsize(HEADER)
+EMPTY = 0xFFFF        # Unused slot in the recent picks ring
+TRIES = 4             # Draws to try before letting a recent sprite repeat
+
+def tokens(name):
+    """ 'edited/charizard-mega-x.bmp' -> ['charizard', 'mega', 'x'] """
+    name = name[name.rfind('/') + 1:]
+    if name.endswith('.bmp'):
+        name = name[:-4]
+    return name.split('-')
+
+def sprite_weight(name, weights, only):
+    """ Copies of sprite name in the bag: 1, times weights[token] for each
+        token of its name in weights (so {'pikachu': 3, 'gmax': 0} triples
+        Pikachu and drops Gigantamax forms). If only has any tokens, the
+        name has to have one of them.
+    """
+    parts = tokens(name)
+    if only:
+        for token in only:
+            if token in parts:
+                break
+        else:
+            return 0
+    weight = 1
+    for token in parts:
+        weight *= weights.get(token, 1)
+    return weight
+
+def _checksum(text):
+    """ Small hash of the settings, to tell if a saved bag is stale. """
+    total = 0
+    for character in text:
+        total = (total * 31 + ord(character)) & 0xFFFFFFFF
+    return total
+
+class Sampler():
+    """ Shuffle bag over the count sprites of a catalog (catalog.py).
+        weights and only are as in sprite_weight(); window is how many of
+        the latest picks can't come up again. path is where the bag is
+        kept across reboots (None to not keep it); saving needs the
+        filesystem writable from code (boot.py storage.remount) and is
+        skipped if it isn't.
+    """
+    def __init__(self, catalog, weights=None, only=(), window=0, path=None,
+                 save_every=15):
+        self.path = path
+        self.save_every = save_every # Picks between saves (flash wear)
+        self._unsaved = 0
+        weights = weights or {}
+        count = len(catalog)
+        if not count:
+            raise ValueError('No sprites in catalog')
+        key = _checksum(repr(sorted(weights.items())) + repr(only) +
+                        str(window))
+        if not self._load(count, key):
+            # New bag: every sprite weight times, in catalog order. The
+            # order doesn't matter, drawing shuffles it.
+            self.bag = array.array('H')
+            sprites = 0
+            for index in range(count):
+                weight = sprite_weight(catalog.name(index), weights, only)
+                for _ in range(weight):
+                    self.bag.append(index)
+                if weight:
+                    sprites += 1
+            if not self.bag: # Filtered everything out, better than nothing
+                self.bag = array.array('H', range(count))
+                sprites = count
+            self.position = 0
+            # Can't hold back more than all but one sprite, and the recent
+            # counts are bytes
+            window = max(0, min(window, sprites - 1, 255))
+            self.ring = array.array('H', [EMPTY] * window)
+            self.ring_position = 0
+        self.count = count
+        self.key = key
+        # Times each sprite is in the ring, for a quick "shown lately?"
+        self._recent = bytearray(count)
+        for index in self.ring:
+            if index != EMPTY:
+                self._recent[index] += 1
+
+    def _load(self, count, key):
+        """ Read a saved bag. False if there isn't one for these sprites
+            and settings.
+        """
+        if not self.path:
+            return False
+        try:
+            with open(self.path, 'rb') as state:
+                (magic, saved_count, size, position, window,
+                 ring_position, saved_key) = struct.unpack(
+                     HEADER, state.read(HEADER_SIZE))
+                if (magic != MAGIC or saved_count != count or
+                        saved_key != key):
+                    return False
+                bag = array.array('H', [0] * size)
+                ring = array.array('H', [0] * window)
+                if (state.readinto(bag) != 2 * size or
+                        state.readinto(ring) != 2 * window):
+                    return False
+        except (OSError, ValueError):
+            return False
+        self.bag, self.position = bag, position
+        self.ring, self.ring_position = ring, ring_position
+        return True
+
+    def save(self):
+        """ Write the bag and recent picks to self.path. """
+        self._unsaved = 0
+        if not self.path:
+            return
+        try:
+            with open(self.path, 'wb') as state:
+                state.write(struct.pack(HEADER, MAGIC, self.count,
+                                        len(self.bag), self.position,
+                                        len(self.ring), self.ring_position,
+                                        self.key))
+                state.write(self.bag)
+                state.write(self.ring)
+        except OSError:
+            pass # Read-only filesystem, keep going from RAM
+
+    def draw(self):
+        """ Catalog index of the next sprite to show. """
+        bag = self.bag
+        if self.position >= len(bag): # Round over, shuffle the same bag again
+            self.position = 0
+        position = self.position
+        # One step of a Fisher-Yates shuffle: swap a random sprite from the
+        # rest of the round into this position. If it was shown lately try
+        # another, a few times at most.
+        for _ in range(TRIES):
+            pick = random.randint(position, len(bag) - 1)
+            if not self._recent[bag[pick]]:
+                break
+        bag[position], bag[pick] = bag[pick], bag[position]
+        index = bag[position]
+        self.position = position + 1
+        if self.ring:
+            old = self.ring[self.ring_position]
+            if old != EMPTY:
+                self._recent[old] -= 1
+            self.ring[self.ring_position] = index
+            self._recent[index] += 1
+            self.ring_position = (self.ring_position + 1) % len(self.ring)
+        self._unsaved += 1
+        if self._unsaved >= self.save_every:
+            self.save()
+        return index
@@ -0,0 +1,385 @@
+# Runs the poke clock's real code.py (or poke.py) on a desktop
+# Fake board, busio, rtc, accelerometer, matrix and network modules stand in
+# for the Matrix Portal, displayio comes from Adafruit Blinka, and frames are
+# drawn into an in-memory 64x32 framebuffer. Time is virtual: every sleep
+# returns at once, so hours of clock run in seconds and the loop can be
+# profiled.
+# python simulator.py [script] [hours] [--trace] [--png frame.png]
+#                     [--latency seconds] [--geolocate]
+# (poke.py also needs its moon/moonNN.bmp frames on disk)
+# Written By Trevor Craig
+
+# Libraries
+import argparse
+import builtins
+import calendar
+import json
+import math
+import os
+import runpy
+import sys
+import threading
+import time
+import tracemalloc
+import types
+from urllib.parse import urlsplit, parse_qs
+import stubserver
+
+WIDTH=64
+HEIGHT=32
+LATITUDE=40.7
+LONGITUDE=-74.0
+UTC_OFFSET="-05:00"
+FIXTURES="fixtures/met"  # Recorded MET Norway responses (ephemerischeck.py --record)
+
+class StopSimulation(Exception):
+    pass
+
+class VirtualClock():
+    # Virtual UTC that only moves when the code sleeps (or does real work,
+    # which is counted too so per-tick timing still adds up). The board's
+    # RTC reads utc+delta; setting RTC().datetime moves delta, like the
+    # real clock after a time sync.
+    def __init__(self,start,stop_after,delta=0):
+        self.utc=float(start)
+        self.delta=delta
+        self.end=start+stop_after
+        self.real=time.perf_counter
+        self.spans=[]      # Real seconds of work between sleeps
+        self.allocs=[]     # Peak bytes allocated in each span (--trace)
+        self.span_start=self.real()
+        self.first_frame=None
+        self.waited=0      # Virtual seconds spent on network requests
+        self.boot_waits=None
+
+    def now(self):
+        return(self.utc+self.delta)
+
+    def sleep(self,seconds):
+        if threading.get_ident()!=self.thread:
+            # Other threads (Blinka's display thread) keep real time
+            self.saved["sleep"](seconds)
+            return
+        self.EndSpan()
+        self.utc+=max(seconds,0)
+        if self.utc>=self.end:
+            raise StopSimulation()
+        self.StartSpan()
+
+    def StartSpan(self):
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+            self.alloc_start=tracemalloc.get_traced_memory()[0]
+        self.span_start=self.real()
+
+    def EndSpan(self):
+        elapsed=self.real()-self.span_start
+        self.spans.append(elapsed)
+        self.utc+=elapsed
+        if tracemalloc.is_tracing():
+            self.allocs.append(tracemalloc.get_traced_memory()[1]-self.alloc_start)
+
+    def Install(self):
+        # Swap the time functions the clock uses for virtual ones
+        self.saved={name:getattr(time,name) for name in
+                    ("time","monotonic","monotonic_ns","sleep","localtime","mktime")}
+        self.thread=threading.get_ident()
+        time.time=self.now
+        time.monotonic=lambda: self.utc
+        time.monotonic_ns=lambda: int(self.utc*1000000000)
+        time.sleep=self.sleep
+        time.localtime=lambda secs=None: time.gmtime(self.now() if secs is None else secs)
+        time.mktime=calendar.timegm # No time zones on the board
+        return(self)
+
+    def Uninstall(self):
+        for (name,func) in self.saved.items():
+            setattr(time,name,func)
+
+class SimDisplay():
+    # Stand-in for the matrix's FramebufferDisplay. Refreshes render the
+    # dirty areas of the shown group through Blinka's displayio into
+    # self.frame, RGB565 values row by row in the current rotation.
+    def __init__(self,clock):
+        import busdisplay # Loads displayio's display core without a cycle
+        from displayio._displaycore import _DisplayCore
+        self._core=_DisplayCore(None,WIDTH,HEIGHT,WIDTH,HEIGHT,0,0,0,16,False,
+                                False,1,False,False,0,0,0,0,False,False,False,False)
+        self.clock=clock
+        self.auto_refresh=True
+        self.frame=[0]*(WIDTH*HEIGHT)
+        self.frames=0
+        self.pixels=0
+
+    @property
+    def width(self):
+        return(self._core.width)
+
+    @property
+    def height(self):
+        return(self._core.height)
+
+    @property
+    def rotation(self):
+        return(self._core.rotation)
+
+    @rotation.setter
+    def rotation(self,value):
+        if (value in (90,270))!=(self._core.rotation in (90,270)):
+            self._core.width,self._core.height=self._core.height,self._core.width
+        self._core.set_rotation(value)
+        self.frame=[0]*(self.width*self.height)
+        if self._core.current_group is not None:
+            self._core.current_group._update_transform(self._core.transform)
+
+    def show(self,group):
+        self._core.set_root_group(group)
+
+    @property
+    def root_group(self):
+        return(self._core.current_group)
+
+    def refresh(self,**kwargs):
+        from displayio._area import Area
+        core=self._core
+        group=core.current_group
+        areas=[]
+        if core.full_refresh:
+            if group is not None:
+                group._prepare_full_refresh()
+            areas.append(core.area)
+        elif group is not None:
+            group._get_refresh_areas(areas)
+        for area in areas:
+            clipped=Area()
+            if not core.clip_area(area,clipped):
+                continue
+            size=clipped.size()
+            buffer=memoryview(bytearray((size+1)//2*4)).cast("I")
+            mask=memoryview(bytearray((size//32+1)*4)).cast("I")
+            core.fill_area(clipped,mask,buffer)
+            pixels=buffer.cast("B").cast("H")
+            width=clipped.width()
+            for y in range(clipped.height()):
+                row=(clipped.y1+y)*self.width+clipped.x1
+                self.frame[row:row+width]=pixels[y*width:(y+1)*width]
+            self.pixels+=size
+        core.finish_refresh()
+        self.frames+=1
+        if self.clock.first_frame is None and self.frames>1:
+            # Frame 1 is the splash screen, frame 2 the first real one
+            self.clock.first_frame=self.clock.real()
+            self.clock.boot_waits=self.clock.waited
+
+    def SavePNG(self,path,scale=8):
+        from PIL import Image
+        image=Image.new("RGB",(self.width,self.height))
+        image.putdata([((p>>11)<<3,((p>>5)&0x3F)<<2,(p&0x1F)<<3) for p in self.frame])
+        image.resize((self.width*scale,self.height*scale),Image.NEAREST).save(path)
+        return(path)
+
+class FixtureResponse():
+    # The part of an adafruit_requests Response httpclient.py uses
+    def __init__(self,body):
+        self.status_code=200
+        self.headers={}
+        self.body=body
+
+    def iter_content(self,chunk_size=1):
+        for start in range(0,len(self.body),chunk_size):
+            yield(self.body[start:start+chunk_size])
+
+    def close(self):
+        pass
+
+class FixtureSession():
+    # Stand-in for the Network's adafruit_requests session, answering
+    # from the same fixtures, so fetches go through httpclient.py
+    def __init__(self,network):
+        self.network=network
+
+    def get(self,url,headers=None,stream=False,**kwargs):
+        self.network.requests+=1
+        return(FixtureResponse(json.dumps(self.network.Respond(url)).encode()))
+
+class FixtureNetwork():
+    # Stand-in for adafruit_matrixportal.network.Network. MET Norway
+    # queries are answered from recorded responses in FIXTURES when one
+    # covers the date, else made up like stubserver.py does; time queries
+    # answer with the virtual UTC. Each request takes latency virtual
+    # seconds, the board's wait on the other end.
+    def __init__(self,clock,utc_offset=UTC_OFFSET,fixtures=FIXTURES,latency=0):
+        self.clock=clock
+        self.latency=latency
+        self.utc_offset=utc_offset
+        self.requests=0
+        self._wifi=types.SimpleNamespace(requests=FixtureSession(self))
+        self.recorded={}
+        if os.path.isdir(fixtures):
+            for name in sorted(os.listdir(fixtures)):
+                with open(os.path.join(fixtures,name)) as fixture:
+                    for entry in json.load(fixture)["response"]["location"]["time"]:
+                        self.recorded[entry["date"]]=entry
+
+    def connect(self):
+        pass
+
+    def Respond(self,url):
+        self.clock.utc+=self.latency
+        self.clock.waited+=self.latency
+        parts=urlsplit(url)
+        if parts.path.startswith("/weatherapi/sunrise/"):
+            query=parse_qs(parts.query)
+            response=stubserver.MetResponse(query)
+            response["location"]["time"]=[self.recorded.get(entry["date"],entry)
+                                           for entry in response["location"]["time"]]
+            return(response)
+        if parts.path.startswith("/api/"):
+            iso=stubserver.IsoTime(self.clock.utc,self.utc_offset)
+            return({"datetime":iso[:19]+".000000"+self.utc_offset,"dst":False,
+                    "utc_offset":self.utc_offset,"unixtime":int(self.clock.utc)})
+        if parts.path=="/json.gp":
+            return({"geoplugin_latitude":str(LATITUDE),"geoplugin_longitude":str(LONGITUDE)})
+        raise RuntimeError(f"No fixture for {url}")
+
+    def fetch_data(self,url,json_path=None,**kwargs):
+        self.requests+=1
+        data=self.Respond(url)
+        if not json_path:
+            return(data)
+        values=[stubserver.Resolve(data,path) for path in json_path]
+        return(values[0] if len(values)==1 else values)
+
+def BoardModules(clock,display,network,rotation=0,geolocate=False):
+    # Fake modules for everything code.py imports that only exists on the
+    # board. The accelerometer reads gravity for the wanted rotation;
+    # with geolocate, secrets has no latitude/longitude (IP geolocation).
+    def module(name,**attributes):
+        mod=types.ModuleType(name)
+        mod.__dict__.update(attributes)
+        return(mod)
+    angle=math.radians(rotation)
+    gravity=types.SimpleNamespace(x=-9.8*math.sin(angle),y=9.8*math.cos(angle),z=0.0)
+    def set_datetime(rtc,value):
+        clock.delta=calendar.timegm(tuple(value)[:6]+(0,0,0))-clock.utc
+    secrets={"ssid":"sim","password":"sim"}
+    if not geolocate:
+        secrets.update(latitude=LATITUDE,longitude=LONGITUDE)
+    rtc_class=type("RTC",(),{"datetime":property(lambda rtc: time.localtime(),set_datetime)})
+    matrix=module("adafruit_matrixportal.matrix",
+                  Matrix=lambda bit_depth=6,**kwargs: types.SimpleNamespace(display=display))
+    network_module=module("adafruit_matrixportal.network",
+                          Network=lambda *args,**kwargs: network)
+    return({
+        "board":module("board",SCL="SCL",SDA="SDA",NEOPIXEL="NEOPIXEL"),
+        "busio":module("busio",I2C=lambda *args,**kwargs: object()),
+        "rtc":module("rtc",RTC=rtc_class),
+        "adafruit_lis3dh":module("adafruit_lis3dh",LIS3DH_I2C=lambda *args,**kwargs:
+                                 types.SimpleNamespace(acceleration=gravity)),
+        "adafruit_matrixportal":module("adafruit_matrixportal",matrix=matrix,network=network_module),
+        "adafruit_matrixportal.matrix":matrix,
+        "adafruit_matrixportal.network":network_module,
+        "secrets":module("secrets",secrets=secrets),
+    })
+
+def BoardOpen(root):
+    # The board's paths start at the CIRCUITPY root ('/fonts/...')
+    real_open=builtins.open
+    def board_open(path,*args,**kwargs):
+        if isinstance(path,str) and path.startswith("/") and not os.path.exists(path):
+            path=os.path.join(root,path[1:])
+        return(real_open(path,*args,**kwargs))
+    return(real_open,board_open)
+
+def Simulate(script="code.py",hours=24,start=None,rotation=0,trace=False,png=None,
+             latency=0,geolocate=False,delta=None):
+    # Run script for hours of virtual time; returns the clock, display and
+    # network for their figures. The RTC starts at 2000-01-01, as at power
+    # on; a start and delta from the clock of an earlier run boot again
+    # with it still set, as after a reset.
+    root=os.path.dirname(os.path.abspath(script))
+    start=start if start is not None else calendar.timegm((2024,3,1,12,0,0))
+    if delta is None:
+        delta=calendar.timegm((2000,1,1,0,0,0))-start
+    clock=VirtualClock(start,hours*3600,delta)
+    display=SimDisplay(clock)
+    network=FixtureNetwork(clock,latency=latency)
+    modules=BoardModules(clock,display,network,rotation,geolocate)
+    saved_modules={name:sys.modules.get(name) for name in modules}
+    (real_open,board_open)=BoardOpen(root)
+    cwd=os.getcwd()
+    if trace:
+        tracemalloc.start()
+    sys.modules.update(modules)
+    builtins.open=board_open
+    clock.Install()
+    boot=clock.real()
+    try:
+        os.chdir(root)
+        clock.StartSpan()
+        runpy.run_path(script,run_name="__main__")
+    except StopSimulation:
+        pass
+    finally:
+        clock.Uninstall()
+        builtins.open=real_open
+        os.chdir(cwd)
+        for (name,mod) in saved_modules.items():
+            if mod is None:
+                sys.modules.pop(name,None)
+            else:
+                sys.modules[name]=mod
+        if trace:
+            tracemalloc.stop()
+    clock.boot=(clock.first_frame or clock.real())-boot
+    if png:
+        display.SavePNG(png)
+    return(clock,display,network)
+
+def Percentile(values,fraction):
+    values=sorted(values)
+    return(values[min(len(values)-1,int(len(values)*fraction))] if values else 0)
+
+def Report(script,hours,clock,display,network):
+    spans=clock.spans[1:] # First span is boot
+    busy=sum(spans)
+    print(f"{script}: {hours} virtual hours, {len(spans)} ticks, "
+          f"{display.frames} frames, {network.requests} network requests")
+    print(f"  boot to first frame          {clock.boot*1000:10.2f} ms")
+    if clock.boot_waits:
+        print(f"    + network waits            {clock.boot_waits*1000:10.2f} ms")
+    if spans:
+        print(f"  tick latency mean/p95/max    {busy/len(spans)*1000:10.3f} "
+              f"{Percentile(spans,0.95)*1000:8.3f} {max(spans)*1000:8.3f} ms")
+    if display.frames and busy:
+        print(f"  frames/sec of CPU time       {display.frames/busy:10.1f}")
+        print(f"  pixels per frame             {display.pixels/display.frames:10.1f}")
+    ReportAllocs(clock)
+
+def ReportAllocs(clock):
+    allocs=clock.allocs[1:]
+    if allocs:
+        print(f"  allocated per tick mean/max  {sum(allocs)/len(allocs):10.0f} "
+              f"{max(allocs):8.0f} bytes")
+
+def Benchmark(script="code.py",hours=24):
+    # Timing run, then a tracemalloc run for allocations (it slows things)
+    Report(script,hours,*Simulate(script,hours))
+    ReportAllocs(Simulate(script,hours,trace=True)[0])
+
+def main():
+    parser=argparse.ArgumentParser(description="Run the poke clock on a desktop")
+    parser.add_argument("script",nargs="?",default="code.py")
+    parser.add_argument("hours",nargs="?",type=float,default=24)
+    parser.add_argument("--rotation",type=int,default=0)
+    parser.add_argument("--trace",action="store_true",help="count allocations with tracemalloc")
+    parser.add_argument("--png",help="save the last frame")
+    parser.add_argument("--latency",type=float,default=0,help="virtual seconds per network request")
+    parser.add_argument("--geolocate",action="store_true",help="no latitude/longitude in secrets")
+    args=parser.parse_args()
+    result=Simulate(args.script,args.hours,rotation=args.rotation,trace=args.trace,png=args.png,
+                    latency=args.latency,geolocate=args.geolocate)
+    Report(args.script,args.hours,*result)
+
+if __name__ == "__main__":
+    main()
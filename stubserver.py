@@ -0,0 +1,275 @@
+# Stub web services for running the poke clock's network code on a desktop
+# Stands in for api.met.no and worldtimeapi.org on localhost, with optional
+# injected failures, so fetches/retries can be tried without the board
+# Written By Trevor Craig
+
+# Libraries
+from http.client import HTTPConnection, HTTPException
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from urllib.request import urlopen
+import calendar
+import json
+import sys
+import threading
+import time
+import types
+import zlib
+
+# Real hosts the clock talks to, all redirected to the stub
+HOSTS=("https://api.met.no","http://worldtimeapi.org","http://www.geoplugin.net")
+
+# Last-Modified of the answers that don't change (moon data, geolocation)
+LAST_MODIFIED="Fri, 01 Mar 2024 00:00:00 GMT"
+
+# Mean synodic month and a reference new moon (2000-01-06 18:14 UTC)
+SYNODIC=29.530588853
+NEW_MOON=947182440
+
+def ParseOffset(offset):
+    # '+HH:MM' or '-HH:MM' -> seconds
+    sign=-1 if offset.startswith("-") else 1
+    hours,minutes=offset.lstrip("+-").split(":")
+    return(sign*(int(hours)*3600+int(minutes)*60))
+
+def IsoTime(epoch,offset):
+    # Local ISO 8601 string for UTC epoch seconds at a '+HH:MM' offset
+    local=time.gmtime(epoch+ParseOffset(offset))
+    return(time.strftime("%Y-%m-%dT%H:%M:%S",local)+offset)
+
+def MoonDay(date,offset):
+    # One 'time' entry of a MET Norway sunrise 2.0 response. Phase is the
+    # mean synodic age; rise/set are made up from it (rise drifts ~50 min
+    # a day, set 12h25m later) and left out when they fall outside the day,
+    # like the real API does.
+    midnight=calendar.timegm(time.strptime(date,"%Y-%m-%d"))-ParseOffset(offset)
+    age=((midnight-NEW_MOON)/86400/SYNODIC)%1.0
+    entry={"date":date,
+           "moonphase":{"time":IsoTime(midnight,offset),
+                        "value":f"{age*100:.3f}"}}
+    rise=midnight+int((6*3600+age*SYNODIC*50*60)%86400)
+    for (name,when) in (("moonrise",rise),("moonset",rise+12*3600+25*60)):
+        if when<midnight+86400:
+            entry[name]={"time":IsoTime(when,offset)}
+    return(entry)
+
+def MetResponse(query):
+    date=query["date"][0]
+    offset=query.get("offset",["+00:00"])[0].replace(" ","+")
+    days=int(query.get("days",["1"])[0])
+    start=calendar.timegm(time.strptime(date,"%Y-%m-%d"))
+    entries=[MoonDay(time.strftime("%Y-%m-%d",time.gmtime(start+d*86400)),offset)
+             for d in range(days)]
+    return({"location":{"latitude":query.get("lat",["0"])[0],
+                        "longitude":query.get("lon",["0"])[0],
+                        "time":entries},
+            "meta":{"licenseurl":"https://api.met.no/license_data.html"}})
+
+def TimeResponse(offset):
+    now=time.time()
+    return({"datetime":IsoTime(now,offset)[:19]+f".{int(now%1*1e6):06d}"+offset,
+            "dst":False,"utc_offset":offset,"unixtime":int(now)})
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version="HTTP/1.1" # Keep-alive, like the real services
+    disable_nagle_algorithm=True # Headers and body go out as two writes
+
+    def log_message(self,*args):
+        pass
+
+    def setup(self):
+        # One per connection (handshake) rather than per request
+        self.server.connections+=1
+        super().setup()
+
+    def do_GET(self):
+        server=self.server
+        server.requests+=1
+        parts=urlsplit(self.path)
+        if server.failures>0:
+            server.failures-=1
+            self.Send(503,{"error":"injected failure"})
+            return
+        if server.delay:
+            time.sleep(server.delay)
+        if parts.path.startswith("/weatherapi/sunrise/"):
+            self.Send(200,MetResponse(parse_qs(parts.query)),validators=True)
+        elif parts.path.startswith("/api/"):
+            self.Send(200,TimeResponse(server.utc_offset))
+        elif parts.path=="/json.gp":
+            self.Send(200,{"geoplugin_latitude":"40.7","geoplugin_longitude":"-74.0"},
+                      validators=True)
+        else:
+            self.Send(404,{"error":"not found"})
+
+    def Send(self,status,body,validators=False):
+        # With validators the answer has an ETag and Last-Modified, and a
+        # request already holding either gets an empty 304 instead
+        data=json.dumps(body).encode()
+        etag=f'"{zlib.crc32(data):08x}"'
+        if validators:
+            match=self.headers.get("If-None-Match")
+            since=self.headers.get("If-Modified-Since")
+            if match==etag or (match is None and since==LAST_MODIFIED):
+                status,data=304,b""
+        self.send_response(status)
+        self.send_header("Content-Type","application/json")
+        self.send_header("Content-Length",str(len(data)))
+        if validators:
+            self.send_header("ETag",etag)
+            self.send_header("Last-Modified",LAST_MODIFIED)
+        self.end_headers()
+        self.wfile.write(data)
+        self.server.sent+=len(data)
+
+class StubServer():
+    # Local server in a background thread. failures=N makes the next N
+    # requests fail with 503, delay adds seconds of latency to each reply.
+    # Counts requests, connections and body bytes sent.
+    def __init__(self,failures=0,delay=0,utc_offset="+00:00"):
+        self.httpd=ThreadingHTTPServer(("127.0.0.1",0),StubHandler)
+        self.httpd.failures=failures
+        self.httpd.delay=delay
+        self.httpd.utc_offset=utc_offset
+        self.httpd.requests=0
+        self.httpd.connections=0
+        self.httpd.sent=0
+        self.url=f"http://127.0.0.1:{self.httpd.server_port}"
+        self.thread=threading.Thread(target=self.httpd.serve_forever,daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return(self)
+
+    def __exit__(self,*args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    @property
+    def requests(self):
+        return(self.httpd.requests)
+
+    @property
+    def connections(self):
+        return(self.httpd.connections)
+
+    @property
+    def sent(self):
+        return(self.httpd.sent)
+
+def Resolve(data,path):
+    for key in path:
+        data=data[key]
+    return(data)
+
+class HostNetwork():
+    # Desktop stand-in for adafruit_matrixportal.network.Network, only the
+    # part the clock uses: fetch_data() with a json_path list, returning one
+    # value for one path or a list for several. Requests to the real
+    # services go to base_url instead.
+    def __init__(self,base_url):
+        self.base_url=base_url
+
+    def fetch_data(self,url,json_path=None):
+        for host in HOSTS:
+            if url.startswith(host):
+                url=self.base_url+url[len(host):]
+        with urlopen(url,timeout=10) as response:
+            data=json.load(response)
+        if not json_path:
+            return(data)
+        values=[Resolve(data,path) for path in json_path]
+        return(values[0] if len(values)==1 else values)
+
+class HostResponse():
+    # The part of an adafruit_requests Response httpclient.py uses
+    def __init__(self,session,key,response):
+        self.session=session
+        self.key=key
+        self.response=response
+        self.status_code=response.status
+        self.headers=dict(response.getheaders())
+
+    def iter_content(self,chunk_size=1):
+        while True:
+            chunk=self.response.read(chunk_size)
+            if not chunk:
+                return
+            yield(chunk)
+
+    def close(self):
+        self.response.read()
+        if self.response.will_close:
+            self.session.Drop(self.key)
+
+class HostSession():
+    # Desktop stand-in for adafruit_requests.Session: one kept-alive
+    # connection per host, held in _open_sockets under the real host's
+    # (host, port, proto) as the board's session does, but connected to
+    # base_url instead
+    def __init__(self,base_url):
+        self.base_url=base_url
+        self._open_sockets={}
+
+    def Drop(self,key):
+        connection=self._open_sockets.pop(key,None)
+        if connection:
+            connection.close()
+
+    def get(self,url,headers=None,stream=False,timeout=10):
+        parts=urlsplit(url)
+        key=(parts.hostname,parts.port or (443 if parts.scheme=="https" else 80),
+             parts.scheme+":")
+        path=parts.path+("?"+parts.query if parts.query else "")
+        stub=urlsplit(self.base_url)
+        for attempt in range(2):
+            if key not in self._open_sockets:
+                self._open_sockets[key]=HTTPConnection(stub.hostname,stub.port,timeout=timeout)
+            try:
+                self._open_sockets[key].request("GET",path,headers=headers or {})
+                return(HostResponse(self,key,self._open_sockets[key].getresponse()))
+            except (OSError,HTTPException):
+                # Server closed the kept socket, one more go on a new one
+                self.Drop(key)
+                if attempt:
+                    raise
+
+def InstallRTC():
+    # utils.update_time() sets the board's RTC; on a desktop just keep it
+    if "rtc" not in sys.modules:
+        rtc=types.ModuleType("rtc")
+        rtc.RTC=type("RTC",(),{"datetime":None})
+        sys.modules["rtc"]=rtc
+
+def demo():
+    # Fetch moon data and time through the scheduler while a fake redraw
+    # keeps ticking, with the first few requests failing, then the moon
+    # data twice more (kept once the URL repeats, so a 304 the last time)
+    InstallRTC()
+    from httpclient import HttpClient
+    from tasks import Scheduler, run_blocking
+    from utils import PokeData, sync_time
+    with StubServer(failures=3,delay=0.2,utc_offset="-05:00") as server:
+        network=HttpClient(HostSession(server.url))
+        scheduler=Scheduler()
+        today=time.localtime()
+        period=PokeData(today,24,"-05:00",40.7,-74.0,None)
+        scheduler.add(period.fetch(network,base=0.25))
+        scheduler.add(sync_time(network,None,
+                                lambda t,o: print("Synced",t[:6],o),base=0.25))
+        redraws=0
+        start=time.monotonic()
+        while len(scheduler):
+            scheduler.run_for(0.05)
+            redraws+=1
+        print(f"{server.requests} requests, {redraws} redraws in "
+              f"{time.monotonic()-start:.2f} s while fetching")
+        print("Moon age",period.age,"rise",period.rise,"set",period.set)
+        for _ in range(2):
+            run_blocking(period.fetch(network,base=0.25))
+        print(f"Client: {network.summary()}")
+        print(f"Server: {server.requests} requests, {server.connections} connections, "
+              f"{server.sent} bytes")
+
+if __name__ == "__main__":
+    demo()
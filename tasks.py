@@ -0,0 +1,147 @@
+"""
+Cooperative task scheduler for the poke clock
+Lets slow network jobs (moon data, time sync) wait and retry in the
+background, and runs the clock's own jobs (redraw on the minute, new
+sprite, moon update, time sync) each on its own cadence. Works the same on
+CircuitPython and desktop Python, no asyncio needed.
+
+Written by Trevor Craig
+
+"""
+import random
+import time
+
+NS = 1000000000 # Nanoseconds a second
+
+def backoff(attempt, base=2, cap=300):
+    """ Seconds to wait before retry number attempt (0 for the first
+        retry): exponential from base up to cap, with 'equal jitter' --
+        half the delay is fixed, the other half random -- so a fleet of
+        clocks that failed together doesn't retry together.
+    """
+    delay = min(cap, base * (2 ** attempt))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+def run_blocking(task):
+    """ Run a generator task to the end right here, sleeping through its
+        waits. For start-up, when there's nothing to show until it's done.
+    """
+    for delay in task:
+        time.sleep(delay or 0)
+
+class Scheduler():
+    """ Runs tasks written as generators. A task does a bit of work then
+        yields the number of seconds until it wants to run again (0 to just
+        let other things run); returning ends it. Tasks are only stepped
+        from run()/run_for(), so nothing here happens behind the main
+        loop's back.
+        Wake times are whole nanoseconds from time.monotonic_ns(): the
+        board's floats only have a 22-bit mantissa, so time.monotonic()
+        loses the tenths of a second short cadences need within weeks of
+        uptime, while an int keeps counting exactly.
+    """
+    def __init__(self):
+        self._tasks = [] # [wake time (time.monotonic_ns()), generator] pairs
+
+    def __len__(self):
+        return len(self._tasks)
+
+    def add(self, task, delay=0):
+        """ Start a generator task, first step after delay seconds. """
+        self._tasks.append([time.monotonic_ns() + int(delay * NS), task])
+        return task
+
+    def next_wake(self):
+        """ time.monotonic_ns() value when the next task is due, or None if
+            there are no tasks.
+        """
+        if not self._tasks:
+            return None
+        return min(entry[0] for entry in self._tasks)
+
+    def run(self):
+        """ Step every task that is due, once. """
+        now = time.monotonic_ns()
+        for entry in list(self._tasks):
+            if entry[0] > now:
+                continue
+            try:
+                delay = next(entry[1]) or 0
+            except StopIteration:
+                self._tasks.remove(entry)
+                continue
+            # From the end of the step
+            entry[0] = time.monotonic_ns() + int(delay * NS)
+
+    def run_for(self, seconds):
+        """ Run tasks as they come due, sleeping in between, for seconds.
+            Use in place of a plain time.sleep() at the end of the main
+            loop.
+        """
+        deadline = time.monotonic_ns() + int(seconds * NS)
+        while True:
+            self.run()
+            now = time.monotonic_ns()
+            if now >= deadline:
+                return
+            wake = self.next_wake()
+            if wake is None or wake > deadline:
+                wake = deadline
+            if wake > now:
+                time.sleep((wake - now) / NS) # Short, so a float's fine
+
+class Jitter():
+    """ Running figures for how far periodic ticks were off, in seconds:
+        positive if late, negative if early.
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """ Start counting again. """
+        self.count = 0
+        self.total = 0.0
+        self.worst = 0.0
+
+    def add(self, late):
+        """ Count one tick that ran late seconds after it was due (less
+            than 0 if it ran early).
+        """
+        self.count += 1
+        self.total += late
+        if abs(late) > abs(self.worst):
+            self.worst = late
+
+    def summary(self):
+        """ One line for the serial console. """
+        if not self.count:
+            return 'no ticks'
+        return '{} ticks, mean {:+.3f} s off, worst {:+.3f} s'.format(
+            self.count, self.total / self.count, self.worst)
+
+def periodic(job, period, align=False, jitter=None):
+    """ Task that calls job() now and then every period seconds. With
+        align, later calls land on wall-clock multiples of period instead
+        (time.time() % period == 0, so on the minute for 60) and the time
+        job() itself takes doesn't build up as drift; the RTC counts whole
+        seconds on the board, so that's as close as it gets. If jitter (a
+        Jitter) is given it collects how far off each call was: with
+        align, from the wall-clock tick it was meant for (so an early wake
+        from RTC drift or a time sync stepping the RTC shows up too),
+        otherwise from when the scheduler was asked to run it.
+    """
+    due = None
+    while True:
+        if jitter and due is not None:
+            if align:
+                late = time.time() % period # Folded to +/- half a period
+                jitter.add(late - period if late > period / 2 else late)
+            else:
+                jitter.add((time.monotonic_ns() - due) / NS)
+        job()
+        if align:
+            delay = period - time.time() % period
+        else:
+            delay = period
+        due = time.monotonic_ns() + int(delay * NS)
+        yield delay
@@ -5,38 +5,96 @@ Hopefully cleans up the main code.py
 Written by Trevor Craig
 
 """
+import math
 import os
 import random
 from config import *
 import time
-from rtc import RTC
+from catalog import SpriteCatalog
+from tasks import backoff
+from httpclient import HttpClient, EACH
+
+# Built by imageresizer.py (see catalog.py); opened lazily on first pick
+CATALOG = SpriteCatalog('edited.idx')
 
 def getrandom():
-    inputdir='edited'
-    dir_list=os.listdir(inputdir)
-    randomfile=random.randint(0, len(dir_list)-1)
+    try:
+        randomfile=random.randint(0, len(CATALOG)-1)
+        randompoke=CATALOG.name(randomfile)
+    except (OSError, ValueError):
+        # No catalog on the board, fall back to listing the directory
+        inputdir='edited'
+        dir_list=os.listdir(inputdir)
+        randomfile=random.randint(0, len(dir_list)-1)
+        randompoke=inputdir+"/"+str(dir_list[randomfile])
     print(randomfile)
-    randompoke=inputdir+"/"+str(dir_list[randomfile])
     print(randompoke)
     #randompoke='edited/'+str(random.randint(0, 251))+'.bmp'
     return(randompoke)
 
+# Lookup tables for the clock's fields, built once at import so formatting
+# a label is one concatenation instead of format() and several temporary
+# strings per tick
+TWO_DIGITS = tuple('{0:0>2}'.format(n) for n in range(60)) # '00' to '59'
+NUMBERS = tuple(str(n) for n in range(32))                 # '0' to '31'
+DATE_FIRST = tuple(str(n) + '/' for n in range(32))        # '0/' to '31/'
+COUNT_HOURS = tuple(str(n) + ':' for n in range(48))       # '0:' to '47:'
+DECIMALS = tuple('.' + str(n) + '%' for n in range(10))    # '.0%' to '.9%'
+
+def clock_hours(twelve_hour):
+    """ Table of 'H:' / 'HH:' strings for hours 0-23. """
+    if twelve_hour: # 0 -> 12 (am), 1-12, 13-23 -> 1-11 (pm)
+        return tuple(str((hour + 11) % 12 + 1) + ':' for hour in range(24))
+    return tuple(TWO_DIGITS[hour] + ':' for hour in range(24))
+
+CLOCK_HOURS = clock_hours(TWELVE_HOUR)
+
 def hh_mm(time_struct):
     """ Given a time.struct_time, return a string as H:MM or HH:MM, either
         12- or 24-hour style depending on global TWELVE_HOUR setting.
         This is ONLY for 'clock time,' NOT for countdown time, which is
-        handled separately in the one spot where it's needed.
+        handled by countdown_text().
     """
-    if TWELVE_HOUR:
-        if time_struct.tm_hour > 12:
-            hour_string = str(time_struct.tm_hour - 12) # 13-23 -> 1-11 (pm)
-        elif time_struct.tm_hour > 0:
-            hour_string = str(time_struct.tm_hour) # 1-12
-        else:
-            hour_string = '12' # 0 -> 12 (am)
-    else:
-        hour_string = '{0:0>2}'.format(time_struct.tm_hour)
-    return hour_string + ':' + '{0:0>2}'.format(time_struct.tm_min)
+    return CLOCK_HOURS[time_struct.tm_hour] + TWO_DIGITS[time_struct.tm_min]
+
+def clock_text(minutes):
+    """ hh_mm() for minutes since midnight. """
+    return CLOCK_HOURS[minutes // 60] + TWO_DIGITS[minutes % 60]
+
+def countdown_text(minutes):
+    """ H:MM for a countdown of minutes. """
+    hours = minutes // 60
+    if hours < len(COUNT_HOURS):
+        return COUNT_HOURS[hours] + TWO_DIGITS[minutes % 60]
+    return str(hours) + ':' + TWO_DIGITS[minutes % 60]
+
+def date_text(key):
+    """ 'A/B' for key = A * 32 + B, so the caller picks the order (month
+        and day or day and month).
+    """
+    return DATE_FIRST[key // 32] + NUMBERS[key % 32]
+
+def percent_text(tenths):
+    """ '12.3%' for tenths of a percent, '100%' for 1000 and up. """
+    if tenths >= 1000:
+        return '100%'
+    return str(tenths // 10) + DECIMALS[tenths % 10]
+
+class Cached():
+    """ One label's text, made by format(value) only when value (an int)
+        differs from last time; otherwise the same string object comes
+        back, so an unchanged field costs no allocation at all.
+    """
+    def __init__(self, format):
+        self.format = format
+        self.value = None
+        self.string = ''
+
+    def text(self, value):
+        if value != self.value:
+            self.value = value
+            self.string = self.format(value)
+        return self.string
 
 def update_time(NETWORK,timezone=None):
     """ Update system date/time from WorldTimeAPI public server;
@@ -57,9 +115,33 @@ def update_time(NETWORK,timezone=None):
                                    json_path=[['datetime'], ['dst'],
                                               ['utc_offset']])
     time_struct = parse_time(time_data[0], time_data[1])
+    from rtc import RTC # Board-only module, imported here so the rest of
+                        # utils can run on a desktop against a stub server
     RTC().datetime = time_struct
     return time_struct, time_data[2]
 
+def locate(NETWORK):
+    """ Latitude and longitude (as text) from IP geolocation. Like
+        update_time(), fetch errors are left to the caller.
+    """
+    return NETWORK.fetch_data('http://www.geoplugin.net/json.gp',
+                              json_path=[['geoplugin_latitude'],
+                                         ['geoplugin_longitude']])
+
+def sync_time(NETWORK, timezone, done, retries=5, base=2):
+    """ Scheduler task (see tasks.py) version of update_time(): retries
+        with exponential backoff instead of blocking, and calls
+        done(time_struct, utc_offset) on success. Gives up quietly after
+        retries failures so the caller can try again later.
+    """
+    for attempt in range(retries):
+        try:
+            done(*update_time(NETWORK, timezone))
+            return
+        except Exception as error: # pylint: disable=broad-except
+            print('Time sync failed:', error)
+            yield backoff(attempt, base)
+
 def parse_time(timestring, is_dst=-1):
     """ Given a string of the format YYYY-MM-DDTHH:MM:SS.SS-HH:MM (and
         optionally a DST flag), convert to and return an equivalent
@@ -79,6 +161,94 @@ def parse_time(timestring, is_dst=-1):
                             int(hour_minute_second[2].split('.')[0]),
                             -1, -1, is_dst))
 
+# MET Norway fields per day, read off the response as it streams in
+# (httpclient.py) rather than parsing its whole 'location' object
+MOON_PATHS = [['location', 'time', EACH, 'moonphase', 'value'],
+              ['location', 'time', EACH, 'moonphase', 'time'],
+              ['location', 'time', EACH, 'moonrise', 'time'],
+              ['location', 'time', EACH, 'moonset', 'time']]
+
+def moon_day(phase, midnight, rise, moonset):
+    """ PokeData elements (age, midnight, rise, set) from a MET Norway
+        day's moon phase value and time, and moonrise and moonset times
+        (None when that event doesn't happen that day).
+    """
+    return (float(phase) / 100, time.mktime(parse_time(midnight)),
+            rise and time.mktime(parse_time(rise)),
+            moonset and time.mktime(parse_time(moonset)))
+
+def moon_days(NETWORK, url):
+    """ moon_day() elements for each day of a MET Norway query, leaving
+        out entries without a moon phase. Through an HttpClient only
+        MOON_PATHS are kept as the response is read; any other network
+        has the 'location' object parsed whole, as it used to be.
+    """
+    days = []
+    if isinstance(NETWORK, HttpClient):
+        for phase, midnight, rise, moonset in zip(
+                *NETWORK.fetch_data(url, json_path=MOON_PATHS)):
+            if phase is not None and midnight is not None:
+                days.append(moon_day(phase, midnight, rise, moonset))
+        return days
+    location_data = NETWORK.fetch_data(url, json_path=[['location']])
+    day = PokeData(time.localtime(), 0, '', 0, 0, None) # Just for load()
+    for index in range(len(location_data['time'])):
+        try:
+            day.load(location_data, index)
+        except KeyError:
+            continue # Trailing entry without a moon phase
+        days.append((day.age, day.midnight, day.rise, day.set))
+    return days
+
+def moon_age(period, now):
+    """ Moon phase 'age' at epoch time now, weighting tomorrow's phase
+        (period[1], a PokeData) vs today's (period[0]) by how far through
+        the day now is:
+        0.0  = new moon
+        0.25 = first quarter
+        0.5  = full moon
+        0.75 = last quarter
+        1.0  = new moon
+    """
+    today, tomorrow = period[0], period[1]
+    ratio = ((now - today.midnight) /
+             (tomorrow.midnight - today.midnight))
+    if today.age < tomorrow.age:
+        return (today.age + (tomorrow.age - today.age) * ratio) % 1.0
+    # Handle age wraparound (1.0 -> 0.0). If tomorrow's age is less than
+    # today's, it indicates a new moon crossover. Add 1 to tomorrow's age
+    # when computing age delta.
+    return (today.age + (tomorrow.age + 1 - today.age) * ratio) % 1.0
+
+def percent_lit(age):
+    """ Percentage of the moon lit at phase age (some trig). """
+    if age <= 0.5: # New -> first quarter -> full
+        return (1 - math.cos(age * 2 * math.pi)) * 50
+    return (1 + math.cos((age - 0.5) * 2 * math.pi)) * 50 # Full -> new
+
+def next_event(period, now, risen):
+    """ Epoch time of the next moon rise or set after now, and whether the
+        moon's up until then: (time, risen). Complicated by the fact that
+        some 24-hour periods might not have one or the other (but usually
+        do) due to the Moon rising ~50 mins later each day. This uses a
+        brute force approach, working backwards through the time periods
+        to locate rise/set events that A) exist in that 24-hour period
+        (are not None), B) are still in the future, and C) are closer than
+        the last guess. What's left at the end is the next rise or set
+        (and the inverse of the event type tells us whether Moon's
+        currently risen or not). risen comes back as it was passed if
+        neither day has an event to come.
+    """
+    event = period[1].midnight + 100000 # Force first match
+    for day in reversed(period):
+        if day.rise and event >= day.rise >= now:
+            event = day.rise
+            risen = False
+        if day.set and event >= day.set >= now:
+            event = day.set
+            risen = True
+    return event, risen
+
 class PokeData():
     """ Class holding lunar data for a given day (00:00:00 to 23:59:59).
         App uses two of these -- one for the current day, and one for the
@@ -97,6 +267,9 @@ class PokeData():
             and a UTC offset (as a string) and a query to the MET Norway
             Sunrise API (also provides lunar data), documented at:
             https://api.met.no/weatherapi/sunrise/2.0/documentation
+            Pass NETWORK=None to skip the query and leave the elements as
+            None; fill them later with fetch() from a Scheduler, using
+            estimate() in the meantime.
         """
         if hours_ahead:
             # Can't change attribute in datetime struct, need to create
@@ -110,37 +283,82 @@ class PokeData():
                 datetime.tm_min,
                 datetime.tm_sec,
                 -1, -1, -1))))
+        self.date = datetime
+        self.age = self.midnight = self.rise = self.set = None
         # strftime() not available here
-        url = ('https://api.met.no/weatherapi/sunrise/2.0/.json?lat=' +
-               str(LATITUDE) + '&lon=' + str(LONGITUDE) +
-               '&date=' + str(datetime.tm_year) + '-' +
-               '{0:0>2}'.format(datetime.tm_mon) + '-' +
-               '{0:0>2}'.format(datetime.tm_mday) +
-               '&offset=' + utc_offset)
-        print('Fetching moon data via', url)
+        self.url = ('https://api.met.no/weatherapi/sunrise/2.0/.json?lat=' +
+                    str(LATITUDE) + '&lon=' + str(LONGITUDE) +
+                    '&date=' + str(datetime.tm_year) + '-' +
+                    '{0:0>2}'.format(datetime.tm_mon) + '-' +
+                    '{0:0>2}'.format(datetime.tm_mday) +
+                    '&offset=' + utc_offset)
+        if NETWORK is None:
+            return
+        print('Fetching moon data via', self.url)
         # pylint: disable=bare-except
-        for _ in range(5): # Retries
+        for attempt in range(5): # Retries
             try:
-                location_data = NETWORK.fetch_data(url,
-                                                   json_path=[['location']])
-                moon_data = location_data['time'][0]
-                #print(moon_data)
-                # Reconstitute JSON data into the elements we need
-                self.age = float(moon_data['moonphase']['value']) / 100
-                self.midnight = time.mktime(parse_time(
-                    moon_data['moonphase']['time']))
-                if 'moonrise' in moon_data:
-                    self.rise = time.mktime(
-                        parse_time(moon_data['moonrise']['time']))
-                else:
-                    self.rise = None
-                if 'moonset' in moon_data:
-                    self.set = time.mktime(
-                        parse_time(moon_data['moonset']['time']))
-                else:
-                    self.set = None
+                (self.age, self.midnight, self.rise,
+                 self.set) = moon_days(NETWORK, self.url)[0]
                 return # Success!
             except:
-                # Moon server error (maybe), try again after 15 seconds.
+                # Moon server error (maybe), try again after a backoff.
                 # (Might be a memory error, that should be handled different)
-                time.sleep(15)
\ No newline at end of file
+                time.sleep(backoff(attempt, 4))
+
+    def load(self, location_data, day=0):
+        """ Set the elements from the 'location' object of a MET Norway
+            response (entry number day of its 'time' list).
+        """
+        moon_data = location_data['time'][day]
+        #print(moon_data)
+        # Reconstitute JSON data into the elements we need
+        self.age = float(moon_data['moonphase']['value']) / 100
+        self.midnight = time.mktime(parse_time(
+            moon_data['moonphase']['time']))
+        if 'moonrise' in moon_data:
+            self.rise = time.mktime(
+                parse_time(moon_data['moonrise']['time']))
+        else:
+            self.rise = None
+        if 'moonset' in moon_data:
+            self.set = time.mktime(
+                parse_time(moon_data['moonset']['time']))
+        else:
+            self.set = None
+
+    def day_start(self):
+        """ Epoch time of midnight at the start of this object's date,
+            known before any data is (what midnight will be once loaded).
+        """
+        return time.mktime(time.struct_time((
+            self.date.tm_year, self.date.tm_mon, self.date.tm_mday,
+            0, 0, 0, -1, -1, -1)))
+
+    def estimate(self, previous):
+        """ Rough stand-in elements from the previous day's data, so the
+            main loop has something to interpolate against while fetch()
+            is still pending: one day further through the ~29.53 day
+            lunar cycle, and rise/set ~50 minutes later than yesterday's.
+        """
+        self.age = (previous.age + 1 / 29.53) % 1.0
+        self.midnight = self.day_start()
+        self.rise = previous.rise and previous.rise + 24 * 3600 + 50 * 60
+        self.set = previous.set and previous.set + 24 * 3600 + 50 * 60
+        return self
+
+    def fetch(self, NETWORK, retries=8, base=4):
+        """ Scheduler task (see tasks.py) doing the MET Norway query
+            without blocking: each failure yields an exponential backoff
+            with jitter instead of sleeping. Elements are updated in place
+            on success, otherwise whatever estimate() put there remains.
+        """
+        print('Fetching moon data via', self.url)
+        for attempt in range(retries):
+            try:
+                (self.age, self.midnight, self.rise,
+                 self.set) = moon_days(NETWORK, self.url)[0]
+                return
+            except Exception as error: # pylint: disable=broad-except
+                print('Moon data fetch failed:', error)
+                yield backoff(attempt, base)